@@ -0,0 +1,150 @@
+"""Adaptive sampling of 2D fields for contour plots.
+
+Most of our figures evaluate a function on a dense uniform grid only to draw a few contours of it, even though
+the contours cover a small part of the plane. :func:`adaptive_sample` instead starts from a coarse grid and
+only subdivides the cells that a contour level passes through, or where interpolating across the cell misses
+the value at its centre by more than a tolerance, down to the resolution of a fine uniform grid. The samples
+come back with a triangulation so that they can be passed straight to ``tricontour`` and ``tricontourf``, e.g.
+
+    mesh = adaptive_sample(func, (1e-4, 1e-1), (0, 0.9), levels=[1.0], atol=0.05, x_scale="log")
+    ax.tricontourf(mesh.x, mesh.y, mesh.triangles, mesh.z, levels=levels)
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy.spatial import Delaunay
+
+__all__ = ["AdaptiveMesh", "adaptive_sample"]
+
+AdaptiveMesh = namedtuple("AdaptiveMesh", ["x", "y", "z", "triangles", "n_evaluations", "n_uniform"])
+AdaptiveMesh.__doc__ = """Samples of an adaptively refined field
+
+x, y, z : coordinates and values of every sample
+triangles : triangulation of the samples, shape (n_triangles, 3), for ``tricontour``/``tricontourf``
+n_evaluations : number of times the function was evaluated
+n_uniform : number of evaluations a uniform grid at the finest resolution would need"""
+
+
+def _to_scaled(lattice, n, lims, scale):
+    """Convert integer lattice coordinates to data coordinates"""
+    lo, hi = (np.log10(lims[0]), np.log10(lims[1])) if scale == "log" else lims
+    values = lo + (hi - lo) * lattice / n
+    return 10**values if scale == "log" else values
+
+
+def _needs_refinement(values, levels, atol):
+    """Whether each cell crosses a level, is partly undefined or is poorly interpolated (``values`` has the four
+    corners of each cell followed by its centre)"""
+    finite = np.isfinite(values)
+    partly_undefined = np.logical_and(finite.any(axis=1), np.logical_not(finite.all(axis=1)))
+    with np.errstate(invalid="ignore"):
+        low = np.where(finite, values, np.inf).min(axis=1)
+        high = np.where(finite, values, -np.inf).max(axis=1)
+        refine = partly_undefined
+        for level in levels:
+            refine |= np.logical_and(low < level, high >= level)
+        if atol is not None:
+            refine |= np.abs(values[:, :4].mean(axis=1) - values[:, 4]) > atol
+    return refine
+
+
+def adaptive_sample(func, x_lims, y_lims, levels=(), atol=None, n_initial=(16, 16), max_depth=4,
+                    x_scale="linear", y_scale="linear", max_batch=None, verbose=False):
+    """Sample a function on an adaptively refined grid, refining where contour levels cross
+
+    Parameters
+    ----------
+    func : `function`
+        Vectorised function of two 1D arrays of coordinates ``func(x, y)`` that returns the value at each point
+        (NaN or inf for undefined values)
+
+    x_lims, y_lims : `tuple`
+        Range of each coordinate
+
+    levels : `list`
+        Contour levels that should be resolved at the finest resolution (e.g. the contour lines that are drawn)
+
+    atol : `float`
+        Also refine any cell where the mean of the corners differs from the value at the centre by more than
+        this, which keeps filled contours accurate without resolving every one of their edges
+
+    n_initial : `tuple`
+        Number of cells along x and y in the initial grid
+
+    max_depth : `int`
+        Number of times a cell can be split in half (in each direction), the finest resolution is
+        ``n_initial * 2**max_depth`` cells along each axis
+
+    x_scale, y_scale : `str`
+        Whether to space samples evenly in "linear" or "log" space along each axis
+
+    max_batch : `int`
+        Maximum number of points to pass to ``func`` at once (default is no limit)
+
+    verbose : `boolean`
+        Whether to print the number of evaluations at each depth and the total saved
+
+    Returns
+    -------
+    mesh : `AdaptiveMesh`
+        Samples, their triangulation and how many evaluations were needed compared to a uniform grid
+    """
+    n_x, n_y = n_initial[0] * 2**max_depth, n_initial[1] * 2**max_depth
+    n_uniform = (n_x + 1) * (n_y + 1)
+
+    # values of every point evaluated so far, keyed by its index on the finest lattice
+    keys, values = np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    def evaluate(i, j):
+        """Look up the values at lattice points (i, j), evaluating any that are new"""
+        nonlocal keys, values
+        point_keys = i.astype(np.int64) * (n_y + 1) + j
+        new = np.setdiff1d(point_keys, keys)
+        if len(new) > 0:
+            new_i, new_j = np.divmod(new, n_y + 1)
+            x, y = _to_scaled(new_i, n_x, x_lims, x_scale), _to_scaled(new_j, n_y, y_lims, y_scale)
+            batch = len(new) if max_batch is None else max_batch
+            new_values = np.concatenate([np.asarray(func(x[k:k + batch], y[k:k + batch]), dtype=float)
+                                         for k in range(0, len(new), batch)])
+            keys = np.concatenate((keys, new))
+            values = np.concatenate((values, new_values))
+            order = np.argsort(keys)
+            keys, values = keys[order], values[order]
+        return values[np.searchsorted(keys, point_keys)]
+
+    # cells are given by the lattice index of their lower left corner and their size in lattice steps
+    size = 2**max_depth
+    cell_i, cell_j = [c.flatten() for c in np.meshgrid(np.arange(0, n_x, size), np.arange(0, n_y, size))]
+    for depth in range(max_depth + 1):
+        corners_i = cell_i[:, np.newaxis] + size * np.array([0, 1, 0, 1])
+        corners_j = cell_j[:, np.newaxis] + size * np.array([0, 0, 1, 1])
+
+        # include the centre of each cell to catch features that don't reach a corner
+        if size > 1:
+            corners_i = np.hstack((corners_i, cell_i[:, np.newaxis] + size // 2))
+            corners_j = np.hstack((corners_j, cell_j[:, np.newaxis] + size // 2))
+        cell_values = evaluate(corners_i.flatten(), corners_j.flatten()).reshape(corners_i.shape)
+
+        if verbose:
+            print("depth {}: {} cells, {} evaluations so far".format(depth, len(cell_i), len(keys)))
+        if size == 1:
+            break
+
+        # split the cells that need it into four
+        refine = _needs_refinement(cell_values, levels, atol)
+        size //= 2
+        cell_i = (cell_i[refine][:, np.newaxis] + size * np.array([0, 1, 0, 1])).flatten()
+        cell_j = (cell_j[refine][:, np.newaxis] + size * np.array([0, 0, 1, 1])).flatten()
+        if len(cell_i) == 0:
+            break
+
+    # triangulate in lattice coordinates so that triangles aren't distorted by log scales
+    points_i, points_j = np.divmod(keys, n_y + 1)
+    triangles = Delaunay(np.transpose([points_i / n_x, points_j / n_y])).simplices
+
+    if verbose:
+        print("{} evaluations instead of {} for a uniform grid ({:1.1f}% saved)".format(
+            len(keys), n_uniform, 100 * (1 - len(keys) / n_uniform)))
+
+    return AdaptiveMesh(x=_to_scaled(points_i, n_x, x_lims, x_scale), y=_to_scaled(points_j, n_y, y_lims, y_scale),
+                        z=values, triangles=triangles, n_evaluations=len(keys), n_uniform=n_uniform)
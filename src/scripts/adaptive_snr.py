@@ -0,0 +1,177 @@
+"""SNR of evolving eccentric binaries with adaptive harmonic truncation and bounded memory.
+
+:func:`legwork.snr.snr_ecc_evolving` evaluates every harmonic up to ``harmonics_required`` for every source at
+every timestep at once, so its memory grows as sources x timesteps x harmonics even though most of the signal is
+usually in a handful of harmonics. :func:`snr_ecc_evolving_adaptive` gives the same result but
+
+    * adds harmonics in blocks and stops for each source once a bound on the SNR^2 in all of the remaining
+      harmonics is below a tolerance
+    * works through sources and timesteps in chunks that fit in a given memory budget
+
+The bound uses the fact that the SNR^2 integrand of harmonic n is the n-independent part of the characteristic
+strain times g(n, e) / F(e) over the characteristic noise power, so the harmonics above N can contribute at most
+
+    int A(f_orb) [1 - sum_{n <= N} g(n, e) / F(e)] / min_{f > (N + 1) f_orb} [f^2 S(f)] df_orb
+
+where F(e) = sum_n g(n, e) is :func:`legwork.utils.peters_f`.
+"""
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import astropy.constants as const
+import g_table
+
+__all__ = ["snr_ecc_evolving_adaptive"]
+
+# squared n-independent prefactor of `legwork.strain.h_c_n` in SI units
+H_C_PREFAC_2 = (2**(5/3) / (3 * np.pi**(4/3))) * const.G.si.value**(5/3) / const.c.si.value**3
+
+# rough number of float64 arrays of size sources x timesteps x harmonics alive at once inside a block
+ARRAYS_PER_ELEMENT = 12
+
+
+def _chunk_sizes(n_sources, n_step, block_size, max_memory):
+    """Number of sources and timesteps per chunk so that a block of harmonics fits in ``max_memory`` bytes"""
+    elements = max(int(max_memory // (8 * ARRAYS_PER_ELEMENT * block_size)), 2)
+    if elements >= n_step:
+        return max(min(elements // n_step, n_sources), 1), n_step
+    return 1, elements
+
+
+def _suffix_min_noise(noise, f_min, f_max, n_grid=2000):
+    """Table of min_{f' >= f} f'^2 S(f'), evaluated at the grid point just below f so that it never
+    overestimates the true minimum"""
+    f_grid = np.logspace(np.log10(f_min), np.log10(f_max), n_grid)
+    h_c_noise_2 = f_grid**2 * noise(f_grid)
+    suffix_min = np.minimum.accumulate(h_c_noise_2[::-1])[::-1]
+
+    def lookup(f):
+        ind = np.clip(np.searchsorted(f_grid, f, side="right") - 1, 0, n_grid - 1)
+        return np.where(f > f_max, np.inf, suffix_min[ind])
+
+    return lookup
+
+
+def snr_ecc_evolving_adaptive(m_1, m_2, f_orb_i, dist, ecc, harmonics_required, t_obs, n_step, t_merge=None,
+                              interpolated_sc=None, n_proc=1, ret_max_snr_harmonic=False,
+                              ret_snr2_by_harmonic=False, rtol=1e-4, block_size=10, max_memory=5e8,
+                              ret_report=False, **kwargs):
+    """Calculate the SNR of eccentric evolving binaries, adding harmonics only until the rest are negligible
+
+    The arguments and outputs match :func:`legwork.snr.snr_ecc_evolving` (harmonics that were skipped have an
+    SNR^2 of zero in ``ret_snr2_by_harmonic``), with the extra arguments below.
+
+    Parameters
+    ----------
+    rtol : `float`
+        Stop adding harmonics to a source once the bound on the SNR^2 of all of the remaining harmonics is below
+        this fraction of the SNR^2 so far
+
+    block_size : `int`
+        Number of harmonics added at a time
+
+    max_memory : `float`
+        Approximate peak memory of a block in bytes, sources and timesteps are split into chunks to stay under it
+
+    ret_report : `bool`
+        Whether to also return an accuracy report
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR for each binary (or SNR^2 in each harmonic if ``ret_snr2_by_harmonic``)
+
+    max_snr_harmonic : `int/array`
+        harmonic with maximum SNR for each binary (only returned if ``ret_max_snr_harmonic=True``)
+
+    report : `dict`
+        Number of harmonics used for each source (``harmonics_used``), the upper bound on the SNR^2 left out
+        of each source (``snr2_bound``, including any harmonics above ``harmonics_required``) and relative to
+        its SNR^2 (``rel_snr2_bound``), the chunk sizes
+        (``sources_per_chunk``, ``timesteps_per_chunk``) and the estimated peak memory in bytes
+        (``peak_memory``). Only returned if ``ret_report=True``.
+    """
+    if n_step < 2:
+        raise ValueError("n_step: at least 2 timesteps are needed to integrate over the evolution")
+    arrayed_args, _ = lw.utils.ensure_array(m_1, m_2, f_orb_i, dist, ecc)
+    m_1, m_2, f_orb_i, dist, ecc = arrayed_args
+    n_sources = len(m_1)
+    m_c = lw.utils.chirp_mass(m_1=m_1, m_2=m_2)
+
+    if interpolated_sc is not None:
+        def noise(f):
+            return interpolated_sc(f.flatten() * u.Hz).to(1 / u.Hz).value.reshape(f.shape)
+    else:
+        def noise(f):
+            return lw.psd.power_spectral_density(f=f.flatten() * u.Hz, t_obs=t_obs,
+                                                 **kwargs).to(1 / u.Hz).value.reshape(f.shape)
+
+    # same evolution as `legwork.snr.snr_ecc_evolving` (only sources x timesteps, so computed up front)
+    if t_merge is None:
+        t_merge = lw.evol.get_t_merge_ecc(m_1=m_1, m_2=m_2, f_orb_i=f_orb_i, ecc_i=ecc)
+    t_before = 0.1 * u.yr
+    t_evol = np.minimum(t_merge - t_before, t_obs).to(u.s)
+    e_evol, f_orb_evol = lw.evol.evol_ecc(ecc_i=ecc, t_evol=t_evol, n_step=n_step, m_1=m_1, m_2=m_2,
+                                          f_orb_i=f_orb_i, n_proc=n_proc, t_before=t_before, t_merge=t_merge)
+    maxes = np.where(np.logical_and(e_evol == 0.0, f_orb_evol == 1e2 * u.Hz), -1 * u.Hz, f_orb_evol).max(axis=1)
+    f_orb_evol = np.where(f_orb_evol == 1e2 * u.Hz, maxes[:, np.newaxis], f_orb_evol).to(u.Hz).value
+
+    # n-independent part of h_c_n^2 / (g(n, e) / n) and the total GW power in all harmonics
+    f_evol = lw.utils.peters_f(e_evol)
+    amplitude = H_C_PREFAC_2 * (m_c.to(u.kg).value**(5/3) / dist.to(u.m).value**2)[:, np.newaxis] \
+        * f_orb_evol**(-1/3)
+    min_noise = _suffix_min_noise(noise, f_orb_evol.min(), (harmonics_required + 1) * f_orb_evol.max())
+
+    sources_per_chunk, timesteps_per_chunk = _chunk_sizes(n_sources, n_step, block_size, max_memory)
+    snr2_n = np.zeros((n_sources, harmonics_required))
+    harmonics_used = np.zeros(n_sources, dtype=int)
+    snr2_bound = np.zeros(n_sources)
+
+    for start in range(0, n_sources, sources_per_chunk):
+        active = np.arange(start, min(start + sources_per_chunk, n_sources))
+        g_sum = np.zeros((len(active), n_step))
+
+        for lower in range(0, harmonics_required, block_size):
+            harms = np.arange(lower + 1, min(lower + block_size, harmonics_required) + 1)
+
+            # integrate each harmonic over the evolution in chunks of timesteps (which overlap by one)
+            for t_start in range(0, n_step - 1, max(timesteps_per_chunk - 1, 1)):
+                t_slice = slice(t_start, min(t_start + timesteps_per_chunk, n_step))
+                e, f_orb = e_evol[active, t_slice, np.newaxis], f_orb_evol[active, t_slice, np.newaxis]
+                g = g_table.peters_g(harms[np.newaxis, np.newaxis, :], e)
+                g_sum[:, t_slice] += g.sum(axis=-1) if t_start == 0 else \
+                    np.concatenate((np.zeros((len(active), 1)), g[:, 1:].sum(axis=-1)), axis=1)
+
+                f_n = harms * f_orb
+                integrand = amplitude[active, t_slice, np.newaxis] / f_evol[active, t_slice, np.newaxis] \
+                    * (g / harms) / (f_n**2 * noise(f_n))
+                snr2_n[active[:, np.newaxis], harms - 1] += np.trapz(y=integrand, x=f_n, axis=1)
+
+            # bound the SNR^2 of every harmonic above this block using the GW power that is left (after the
+            # last block this is what the cap of `harmonics_required` leaves out)
+            n_max = harms[-1]
+            harmonics_used[active] = n_max
+            remaining = np.maximum(1 - g_sum / f_evol[active], 0.0)
+            bound_integrand = amplitude[active] * remaining / min_noise((n_max + 1) * f_orb_evol[active])
+            snr2_bound[active] = np.trapz(y=bound_integrand, x=f_orb_evol[active], axis=1)
+
+            keep = snr2_bound[active] > rtol * snr2_n[active].sum(axis=1)
+            active, g_sum = active[keep], g_sum[keep]
+            if len(active) == 0:
+                break
+
+    if ret_snr2_by_harmonic:
+        result = snr2_n
+    else:
+        result = snr2_n.sum(axis=1)**0.5
+        if ret_max_snr_harmonic:
+            result = (result, np.argmax(snr2_n, axis=1) + 1)
+
+    if ret_report:
+        snr2 = snr2_n.sum(axis=1)
+        report = {"harmonics_used": harmonics_used, "snr2_bound": snr2_bound,
+                  "rel_snr2_bound": np.divide(snr2_bound, snr2, out=np.zeros(n_sources), where=snr2 > 0),
+                  "sources_per_chunk": sources_per_chunk, "timesteps_per_chunk": timesteps_per_chunk,
+                  "peak_memory": 8 * ARRAYS_PER_ELEMENT * block_size * sources_per_chunk * timesteps_per_chunk}
+        return (*result, report) if isinstance(result, tuple) else (result, report)
+    return result
@@ -0,0 +1,432 @@
+"""Benchmarks for the compute kernels behind each figure.
+
+Each kernel is the expensive part of one (or more) of the figure scripts, both the LEGWORK calls that the
+figures were originally written with and the faster replacements in this directory. Kernels are run over a range
+of problem sizes and eccentricity ranges, each case in a freshly forked process so that its peak memory can be
+measured on its own, and the wall time, peak RSS and the increase in RSS while the kernel runs are appended to a
+JSON history in ``paths.data``. Comparing two runs (e.g. before and after changing the LEGWORK version in
+``environment.yml``) flags any case that got slower or whose kernel used more memory by more than a threshold.
+Memory is compared on the increase rather than the peak, since the peak of every process includes the ~140 MB
+of LEGWORK, astropy and numpy that it imports.
+
+    python src/scripts/benchmark.py run --sizes 1000 10000 --label legwork-0.4.3
+    python src/scripts/benchmark.py compare --threshold 0.2
+    python src/scripts/benchmark.py list
+"""
+import argparse
+import json
+import multiprocessing
+import pathlib
+import platform
+import re
+import resource
+import sys
+import time
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import paths
+
+__all__ = ["KERNELS", "history_path", "run_case", "run", "load_history", "compare"]
+
+# where all runs are recorded
+history_path = paths.data / "benchmarks.json"
+
+DEFAULT_SIZES = [1000, 10000]
+DEFAULT_ECC_RANGES = [(0.0, 0.1), (0.1, 0.9)]
+
+# fixed seed so that every run benchmarks the same sources
+SEED = 42
+
+
+def _population(size, ecc_range):
+    """Random but reproducible population of binaries"""
+    rng = np.random.default_rng(SEED)
+    return {"m_1": rng.uniform(0.5, 30, size) * u.Msun,
+            "m_2": rng.uniform(0.5, 30, size) * u.Msun,
+            "f_orb": 10**rng.uniform(-4.5, -2.5, size) * u.Hz,
+            "ecc": rng.uniform(*ecc_range, size),
+            "dist": rng.uniform(1, 30, size) * u.kpc}
+
+
+# each kernel takes a size and an eccentricity range, does any setup and returns a function to time
+
+def _source_snr(size, ecc_range):
+    """Source construction plus get_snr (horizon_distance, detector_snr_ratio)"""
+    p = _population(size, ecc_range)
+
+    def kernel():
+        sources = lw.source.Source(m_1=p["m_1"], m_2=p["m_2"], f_orb=p["f_orb"], ecc=p["ecc"], dist=p["dist"])
+        sources.get_snr()
+    return kernel
+
+
+def _get_t_merge_ecc(size, ecc_range):
+    """lw.evol.get_t_merge_ecc (merger_time)"""
+    p = _population(size, ecc_range)
+    return lambda: lw.evol.get_t_merge_ecc(ecc_i=p["ecc"], f_orb_i=p["f_orb"], m_1=p["m_1"], m_2=p["m_2"])
+
+
+def _t_merge_table(size, ecc_range):
+    """Tabulated merger times that replace lw.evol.get_t_merge_ecc (merger_time)"""
+    from t_merge_table import get_t_merge_ecc, load_table
+    p = _population(size, ecc_range)
+    load_table()
+    return lambda: get_t_merge_ecc(ecc_i=p["ecc"], f_orb_i=p["f_orb"], m_1=p["m_1"], m_2=p["m_2"])
+
+
+def _snr_ecc_evolving(size, ecc_range):
+    """lw.snr.snr_ecc_evolving by harmonic (role_eccentricity), size is the number of sources x timesteps"""
+    n_sources = max(size // 100, 1)
+    p = _population(n_sources, ecc_range)
+    return lambda: lw.snr.snr_ecc_evolving(m_1=p["m_1"], m_2=p["m_2"], f_orb_i=p["f_orb"], dist=p["dist"],
+                                           ecc=p["ecc"], harmonics_required=100, t_obs=4 * u.yr, n_step=100,
+                                           ret_snr2_by_harmonic=True)
+
+
+def _snr_ecc_evolving_adaptive(size, ecc_range):
+    """Adaptive replacement for lw.snr.snr_ecc_evolving (role_eccentricity)"""
+    from adaptive_snr import snr_ecc_evolving_adaptive
+    n_sources = max(size // 100, 1)
+    p = _population(n_sources, ecc_range)
+    return lambda: snr_ecc_evolving_adaptive(m_1=p["m_1"], m_2=p["m_2"], f_orb_i=p["f_orb"], dist=p["dist"],
+                                             ecc=p["ecc"], harmonics_required=100, t_obs=4 * u.yr, n_step=100,
+                                             ret_snr2_by_harmonic=True)
+
+
+def _evol_ecc(size, ecc_range):
+    """lw.evol.evol_ecc up to just before the merger (snr_over_time), size is the number of binaries x steps"""
+    n_binaries = max(size // 1000, 1)
+    p = _population(n_binaries, (max(ecc_range[0], 1e-3), ecc_range[1]))
+    t_merge = lw.evol.get_t_merge_ecc(ecc_i=p["ecc"], f_orb_i=p["f_orb"], m_1=p["m_1"], m_2=p["m_2"])
+    return lambda: lw.evol.evol_ecc(ecc_i=p["ecc"], f_orb_i=p["f_orb"], m_1=p["m_1"], m_2=p["m_2"],
+                                    t_evol=0.99 * t_merge, n_step=1000, avoid_merger=False)
+
+
+def _snr_along_trajectory(size, ecc_range):
+    """Streamed evolution and SNR that replace evol_ecc plus a snapshot Source (snr_over_time)"""
+    from trajectory import snr_along_trajectory
+    n_binaries = max(size // 1000, 1)
+    p = _population(n_binaries, ecc_range)
+
+    def kernel():
+        t_merge = lw.evol.get_t_merge_ecc(ecc_i=p["ecc"], f_orb_i=p["f_orb"], m_1=p["m_1"], m_2=p["m_2"])
+        for _ in snr_along_trajectory(m_1=p["m_1"], m_2=p["m_2"], f_orb_i=p["f_orb"], ecc_i=p["ecc"],
+                                      dist=p["dist"], t_evol=0.99 * t_merge, n_step=1000):
+            pass
+    return kernel
+
+
+def _snr_multi_detector(size, ecc_range):
+    """LISA and TianQin SNRs in one pass (detector_snr_ratio)"""
+    from multi_detector import snr_multi_detector
+    p = _population(size, ecc_range)
+    sources = lw.source.Source(m_1=p["m_1"], m_2=p["m_2"], f_orb=p["f_orb"], ecc=p["ecc"], dist=p["dist"])
+    return lambda: snr_multi_detector(sources, [{"instrument": "LISA"}, {"instrument": "TianQin"}])
+
+
+def _circular_snr_grid(size, ecc_range):
+    """Factorised circular SNR grid (horizon_distance), size is the number of grid points"""
+    from grid_sweep import circular_snr_grid
+    n_side = max(int(size**0.5), 2)
+    m_c = np.logspace(-1, np.log10(50), n_side) * u.Msun
+    f_orb = np.logspace(np.log10(4e-5), np.log10(3e-1), n_side) * u.Hz
+    return lambda: circular_snr_grid(m_c=m_c, f_orb=f_orb)
+
+
+def _plot_sensitivity_curve(size, ecc_range):
+    """lw.visualisation.plot_sensitivity_curve (detector_sc_compare, verification_binaries_on_sc), size is the
+    number of frequencies"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    frequency_range = np.logspace(-5, 0, size) * u.Hz
+
+    def kernel():
+        fig, ax = lw.visualisation.plot_sensitivity_curve(frequency_range=frequency_range, show=False)
+        plt.close(fig)
+    return kernel
+
+
+# kernel name -> (function, whether the eccentricity range matters)
+KERNELS = {
+    "source_snr": (_source_snr, True),
+    "get_t_merge_ecc": (_get_t_merge_ecc, True),
+    "t_merge_table": (_t_merge_table, True),
+    "snr_ecc_evolving": (_snr_ecc_evolving, True),
+    "snr_ecc_evolving_adaptive": (_snr_ecc_evolving_adaptive, True),
+    "evol_ecc": (_evol_ecc, True),
+    "snr_along_trajectory": (_snr_along_trajectory, True),
+    "snr_multi_detector": (_snr_multi_detector, True),
+    "circular_snr_grid": (_circular_snr_grid, False),
+    "plot_sensitivity_curve": (_plot_sensitivity_curve, False),
+}
+
+
+def _max_rss_mb():
+    """Peak resident set size of this process so far in MB (ru_maxrss is in kB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _case_in_child(conn, name, size, ecc_range, repeat):
+    """Set up and time one case, sending the result back through ``conn``"""
+    try:
+        kernel = KERNELS[name][0](size, ecc_range)
+        rss_before = _max_rss_mb()
+        wall_times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            kernel()
+            wall_times.append(time.perf_counter() - start)
+        peak_rss = _max_rss_mb()
+        conn.send({"wall_time": min(wall_times), "wall_times": wall_times, "peak_rss_mb": peak_rss,
+                   "rss_increase_mb": peak_rss - rss_before})
+    except Exception as e:
+        conn.send({"error": "{}: {}".format(type(e).__name__, e)})
+    finally:
+        conn.close()
+
+
+def run_case(name, size, ecc_range=(0.0, 0.9), repeat=3):
+    """Time one kernel for one problem size and eccentricity range in a forked process
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the kernel (a key of ``KERNELS``)
+
+    size : `int`
+        Problem size (number of sources, grid points or frequencies, see each kernel)
+
+    ecc_range : `tuple`
+        Range of eccentricities of the sources
+
+    repeat : `int`
+        Number of times to run the kernel, the fastest is recorded as ``wall_time``
+
+    Returns
+    -------
+    result : `dict`
+        The case along with its wall time(s) in seconds, peak RSS in MB and increase in RSS in MB while the
+        kernel ran (or an ``error`` if it failed)
+    """
+    context = multiprocessing.get_context("fork")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_case_in_child, args=(child_conn, name, size, ecc_range, repeat))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = {"error": "process exited with code {}".format(process.exitcode)}
+    process.join()
+    return {"kernel": name, "size": size, "ecc_range": list(ecc_range), **result}
+
+
+def _versions():
+    """Versions of everything that could change the results"""
+    import astropy
+    import scipy
+    return {"legwork": lw.__version__, "numpy": np.__version__, "scipy": scipy.__version__,
+            "astropy": astropy.__version__, "python": platform.python_version()}
+
+
+def load_history(path=None):
+    """Load every recorded run (oldest first)
+
+    Parameters
+    ----------
+    path : `str`
+        History file (default ``history_path``)
+
+    Returns
+    -------
+    runs : `list of dicts`
+        Recorded runs
+    """
+    path = history_path if path is None else path
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def run(kernels=None, sizes=DEFAULT_SIZES, ecc_ranges=DEFAULT_ECC_RANGES, repeat=3, label=None, path=None,
+        verbose=True):
+    """Benchmark kernels over every size and eccentricity range and append the run to the history
+
+    Parameters
+    ----------
+    kernels : `list`
+        Names of the kernels to run (default all of ``KERNELS``)
+
+    sizes : `list`
+        Problem sizes
+
+    ecc_ranges : `list of tuples`
+        Eccentricity ranges (only the first is used for kernels that don't depend on eccentricity)
+
+    repeat : `int`
+        Number of times to run each case
+
+    label : `str`
+        Label to record with the run (e.g. the LEGWORK version being tested)
+
+    path : `str`
+        History file (default ``history_path``)
+
+    verbose : `boolean`
+        Whether to print each result as it finishes
+
+    Returns
+    -------
+    record : `dict`
+        The run that was recorded
+    """
+    kernels = list(KERNELS) if kernels is None else kernels
+    record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "label": label, "versions": _versions(),
+              "machine": {"node": platform.node(), "processor": platform.processor() or platform.machine(),
+                          "cpus": multiprocessing.cpu_count()},
+              "results": []}
+    for name in kernels:
+        for size in sizes:
+            for ecc_range in (ecc_ranges if KERNELS[name][1] else ecc_ranges[:1]):
+                result = run_case(name, size, ecc_range, repeat=repeat)
+                record["results"].append(result)
+                if verbose:
+                    print(_format_result(result), flush=True)
+
+    history = load_history(path)
+    history.append(record)
+    path = history_path if path is None else path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=1)
+    return record
+
+
+def _case_key(result):
+    return result["kernel"], result["size"], tuple(result["ecc_range"])
+
+
+def _format_case(result):
+    return "{:<26s} size={:<8d} e=[{:.2f}, {:.2f}]".format(result["kernel"], result["size"], *result["ecc_range"])
+
+
+def _format_result(result):
+    if "error" in result:
+        return "{}  FAILED ({})".format(_format_case(result), result["error"])
+    return "{}  {:9.4f} s  {:8.1f} MB peak  {:+8.1f} MB in kernel".format(
+        _format_case(result), result["wall_time"], result["peak_rss_mb"], result["rss_increase_mb"])
+
+
+def _ratio(new, old):
+    """Ratio of two measurements, infinite if the old one was zero"""
+    return new / old if old > 0 else (1.0 if new == old else np.inf)
+
+
+def compare(old, new, threshold=0.2, min_wall_time=0.05, min_rss_increase=1.0, verbose=True):
+    """Compare two runs and flag any case whose wall time or increase in RSS grew by more than ``threshold``
+
+    Parameters
+    ----------
+    old, new : `dict`
+        Runs from the history
+
+    threshold : `float`
+        Fractional increase that counts as a regression
+
+    min_wall_time : `float`
+        Cases that take less than this many seconds in both runs are too noisy to flag for their wall time
+
+    min_rss_increase : `float`
+        Cases whose kernels use less than this many MB in both runs are too noisy to flag for their memory
+
+    verbose : `boolean`
+        Whether to print the comparison
+
+    Returns
+    -------
+    regressions : `list of tuples`
+        (case, metric, old value, new value) for every regression
+    """
+    old_results = {_case_key(r): r for r in old["results"] if "error" not in r}
+    regressions = []
+    if verbose:
+        print("comparing {} ({}) with {} ({})".format(old["timestamp"], old["label"], new["timestamp"], new["label"]))
+        changed = {k: (old["versions"].get(k), v) for k, v in new["versions"].items()
+                   if old["versions"].get(k) != v}
+        for package, (before, after) in changed.items():
+            print("  {}: {} -> {}".format(package, before, after))
+
+    for result in new["results"]:
+        before = old_results.get(_case_key(result))
+        if before is None or "error" in result:
+            continue
+        flags = []
+        for metric, minimum in (("wall_time", min_wall_time), ("rss_increase_mb", min_rss_increase)):
+            if max(result[metric], before[metric]) < minimum:
+                continue
+            if result[metric] > (1 + threshold) * before[metric]:
+                regressions.append((_case_key(result), metric, before[metric], result[metric]))
+                flags.append(metric)
+        if verbose:
+            print("{}  time x{:5.2f}  memory x{:5.2f}{}".format(
+                _format_case(result), _ratio(result["wall_time"], before["wall_time"]),
+                _ratio(result["rss_increase_mb"], before["rss_increase_mb"]),
+                "  REGRESSION ({})".format(", ".join(flags)) if flags else ""))
+    if verbose:
+        print("{} regression(s) beyond {:1.0f}%".format(len(regressions), 100 * threshold))
+    return regressions
+
+
+def _parse_ecc_range(value):
+    """Eccentricity range written as ``lower-upper``, where either bound may use scientific notation (1e-3-0.1)"""
+    bounds = re.split(r"(?<=[0-9.])-", value)
+    try:
+        lower, upper = (float(bound) for bound in bounds)
+    except ValueError:
+        raise argparse.ArgumentTypeError("`{}` is not an eccentricity range like 0-0.1 or 1e-3-0.1".format(value))
+    return lower, upper
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the compute kernels behind each figure")
+    parser.add_argument("--history", default=None, help="history file (default {})".format(history_path))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and record them in the history")
+    run_parser.add_argument("--kernels", nargs="+", choices=list(KERNELS), default=None)
+    run_parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    run_parser.add_argument("--ecc", nargs="+", type=_parse_ecc_range, default=DEFAULT_ECC_RANGES,
+                            help="eccentricity ranges, e.g. 0-0.1 0.1-0.9 1e-3-0.1")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--label", default=None)
+
+    compare_parser = commands.add_parser("compare", help="compare two runs (default the last two)")
+    compare_parser.add_argument("runs", nargs="*", type=int, default=[-2, -1],
+                                help="indices of the runs in the history")
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+    compare_parser.add_argument("--min-wall-time", type=float, default=0.05)
+    compare_parser.add_argument("--min-rss-increase", type=float, default=1.0)
+
+    commands.add_parser("list", help="list the recorded runs")
+
+    args = parser.parse_args()
+    history_file = None if args.history is None else pathlib.Path(args.history)
+    if args.command == "run":
+        run(kernels=args.kernels, sizes=args.sizes, ecc_ranges=args.ecc, repeat=args.repeat, label=args.label,
+            path=history_file)
+    elif args.command == "list":
+        for i, record in enumerate(load_history(history_file)):
+            print("{:3d}  {}  {:<20s} legwork {}  {} cases".format(i, record["timestamp"], str(record["label"]),
+                                                                 record["versions"]["legwork"],
+                                                                 len(record["results"])))
+    else:
+        history = load_history(history_file)
+        if len(history) < 2 or len(args.runs) != 2:
+            sys.exit("need two runs to compare")
+        sys.exit(1 if compare(history[args.runs[0]], history[args.runs[1]], threshold=args.threshold,
+                                 min_wall_time=args.min_wall_time, min_rss_increase=args.min_rss_increase) else 0)
@@ -0,0 +1,282 @@
+"""Content-addressed on-disk cache for expensive intermediate results shared between figure scripts.
+
+Results are stored under ``paths.data / "cache"`` in a directory named by a hash of the function, its inputs
+and the installed LEGWORK version. The function is hashed by the source of its module and of every module in
+``src/scripts`` that it imports (directly or indirectly), so that editing a helper invalidates its results.
+Each array is saved as its own ``.npy`` file so that cached results can be memory-mapped instead of read into
+memory. Set the environment variable ``LEGWORK_CACHE=0`` to turn caching off entirely.
+"""
+import ast
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pathlib
+import shutil
+import sys
+import time
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import paths
+
+__all__ = ["cache_dir", "cached", "cache_key", "evict", "clear"]
+
+# location of the cache, shared by every script
+cache_dir = paths.data / "cache"
+
+# eviction limits, either can be overridden with an environment variable
+MAX_BYTES = int(float(os.environ.get("LEGWORK_CACHE_MAX_BYTES", 2e9)))
+MAX_AGE = float(os.environ.get("LEGWORK_CACHE_MAX_AGE_DAYS", 30)) * 24 * 60 * 60
+
+META_FILE = "meta.json"
+
+
+def _enabled():
+    return os.environ.get("LEGWORK_CACHE", "1") != "0"
+
+
+def _update_hash(h, value):
+    """Recursively feed a value into a hash in a way that is stable between interpreter sessions"""
+    if isinstance(value, u.Quantity):
+        h.update(b"quantity" + str(value.unit).encode())
+        _update_hash(h, value.value)
+    elif isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update("ndarray{}{}".format(value.dtype.str, value.shape).encode())
+        h.update(value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update("{}{}".format(type(value).__name__, len(value)).encode())
+        for item in value:
+            _update_hash(h, item)
+    elif isinstance(value, dict):
+        h.update("dict{}".format(len(value)).encode())
+        for key in sorted(value, key=str):
+            _update_hash(h, str(key))
+            _update_hash(h, value[key])
+    elif callable(value):
+        h.update("callable{}.{}".format(getattr(value, "__module__", ""),
+                                        getattr(value, "__qualname__", repr(value))).encode())
+    elif value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic)):
+        h.update("{}{!r}".format(type(value).__name__, value).encode())
+    else:
+        raise TypeError("Can't hash argument of type `{}` for the cache".format(type(value).__name__))
+
+
+def _local_imports(path):
+    """Modules in ``paths.scripts`` that a script imports (by file), found without importing anything"""
+    try:
+        tree = ast.parse(path.read_text())
+    except (OSError, SyntaxError):
+        return []
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module is not None and node.level == 0:
+            names.add(node.module.split(".")[0])
+    return [paths.scripts / "{}.py".format(name) for name in sorted(names)
+            if (paths.scripts / "{}.py".format(name)).exists()]
+
+
+def _source_files(path):
+    """A script and every script in ``paths.scripts`` that it imports, directly or indirectly"""
+    files, todo = {}, [pathlib.Path(path).resolve()]
+    while todo:
+        path = todo.pop()
+        if path in files:
+            continue
+        files[path] = path.read_text() if path.exists() else ""
+        todo.extend(p.resolve() for p in _local_imports(path))
+    return files
+
+
+def _function_id(func):
+    """Identify a function by name and the source of its module and every module in ``paths.scripts`` that it
+    imports, so editing any helper that the function relies on invalidates it (not just the function itself)"""
+    module = sys.modules.get(func.__module__)
+    path = getattr(module, "__file__", None)
+    if path is None:
+        try:
+            source = inspect.getsource(func)
+        except (OSError, TypeError):
+            source = ""
+        return "{}.{}".format(func.__module__, func.__qualname__), source
+
+    # a script that is run directly (as __main__) shares keys with the same script when it is imported
+    module_name = pathlib.Path(path).stem if func.__module__ == "__main__" else func.__module__
+    name = "{}.{}".format(module_name, func.__qualname__)
+    files = _source_files(path)
+    return name, [(p.name, files[p]) for p in sorted(files)]
+
+
+def cache_key(func, *args, **kwargs):
+    """Compute the cache key for a function call
+
+    Parameters
+    ----------
+    func : `function`
+        Function that is being called
+
+    *args, **kwargs : `various`
+        Arguments to the function. These are bound to the function signature first so that positional and
+        keyword versions of the same call share a key.
+
+    Returns
+    -------
+    key : `str`
+        Hex digest identifying the call
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+    except (TypeError, ValueError):
+        arguments = {"args": args, "kwargs": kwargs}
+
+    h = hashlib.sha256()
+    _update_hash(h, _function_id(func))
+    _update_hash(h, lw.__version__)
+    _update_hash(h, arguments)
+    return h.hexdigest()
+
+
+def _save(path, result):
+    """Save a result (array, Quantity or a tuple/list of them) into a new entry directory"""
+    single = not isinstance(result, (tuple, list))
+    outputs = [result] if single else list(result)
+
+    # write into a temporary directory and then move so that readers never see a partial entry
+    tmp_path = path.with_name(path.name + ".tmp{}".format(os.getpid()))
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    units = []
+    for i, output in enumerate(outputs):
+        if isinstance(output, u.Quantity):
+            units.append(output.unit.to_string())
+            output = output.value
+        else:
+            units.append(None)
+        np.save(tmp_path / "output_{}.npy".format(i), np.asarray(output))
+
+    with open(tmp_path / META_FILE, "w") as f:
+        json.dump({"single": single, "units": units, "created": time.time()}, f)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process got there first, theirs is equally valid
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _load(path, mmap_mode="r"):
+    """Load a cached result, memory-mapping each array"""
+    with open(path / META_FILE) as f:
+        meta = json.load(f)
+
+    outputs = []
+    for i, unit in enumerate(meta["units"]):
+        output = np.load(path / "output_{}.npy".format(i), mmap_mode=mmap_mode)
+        outputs.append(output << u.Unit(unit) if unit is not None else output)
+
+    # mark the entry as recently used for eviction
+    os.utime(path / META_FILE)
+    return outputs[0] if meta["single"] else tuple(outputs)
+
+
+def cached(func=None, name=None, mmap_mode="r"):
+    """Wrap a function so that its results are stored in (and read from) the on-disk cache
+
+    Can be used as a decorator (``@cached``) or called directly on an existing function
+    (``cached(lw.evol.get_t_merge_ecc)(ecc_i=...)``). The function must return an array, a Quantity or a
+    tuple/list of these.
+
+    Parameters
+    ----------
+    func : `function`
+        Function to wrap
+
+    name : `str`
+        Readable prefix for the entry directories, defaults to the name of the function
+
+    mmap_mode : `str`
+        Mode with which to memory-map cached arrays (see :func:`numpy.load`), use None to read into memory
+
+    Returns
+    -------
+    wrapped : `function`
+        Cached version of the function
+    """
+    if func is None:
+        return functools.partial(cached, name=name, mmap_mode=mmap_mode)
+
+    prefix = func.__name__ if name is None else name
+
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        if not _enabled():
+            return func(*args, **kwargs)
+
+        path = cache_dir / "{}-{}".format(prefix, cache_key(func, *args, **kwargs)[:32])
+        if (path / META_FILE).exists():
+            return _load(path, mmap_mode=mmap_mode)
+
+        result = func(*args, **kwargs)
+        _save(path, result)
+        evict()
+
+        # hand back the memory-mapped copy unless the entry was too large to keep
+        return _load(path, mmap_mode=mmap_mode) if (path / META_FILE).exists() else result
+
+    return wrapped
+
+
+def _entries():
+    """List each cache entry with its last access time and size on disk"""
+    if not cache_dir.exists():
+        return []
+    entries = []
+    for path in cache_dir.iterdir():
+        if not (path / META_FILE).exists():
+            continue
+        size = sum(f.stat().st_size for f in path.iterdir())
+        entries.append((os.path.getmtime(path / META_FILE), size, path))
+    return sorted(entries)
+
+
+def evict(max_bytes=None, max_age=None):
+    """Evict entries that are older than ``max_age`` and then the least recently used entries until the
+    cache is smaller than ``max_bytes``
+
+    Parameters
+    ----------
+    max_bytes : `int`
+        Maximum total size of the cache in bytes (default ``MAX_BYTES``)
+
+    max_age : `float`
+        Maximum time in seconds since an entry was last used (default ``MAX_AGE``)
+
+    Returns
+    -------
+    n_evicted : `int`
+        Number of entries that were removed
+    """
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    max_age = MAX_AGE if max_age is None else max_age
+
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    now = time.time()
+    n_evicted = 0
+    for last_used, size, path in entries:
+        if now - last_used > max_age or total > max_bytes:
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            n_evicted += 1
+    return n_evicted
+
+
+def clear():
+    """Remove every entry from the cache"""
+    shutil.rmtree(cache_dir, ignore_errors=True)
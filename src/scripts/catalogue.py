@@ -0,0 +1,324 @@
+"""Merger times and SNRs of population-synthesis catalogues that are too large to hold in memory.
+
+A catalogue is a set of columns in ``paths.data``, either as datasets in an HDF5 file (which needs ``h5py``) or
+as a directory of ``.npy`` files (one per column, which are memory-mapped). The columns are
+
+    m_1, m_2 : primary and secondary mass in Msun
+    f_orb : orbital frequency in Hz
+    dist : distance in kpc
+    ecc : eccentricity (optional, zero if missing)
+
+:func:`process_catalogue` reads the catalogue in chunks of ``chunk_size`` binaries, computes the merger time
+and SNR of each chunk with a :class:`legwork.source.Source`, appends the detectable binaries to a new catalogue
+of ``.npy`` columns and adds every binary to fixed histograms. Only one chunk is in memory at a time so the peak
+memory depends on ``chunk_size`` but not on the size of the catalogue. From the command line, e.g.
+
+    python src/scripts/catalogue.py src/data/catalogues/galaxy.h5 --chunk-size 100000
+
+writes ``src/data/galaxy_detectable/`` and ``src/data/galaxy_summary.npz``. With ``--surrogate`` the SNRs of
+stationary binaries are interpolated from the detector's :class:`surrogate.SNRSurrogate` instead, which is much
+faster for catalogues of millions of binaries.
+"""
+import argparse
+import os
+import shutil
+import time
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import paths
+import profiling
+from g_table import use_table
+from surrogate import load_surrogate
+from t_merge_table import get_merger_time
+from unitless import get_t_merge_ecc
+
+__all__ = ["REQUIRED_COLUMNS", "HISTOGRAMS", "open_catalogue", "write_catalogue", "process_catalogue"]
+
+# columns (in Msun, Hz, kpc) that every catalogue needs, eccentricity defaults to zero
+REQUIRED_COLUMNS = ["m_1", "m_2", "f_orb", "dist"]
+
+# columns written to the detectable catalogue, `index` is the row of each binary in the input catalogue
+OUTPUT_COLUMNS = ["index", "m_1", "m_2", "f_orb", "ecc", "dist", "t_merge", "snr"]
+
+# quantity -> (bin edges, whether they are logarithmic) of the summary histograms, values outside of the edges
+# are counted in the first or last bin so that every binary appears in every histogram
+HISTOGRAMS = {
+    "f_orb": (np.logspace(-7, 0, 141), True),
+    "ecc": (np.linspace(0, 1, 101), False),
+    "dist": (np.logspace(-2, 2, 81), True),
+    "t_merge": (np.logspace(-2, 14, 161), True),
+    "snr": (np.logspace(-3, 5, 161), True),
+}
+
+
+class _Columns():
+    """Columns of a catalogue that are read on demand, use through :func:`open_catalogue`"""
+    def __init__(self, path, key=None):
+        self.path = str(path)
+        self._file = None
+        if os.path.isdir(self.path):
+            self._columns = {os.path.splitext(name)[0]: np.load(os.path.join(self.path, name), mmap_mode="r")
+                             for name in os.listdir(self.path) if name.endswith(".npy")}
+        else:
+            try:
+                import h5py
+            except ImportError:
+                raise ImportError("reading HDF5 catalogues requires `h5py`, either install it or convert the "
+                                  "catalogue to a directory of `.npy` columns")
+            self._file = h5py.File(self.path, "r")
+            group = self._file if key is None else self._file[key]
+            self._columns = {name: dataset for name, dataset in group.items() if hasattr(dataset, "shape")}
+
+        missing = [column for column in REQUIRED_COLUMNS if column not in self._columns]
+        if missing:
+            raise ValueError("catalogue `{}` is missing the column(s): {}".format(self.path, ", ".join(missing)))
+        lengths = {len(self._columns[column]) for column in REQUIRED_COLUMNS + ["ecc"] if column in self._columns}
+        if len(lengths) > 1:
+            raise ValueError("columns of catalogue `{}` have different lengths".format(self.path))
+        self.n_rows = lengths.pop()
+
+    def read(self, start, stop):
+        """Read rows ``start`` to ``stop`` of the required columns (and eccentricity) as float arrays"""
+        chunk = {column: np.asarray(self._columns[column][start:stop], dtype=float) for column in REQUIRED_COLUMNS}
+        chunk["ecc"] = np.asarray(self._columns["ecc"][start:stop], dtype=float) if "ecc" in self._columns \
+            else np.zeros(stop - start)
+        return chunk
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def open_catalogue(path, key=None):
+    """Open a catalogue without reading it into memory
+
+    Parameters
+    ----------
+    path : `str`
+        Path to an HDF5 file or a directory of ``.npy`` columns
+
+    key : `str`
+        Group of the HDF5 file that holds the columns (default is the root)
+
+    Returns
+    -------
+    columns : `_Columns`
+        Context manager with the number of binaries (``n_rows``) and a ``read(start, stop)`` method
+    """
+    return _Columns(path, key=key)
+
+
+def write_catalogue(path, **columns):
+    """Write columns to a catalogue that can be read by :func:`open_catalogue`
+
+    Parameters
+    ----------
+    path : `str`
+        Path of the catalogue, an HDF5 file if it ends in ``.h5`` or ``.hdf5`` and otherwise a directory
+
+    **columns : `arrays`
+        Columns to write (in Msun, Hz and kpc)
+    """
+    path = str(path)
+    if path.endswith((".h5", ".hdf5")):
+        import h5py
+        with h5py.File(path, "w") as f:
+            for name, values in columns.items():
+                f.create_dataset(name, data=values)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(path, name + ".npy"), values)
+
+
+class _ColumnWriter():
+    """Append chunks of columns to raw files on disk and convert them to ``.npy`` columns at the end"""
+    def __init__(self, path, columns):
+        self.path = str(path)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        self.n_rows = 0
+        self._dtypes = {}
+        self._files = {column: open(os.path.join(self.path, column + ".raw"), "wb") for column in columns}
+
+    def append(self, **chunk):
+        for column, values in chunk.items():
+            values = np.ascontiguousarray(values)
+            self._dtypes[column] = values.dtype
+            self._files[column].write(values.tobytes())
+        self.n_rows += len(values)
+
+    def close(self, block_size=1000000):
+        for column, f in self._files.items():
+            f.close()
+            raw_path = os.path.join(self.path, column + ".raw")
+            dtype = self._dtypes.get(column, np.float64)
+            out = np.lib.format.open_memmap(os.path.join(self.path, column + ".npy"), mode="w+", dtype=dtype,
+                                            shape=(self.n_rows,))
+            if self.n_rows > 0:
+                raw = np.memmap(raw_path, dtype=dtype, mode="r", shape=(self.n_rows,))
+                for start in range(0, self.n_rows, block_size):
+                    out[start:start + block_size] = raw[start:start + block_size]
+                del raw
+            out.flush()
+            del out
+            os.remove(raw_path)
+
+
+def _histogram(values, edges, log):
+    """Histogram of ``values`` with anything outside of the edges put in the first or last bin"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        clipped = np.clip(np.nan_to_num(values, nan=edges[0], posinf=edges[-1], neginf=edges[0]),
+                          edges[0], edges[-1])
+        if log:
+            return np.histogram(np.log10(clipped), bins=np.log10(edges))[0]
+    return np.histogram(clipped, bins=edges)[0]
+
+
+def process_catalogue(path, output_name=None, key=None, chunk_size=100000, snr_threshold=7, sc_params={},
+                      gw_lum_tol=0.05, stat_tol=1e-2, n_step=100, surrogate=False, save_all=False, verbose=False):
+    """Compute the merger time and SNR of every binary in a catalogue one chunk at a time
+
+    Parameters
+    ----------
+    path : `str`
+        Path to the catalogue (see :func:`open_catalogue`)
+
+    output_name : `str`
+        Outputs are written to ``paths.data`` as ``<output_name>_detectable/`` (a catalogue of the detectable
+        binaries with ``OUTPUT_COLUMNS``) and ``<output_name>_summary.npz`` (the histograms), default is the
+        name of the catalogue without its extension
+
+    key : `str`
+        Group of an HDF5 catalogue that holds the columns
+
+    chunk_size : `int`
+        Number of binaries in memory at once
+
+    snr_threshold : `float`
+        Binaries with at least this SNR are detectable
+
+    sc_params : `dict`
+        Sensitivity curve parameters passed to :class:`legwork.source.Source`
+
+    gw_lum_tol, stat_tol : `float`
+        Tolerances for the number of harmonics and stationarity of each binary (see
+        :class:`legwork.source.Source`)
+
+    n_step : `int`
+        Number of timesteps used for the SNR of evolving binaries
+
+    surrogate : `boolean`
+        Whether to interpolate the SNR of stationary binaries from the surrogate of the detector (see
+        :func:`surrogate.load_surrogate`, which builds it the first time), the rest are computed exactly
+
+    save_all : `boolean`
+        Whether to also write the merger time and SNR of every binary to ``<output_name>_results/`` (in the
+        order of the input catalogue)
+
+    verbose : `boolean`
+        Whether to print the progress after each chunk
+
+    Returns
+    -------
+    summary : `dict`
+        Number of binaries and detectable binaries along with the counts of all (``<quantity>_all``) and
+        detectable (``<quantity>_detectable``) binaries in each histogram of ``HISTOGRAMS``
+    """
+    if output_name is None:
+        output_name = os.path.splitext(os.path.basename(os.path.normpath(str(path))))[0]
+    summary = {"n_sources": 0, "n_detectable": 0, "snr_threshold": snr_threshold}
+    for quantity, (edges, _) in HISTOGRAMS.items():
+        summary[quantity + "_edges"] = edges
+        summary[quantity + "_all"] = np.zeros(len(edges) - 1, dtype=np.int64)
+        summary[quantity + "_detectable"] = np.zeros(len(edges) - 1, dtype=np.int64)
+
+    model = load_surrogate(sc_params, gw_lum_tol=gw_lum_tol, stat_tol=stat_tol) if surrogate else None
+
+    start_time = time.perf_counter()
+    with open_catalogue(path, key=key) as catalogue:
+        writer = _ColumnWriter(paths.data / "{}_detectable".format(output_name), OUTPUT_COLUMNS)
+        if save_all:
+            results_dir = paths.data / "{}_results".format(output_name)
+            results_dir.mkdir(parents=True, exist_ok=True)
+            all_results = {column: np.lib.format.open_memmap(results_dir / "{}.npy".format(column), mode="w+",
+                                                             dtype=float, shape=(catalogue.n_rows,))
+                           for column in ["t_merge", "snr"]}
+
+        for start in range(0, catalogue.n_rows, chunk_size):
+            stop = min(start + chunk_size, catalogue.n_rows)
+            with profiling.span("catalogue chunk", n_sources=stop - start):
+                chunk = catalogue.read(start, stop)
+                if model is not None:
+                    chunk["t_merge"] = get_t_merge_ecc(chunk["m_1"], chunk["m_2"], chunk["f_orb"], chunk["ecc"])
+                    chunk["snr"] = model.snr(chunk["m_1"], chunk["m_2"], chunk["f_orb"], chunk["dist"],
+                                             chunk["ecc"], n_step=n_step)
+                else:
+                    sources = lw.source.Source(m_1=chunk["m_1"] * u.Msun, m_2=chunk["m_2"] * u.Msun,
+                                               f_orb=chunk["f_orb"] * u.Hz, ecc=chunk["ecc"],
+                                               dist=chunk["dist"] * u.kpc, sc_params=sc_params,
+                                               gw_lum_tol=gw_lum_tol, stat_tol=stat_tol, interpolate_g=False)
+                    use_table(sources)
+                    chunk["t_merge"] = get_merger_time(sources).to(u.yr).value
+                    chunk["snr"] = sources.get_snr(n_step=n_step)
+
+                detectable = chunk["snr"] >= snr_threshold
+                chunk["index"] = np.arange(start, stop)
+                writer.append(**{column: chunk[column][detectable] for column in OUTPUT_COLUMNS})
+                if save_all:
+                    for column, values in all_results.items():
+                        values[start:stop] = chunk[column]
+
+                for quantity, (edges, log) in HISTOGRAMS.items():
+                    summary[quantity + "_all"] += _histogram(chunk[quantity], edges, log)
+                    summary[quantity + "_detectable"] += _histogram(chunk[quantity][detectable], edges, log)
+                summary["n_sources"] += stop - start
+                summary["n_detectable"] += detectable.sum()
+
+            if verbose:
+                elapsed = time.perf_counter() - start_time
+                print("{}/{} binaries ({:1.1f}%), {} detectable, {:1.1f}s elapsed, ~{:1.1f}s left".format(
+                    stop, catalogue.n_rows, 100 * stop / catalogue.n_rows, summary["n_detectable"], elapsed,
+                    elapsed * (catalogue.n_rows - stop) / stop))
+
+        writer.close()
+        if save_all:
+            for values in all_results.values():
+                values.flush()
+            del all_results
+
+    np.savez(paths.data / "{}_summary.npz".format(output_name), **summary)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the merger times and SNRs of a population catalogue "
+                                                 "and write out the detectable binaries")
+    parser.add_argument("catalogue", help="HDF5 file or directory of .npy columns")
+    parser.add_argument("--output-name", help="name of the outputs in src/data (default: catalogue name)")
+    parser.add_argument("--key", help="HDF5 group that holds the columns")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="binaries held in memory at once")
+    parser.add_argument("--snr-threshold", type=float, default=7, help="SNR above which a binary is detectable")
+    parser.add_argument("--instrument", default="LISA", help="detector for the SNR")
+    parser.add_argument("--t-obs", type=float, help="observation time in years (default: mission length)")
+    parser.add_argument("--surrogate", action="store_true", help="interpolate the SNRs of stationary binaries")
+    parser.add_argument("--save-all", action="store_true", help="also write the results for every binary")
+    args = parser.parse_args()
+
+    sc_params = {"instrument": args.instrument}
+    if args.t_obs is not None:
+        sc_params["t_obs"] = args.t_obs * u.yr
+    summary = process_catalogue(args.catalogue, output_name=args.output_name, key=args.key,
+                                chunk_size=args.chunk_size, snr_threshold=args.snr_threshold, sc_params=sc_params,
+                                surrogate=args.surrogate, save_all=args.save_all, verbose=True)
+    print("{} of {} binaries are detectable".format(summary["n_detectable"], summary["n_sources"]))
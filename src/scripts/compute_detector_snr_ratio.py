@@ -0,0 +1,63 @@
+"""Computes the ratio of LISA and TianQin SNRs used in `detector_snr_ratio.py`"""
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import paths
+import fidelity
+import profiling
+from g_table import use_table
+from adaptive_mesh import adaptive_sample
+from multi_detector import snr_multi_detector
+from parallel import map_shards
+from t_merge_table import get_merger_time
+
+# put all of the sources at the same distance with the same mass
+m_1 = 10 * u.Msun
+m_2 = 10 * u.Msun
+dist = 8 * u.kpc
+
+
+def shard_snrs(shard, rows):
+    """LISA and TianQin SNRs of a shard of sources, computed together so that the strains are only
+    calculated once"""
+    get_merger_time(shard)
+    LISA_snr, TQ_snr = snr_multi_detector(shard, [{"instrument": "LISA"}, {"instrument": "TianQin"}],
+                                          which_sources=shard.t_merge > 0.1 * u.yr)
+    return {"LISA_snr": LISA_snr, "TQ_snr": TQ_snr}
+
+
+def snr_ratio(f_orb, ecc):
+    """Ratio of the LISA SNR to the TianQin SNR of each source (0 if either is 0)"""
+    n_sources = len(f_orb)
+    sources = use_table(lw.source.Source(m_1=np.repeat(m_1, n_sources), m_2=np.repeat(m_2, n_sources),
+                                         f_orb=f_orb * u.Hz, ecc=ecc, dist=np.repeat(dist, n_sources),
+                                         gw_lum_tol=1e-3, interpolate_g=False))
+
+    # sources are independent so split them across every worker (see `LEGWORK_WORKERS`)
+    with profiling.span("snr", n_sources=n_sources):
+        snrs = map_shards(sources, shard_snrs, {"LISA_snr": float, "TQ_snr": float})
+    LISA_snr, TQ_snr = snrs["LISA_snr"], snrs["TQ_snr"]
+
+    ratio = np.zeros(n_sources)
+    nonzero = np.logical_and(LISA_snr > 0, TQ_snr > 0)
+    ratio[nonzero] = LISA_snr[nonzero] / TQ_snr[nonzero]
+    return ratio
+
+
+# resolve the ratio = 1 line fully and the filled contours to a quarter of their spacing, the finest resolution
+# matches a uniform grid of 200 frequencies and 150 eccentricities
+levels = np.arange(0, 3.75 + 0.2, 0.2)
+max_depth = 3
+with profiling.span("adaptive sampling") as s:
+    mesh = adaptive_sample(snr_ratio, (1e-4, 1e-1), (0, 0.9), levels=[1.0], atol=0.05,
+                           n_initial=(max(fidelity.scale(200) // 2**max_depth, 2),
+                                      max(fidelity.scale(150) // 2**max_depth, 2)),
+                           max_depth=max_depth, x_scale="log", max_batch=5000, verbose=True)
+    s.add(n_evaluations=mesh.n_evaluations, n_uniform=mesh.n_uniform)
+
+# save the samples and their triangulation along with the source properties (Hz, Msun and kpc)
+with profiling.span("save"):
+    np.savez(paths.data / "detector_snr_ratio.npz", f_orb=mesh.x, ecc=mesh.y, ratio=mesh.z,
+             triangles=mesh.triangles, levels=levels, n_evaluations=mesh.n_evaluations, n_uniform=mesh.n_uniform,
+             m_1=m_1.to(u.Msun).value, m_2=m_2.to(u.Msun).value, dist=dist.to(u.kpc).value,
+             fidelity=fidelity.mode)
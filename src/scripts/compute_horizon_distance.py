@@ -0,0 +1,30 @@
+"""Computes the SNR, horizon distance and merger time grids used in `horizon_distance.py`"""
+import numpy as np
+import astropy.units as u
+import paths
+import fidelity
+import profiling
+from grid_sweep import circular_snr_grid_tiled
+from cache import cached
+
+# create a list of masses and frequencies
+m_c_grid = np.logspace(-1, np.log10(50), fidelity.scale(500)) * u.Msun
+f_orb_grid = np.logspace(np.log10(4e-5), np.log10(3e-1), fidelity.scale(400)) * u.Hz
+
+# calculate merger times and SNR for circular binaries at a fixed distance (only the frequency dependent
+# part is evaluated per frequency, chirp mass and distance enter through exact scalings), a block of frequencies
+# at a time so that memory doesn't grow with the resolution
+snr_threshold = 7
+with profiling.span("snr grid", m_c=m_c_grid, f_orb=f_orb_grid) as s:
+    snr_grid, horizon_distance, t_merge_grid = cached(circular_snr_grid_tiled)(m_c=m_c_grid, f_orb=f_orb_grid,
+                                                                               snr_threshold=snr_threshold,
+                                                                               n_cumulative=fidelity.scale(10000),
+                                                                               verbose=True)
+    s.add(snr_grid=snr_grid)
+
+# save the grids without units (Msun, Hz, kpc and yr)
+with profiling.span("save"):
+    np.savez(paths.data / "horizon_distance.npz", m_c_grid=m_c_grid.to(u.Msun).value,
+             f_orb_grid=f_orb_grid.to(u.Hz).value, snr_grid=snr_grid, snr_threshold=snr_threshold,
+             horizon_distance=horizon_distance.to(u.kpc).value, t_merge_grid=t_merge_grid.to(u.yr).value,
+             fidelity=fidelity.mode)
@@ -0,0 +1,31 @@
+"""Computes the merger time grid used in `merger_time.py`"""
+import numpy as np
+import paths
+import fidelity
+import profiling
+from tiled_grid import evaluate_grid
+from unitless import get_t_merge_ecc
+
+# Hz, Msun and yr throughout, the masses are broadcast against the grid rather than repeated for every binary
+f_range = np.logspace(-5, -1, fidelity.scale(100))
+e_range = np.linspace(0, 0.99, fidelity.scale(500))
+
+m_1 = 10.0
+m_2 = 10.0
+
+
+def merger_times(ecc, f_orb):
+    """Merger times of a tile of the grid (eccentricities are rows and frequencies are columns)"""
+    return {"t_merge": get_t_merge_ecc(m_1=m_1, m_2=m_2, f_orb_i=f_orb, ecc_i=ecc, small_e_tol=0.15,
+                                       large_e_tol=0.9999)}
+
+
+# merger times from the tabulated eccentricity dependence rather than integrating for every binary, written
+# into the grid a block of eccentricities at a time
+with profiling.span("merger times", n_binaries=len(e_range) * len(f_range)):
+    t_merge = evaluate_grid(merger_times, e_range, f_range)[0]["t_merge"]
+
+# save the grid without units (Hz, Msun and yr)
+with profiling.span("save"):
+    np.savez(paths.data / "merger_time.npz", f_range=f_range, e_range=e_range, m_1=m_1, m_2=m_2,
+             t_merge=t_merge, fidelity=fidelity.mode)
@@ -0,0 +1,33 @@
+"""Computes the SNR in each harmonic for the binaries in `role_eccentricity.py`"""
+import numpy as np
+import astropy.units as u
+import paths
+import fidelity
+import profiling
+from adaptive_snr import snr_ecc_evolving_adaptive
+
+# set eccentricities
+ecc = np.array([1e-6, 0.6, 0.9])
+n_binaries = len(ecc)
+
+# use constant values for mass, f_orb and distance
+m_1 = np.repeat(0.6, n_binaries) * u.Msun
+m_2 = np.repeat(0.6, n_binaries) * u.Msun
+f_orb = np.repeat(1.5e-3, n_binaries) * u.Hz
+dist = np.repeat(15, n_binaries) * u.kpc
+
+# get the SNR in each harmonic, skipping the harmonics that can't contribute
+with profiling.span("snr", n_sources=n_binaries) as s:
+    snr2_n, report = snr_ecc_evolving_adaptive(m_1=m_1, m_2=m_2, f_orb_i=f_orb, ecc=ecc, dist=dist,
+                                               harmonics_required=fidelity.scale(100), t_obs=4 * u.yr,
+                                               n_step=fidelity.scale(1000), ret_snr2_by_harmonic=True,
+                                               ret_report=True)
+    s.add(snr2_n=snr2_n, peak_memory_estimate=int(report["peak_memory"]))
+print("harmonics used: {}, max relative SNR^2 left out: {:1.1e}".format(report["harmonics_used"],
+                                                                        report["rel_snr2_bound"].max()))
+
+# save the SNRs along with the source properties (Hz)
+with profiling.span("save"):
+    np.savez(paths.data / "role_eccentricity.npz", ecc=ecc, f_orb=f_orb.to(u.Hz).value, snr2_n=snr2_n,
+             harmonics_used=report["harmonics_used"], rel_snr2_bound=report["rel_snr2_bound"],
+             fidelity=fidelity.mode)
@@ -0,0 +1,32 @@
+"""Computes the evolution and SNR over time of the binary in `snr_over_time.py`"""
+import numpy as np
+import astropy.units as u
+import paths
+import fidelity
+import profiling
+from t_merge_table import get_t_merge_ecc
+from trajectory import snr_along_trajectory
+
+m_1 = 15 * u.Msun
+m_2 = 15 * u.Msun
+dist = 20 * u.kpc
+ecc = 0.5
+f_orb = 3e-5 * u.Hz
+
+t_merge = get_t_merge_ecc(m_1=m_1, m_2=m_2, ecc_i=ecc, f_orb_i=f_orb)
+
+# step the binary towards the merger, recording its state and the SNR of an observation at each timestep
+timesteps, ecc_evol, f_orb_evol, snr = [], [], [], []
+with profiling.span("trajectory", n_step=fidelity.scale(1000)):
+    for step in snr_along_trajectory(m_1=m_1, m_2=m_2, f_orb_i=f_orb, ecc_i=ecc, dist=dist,
+                                     t_evol=t_merge - 100 * u.yr, n_step=fidelity.scale(1000)):
+        timesteps.append(step.t[0].to(u.yr).value)
+        ecc_evol.append(step.ecc[0])
+        f_orb_evol.append(step.f_orb[0].to(u.Hz).value)
+        snr.append(step.snr[0])
+
+# save the evolution along with the source properties (Msun, kpc, Hz and yr)
+with profiling.span("save"):
+    np.savez(paths.data / "snr_over_time.npz", m_1=m_1.to(u.Msun).value, m_2=m_2.to(u.Msun).value,
+             dist=dist.to(u.kpc).value, t_merge=t_merge.to(u.yr).value, timesteps=timesteps,
+             ecc_evol=ecc_evol, f_orb_evol=f_orb_evol, snr=snr, fidelity=fidelity.mode)
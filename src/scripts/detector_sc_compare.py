@@ -1,8 +1,14 @@
-import legwork as lw
 import numpy as np
 import astropy.units as u
 import matplotlib.pyplot as plt
 import paths
+import fidelity
+import profiling  # noqa: F401 (times the stages of this script when LEGWORK_PROFILE is set)
+import rendering
+from psd_engine import PSDEngine
+
+from astropy.visualization import quantity_support
+quantity_support()
 
 plt.rc('font', family='serif')
 plt.rcParams['text.usetex'] = False
@@ -25,29 +31,37 @@ plt.rcParams.update(params)
 fig, ax = plt.subplots()
 
 # define the frequency range of interest
-fr = np.logspace(-4, 0, 1000) * u.Hz
+fr = np.logspace(-4, 0, fidelity.scale(1000)) * u.Hz
+
+# set up each of the sensitivity curves
+sc_params = [{"instrument": "LISA", "t_obs": t_obs * u.yr} for t_obs in [0.5, 2.0, 4.0]]
+labels = [r"LISA ($t_{{\rm obs}} = {{{}}} \, {{\rm yr}}$)".format(t_obs) for t_obs in [0.5, 2.0, 4.0]]
+colours = [plt.get_cmap("Blues")((i + 1) * 0.3) for i in range(3)]
+
+# add the LISA curve with an approximate response function
+sc_params.append({"instrument": "LISA", "approximate_R": True})
+labels.append(r"LISA (approximate $\mathcal{R}(f)$)")
+colours.append(plt.get_cmap("Purples")(0.5))
+
+# add the TianQin curve
+sc_params.append({"instrument": "TianQin"})
+labels.append("TianQin")
+colours.append(plt.get_cmap("Greens")(0.6))
+
+# evaluate every curve at once (curves for the same instrument only differ in their confusion noise)
+asd = np.sqrt(PSDEngine(sc_params).exact(fr))
 
-# plot a sensitivity curve for different mission lengths
 linewidth = 4
-for i, t_obs in enumerate([0.5, 2.0, 4.0]):
-    lw.visualisation.plot_sensitivity_curve(frequency_range=fr, t_obs=t_obs * u.yr,
-                                            fig=fig, ax=ax, show=False, fill=False, linewidth=linewidth,
-                                            color=plt.get_cmap("Blues")((i + 1) * 0.3),
-                                            label=r"LISA ($t_{{\rm obs}} = {{{}}} \, {{\rm yr}}$)".format(t_obs))
-
-# plot the LISA curve with an approximate response function
-lw.visualisation.plot_sensitivity_curve(frequency_range=fr, approximate_R=True,
-                                        fig=fig, ax=ax, show=False, fill=False, linewidth=linewidth,
-                                        color=plt.get_cmap("Purples")(0.5),
-                                        label=r"LISA (approximate $\mathcal{R}(f)$)")
-
-# plot the TianQin curve
-lw.visualisation.plot_sensitivity_curve(frequency_range=fr, instrument="TianQin", label="TianQin",
-                                        fig=fig, ax=ax, show=False, linewidth=linewidth,
-                                        color=plt.get_cmap("Greens")(0.6), fill=False)
+for i in range(len(sc_params)):
+    ax.loglog(fr, asd[i], color=colours[i], label=labels[i], linewidth=linewidth)
+
+ax.set_xlabel(r'Frequency [$\rm Hz$]')
+ax.set_ylabel(r'ASD $[\rm Hz^{-1/2}]$')
+ax.set_xlim(np.min(fr).value, np.max(fr).value)
 
 ax.legend(fontsize=0.7*fs)
 
-ax.set_rasterization_zorder(10000)
+fidelity.mark(fig)
 
-plt.savefig(paths.figures / "detector_sc_compare.pdf", format="pdf", bbox_inches="tight")
\ No newline at end of file
+rendering.save(fig, paths.figures / "detector_sc_compare.pdf", format="pdf", bbox_inches="tight",
+               metadata=fidelity.metadata())
\ No newline at end of file
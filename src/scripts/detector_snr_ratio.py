@@ -1,10 +1,11 @@
-import legwork as lw
 import numpy as np
 import astropy.units as u
 import matplotlib.pyplot as plt
 from matplotlib.colors import TwoSlopeNorm
 import paths
-from copy import copy
+import fidelity
+import profiling  # noqa: F401 (times the stages of this script when LEGWORK_PROFILE is set)
+import rendering
 
 plt.rc('font', family='serif')
 plt.rcParams['text.usetex'] = False
@@ -23,31 +24,12 @@ params = {'figure.figsize': (12, 8),
           'ytick.minor.size': 4}
 plt.rcParams.update(params)
 
-# spread out some frequencies and eccentricities
-f_orb_s = np.logspace(-4, -1, 200)
-ecc_s = np.linspace(0, 0.9, 150)
-
-# turn them into a grid
-F, E = np.meshgrid(f_orb_s, ecc_s)
-
-# flatten the grid
-F_flat, E_flat = F.flatten(), E.flatten()
-
-# put all of the sources at the same distance with the same mass
-m_1 = np.repeat(10, len(F_flat)) * u.Msun
-m_2 = np.repeat(10, len(F_flat)) * u.Msun
-dist = np.repeat(8, len(F_flat)) * u.kpc
-
-# define a set of sources
-sources = lw.source.Source(m_1=m_1, m_2=m_2, f_orb=F_flat * u.Hz, ecc=E_flat, dist=dist, gw_lum_tol=1e-3)
-sources.get_merger_time()
-
-# compute the LISA SNR
-LISA_snr = copy(sources.get_snr(verbose=True, which_sources=sources.t_merge > 0.1 * u.yr))
-
-# compute the TianQin SNR
-sources.update_sc_params({"instrument": "TianQin"})
-TQ_snr = sources.get_snr(verbose=True, which_sources=sources.t_merge > 0.1 * u.yr)
+# load the adaptively sampled SNR ratio from `compute_detector_snr_ratio.py`
+data = np.load(paths.data / "detector_snr_ratio.npz")
+m_1 = data["m_1"] * u.Msun
+m_2 = data["m_2"] * u.Msun
+dist = data["dist"] * u.kpc
+f_orb, ecc, ratio, triangles = data["f_orb"], data["ecc"], data["ratio"], data["triangles"]
 
 # create a figure
 fig, ax = plt.subplots(figsize=(14, 12))
@@ -55,20 +37,15 @@ ax.set_xscale("log")
 ax.set_xlabel(r"Orbital Frequency, $f_{\rm orb} \, [{\rm Hz}]$")
 ax.set_ylabel(r"Eccentricity, $e$")
 
-ratio = np.zeros_like(LISA_snr)
-nonzero = np.logical_and(LISA_snr > 0, TQ_snr > 0)
-ratio[nonzero] = LISA_snr[nonzero] / TQ_snr[nonzero]
-ratio = ratio.reshape(F.shape)
-
 # make contours of the ratio of SNR
-ratio_cont = ax.contourf(F, E, ratio, cmap="PRGn_r", norm=TwoSlopeNorm(vcenter=1.0),
-                         levels=np.arange(0, 3.75 + 0.2, 0.2))
+ratio_cont = ax.tricontourf(f_orb, ecc, triangles, ratio, cmap="PRGn_r", norm=TwoSlopeNorm(vcenter=1.0),
+                            levels=data["levels"])
 
-for c in ratio_cont.collections:
-    c.set_edgecolor("face")
+# rasterize the filled contours, everything else stays vector
+rendering.heavy(ratio_cont)
 
 # add a line when the SNRs are equal
-ax.contour(F, E, ratio, levels=[1.0], colors="grey", linewidths=2.0, linestyles="--")
+ax.tricontour(f_orb, ecc, triangles, ratio, levels=[1.0], colors="grey", linewidths=2.0, linestyles="--")
 
 # add a colourbar
 cbar = fig.colorbar(ratio_cont, fraction=2/14, pad=0.02,
@@ -84,14 +61,15 @@ ax.annotate("TianQin stronger", xy=(0.6, 0.73), xycoords="axes fraction", fontsi
             bbox=dict(boxstyle="round", facecolor="white", edgecolor="white", alpha=0.5, pad=0.4))
 
 # annotate with source details
-source_string = r"$m_1 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_1[0].value)
+source_string = r"$m_1 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_1.value)
 source_string += "\n"
-source_string += r"$m_2 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_1[0].value)
+source_string += r"$m_2 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_2.value)
 source_string += "\n"
-source_string += r"$D_L = {{{}}} \, {{ \rm kpc}}$".format(dist[0].value)
+source_string += r"$D_L = {{{}}} \, {{ \rm kpc}}$".format(dist.value)
 ax.annotate(source_string, xy=(0.98, 0.03), xycoords="axes fraction", ha="right", fontsize=0.75*fs,
             bbox=dict(boxstyle="round", facecolor="white", edgecolor="white", alpha=0.5, pad=0.4))
 
-ax.set_rasterization_zorder(10000)
+fidelity.mark(fig, data["fidelity"])
 
-plt.savefig(paths.figures / "detector_snr_ratio.pdf", format="pdf", bbox_inches="tight")
\ No newline at end of file
+rendering.save(fig, paths.figures / "detector_snr_ratio.pdf", format="pdf", bbox_inches="tight",
+               metadata=fidelity.metadata(data["fidelity"]))
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""Global resolution setting shared by all figure scripts.
+
+The mode is read from the ``LEGWORK_FIDELITY`` environment variable and must be one of ``draft``, ``preview``
+or ``publication`` (the default). Every grid size, number of timesteps and number of harmonics in the scripts is
+written at publication resolution and passed through :func:`scale` so that all of them shrink consistently in
+the faster modes, e.g. ``LEGWORK_FIDELITY=draft showyourwork build``.
+"""
+import os
+
+__all__ = ["MODES", "mode", "factor", "scale", "metadata", "mark"]
+
+# fraction of the publication resolution used in each mode
+MODES = {"draft": 0.1, "preview": 0.3, "publication": 1.0}
+
+mode = os.environ.get("LEGWORK_FIDELITY", "publication").strip().lower()
+if mode not in MODES:
+    raise ValueError("LEGWORK_FIDELITY: `{}` not recognised, must be one of {}".format(
+        mode, ", ".join("`{}`".format(m) for m in MODES)))
+
+factor = MODES[mode]
+
+
+def scale(n, minimum=10):
+    """Scale a publication resolution to the current fidelity mode
+
+    Parameters
+    ----------
+    n : `int`
+        Number of grid points, timesteps or harmonics used for the publication figure
+
+    minimum : `int`
+        Smallest value to return, so that draft grids still make sense (never more than ``n``)
+
+    Returns
+    -------
+    n_scaled : `int`
+        Number to use in the current mode
+    """
+    return max(min(minimum, n), int(round(n * factor)))
+
+
+def metadata(used_mode=None):
+    """PDF metadata recording the fidelity mode, pass this to ``plt.savefig(..., metadata=...)``
+
+    Parameters
+    ----------
+    used_mode : `str`
+        Mode that was used to compute the data in the figure (default is the current mode)
+
+    Returns
+    -------
+    metadata : `dict`
+        Metadata dictionary for the PDF backend
+    """
+    used_mode = mode if used_mode is None else str(used_mode)
+    return {"Keywords": "LEGWORK_FIDELITY={}".format(used_mode)}
+
+
+def mark(fig, used_mode=None):
+    """Label a figure that wasn't made at publication resolution so that it can't be mistaken for one
+
+    Parameters
+    ----------
+    fig : `matplotlib Figure`
+        Figure to label
+
+    used_mode : `str`
+        Mode that was used to compute the data in the figure (default is the current mode)
+    """
+    used_mode = mode if used_mode is None else str(used_mode)
+    if used_mode != "publication":
+        fig.text(0.99, 0.01, used_mode.upper(), ha="right", va="bottom", color="tab:red", alpha=0.5,
+                 fontsize="large", fontweight="bold")
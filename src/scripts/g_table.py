@@ -0,0 +1,275 @@
+"""Fast g(n, e) from a shared, memory-mapped table of the Peters & Mathews (1963) harmonic power.
+
+Every eccentric SNR needs g(n, e) for thousands of harmonics per source. The exact function
+(:func:`legwork.utils.peters_g`) evaluates five Bessel functions per entry, and the ``interpolate_g`` option of
+:class:`legwork.source.Source` instead loads a coarse grid and fits a new cubic ``interp2d`` to it in every
+Source (several seconds each time, in every process). Here log g is tabulated once for n = 1 ... ``N_MAX`` on a
+uniform grid in logit(e) = log(e / (1 - e)) over ``E_RANGE``. That grid puts nodes close together at both ends,
+where g changes fastest. The table is saved in ``paths.data`` and opened read-only with ``np.memmap``, so every
+worker process reads the same pages from the page cache and nothing is built or copied per process. Each row of
+the table holds every harmonic at one eccentricity, so the harmonics of a source are read from four contiguous
+rows.
+
+Values are interpolated with a 4-point cubic in logit(e). The grid is refined until the interpolated g is within
+``RTOL`` (relative) of the exact value at the midpoint of every interval for every harmonic that carries more
+than ``SIGNIFICANT`` of the total power F(e) (smaller harmonics only change an SNR by much less than ``RTOL``).
+The error that was reached is stored with the table. Harmonics above ``N_MAX``, non-integer harmonics and
+eccentricities outside of ``E_RANGE`` fall back to the exact function, so :func:`peters_g` is a drop-in
+replacement everywhere, e.g.
+
+    g = g_table.peters_g(n[np.newaxis, :], ecc[:, np.newaxis])
+
+and :func:`use_table` makes a Source (and LEGWORK's strain and SNR functions) use the table instead of its own
+interpolation.
+"""
+import argparse
+import json
+import os
+
+import legwork as lw
+import numpy as np
+import paths
+
+__all__ = ["G_TABLE_VERSION", "N_MAX", "E_RANGE", "RTOL", "SIGNIFICANT", "build_table", "load_table",
+           "peters_g", "interpolated_g", "use_table"]
+
+# bump this whenever the way the table is computed changes so that old tables are rebuilt (and update the
+# file names of `G_TABLE` in the Snakefile to match)
+G_TABLE_VERSION = 1
+
+# largest harmonic in the table
+N_MAX = 10000
+
+# eccentricities covered by the table
+E_RANGE = (1e-4, 1 - 1e-4)
+
+# maximum relative error of the interpolated g for harmonics with at least `SIGNIFICANT` of the total power
+RTOL = 1e-5
+SIGNIFICANT = 1e-12
+
+# log g is floored here so that harmonics that underflow stay finite
+LOG_FLOOR = np.log(np.finfo(float).tiny)
+
+# loaded table, only mapped once per process
+_table = None
+
+
+def _logit(e):
+    return np.log(e) - np.log1p(-e)
+
+
+def _exact_log_g(n, e, batch=64):
+    """Exact log g for every harmonic ``n`` (1D) at every eccentricity ``e`` (1D), shape (len(e), len(n))"""
+    log_g = np.empty((len(e), len(n)))
+    with np.errstate(divide="ignore"):
+        for start in range(0, len(e), batch):
+            rows = slice(start, start + batch)
+            log_g[rows] = np.log(lw.utils.peters_g(n[np.newaxis, :], e[rows, np.newaxis]))
+    return np.maximum(log_g, LOG_FLOOR)
+
+
+def _cubic(table, t, col):
+    """Interpolate a table (rows at t = 0, 1, 2, ...) at fractional rows ``t`` in columns ``col`` with a 4-point
+    cubic that is shifted inwards at the ends of the table"""
+    i = np.clip(np.floor(t).astype(int) - 1, 0, table.shape[0] - 4)
+    u = t - i
+    weights = (-(u - 1) * (u - 2) * (u - 3) / 6, u * (u - 2) * (u - 3) / 2,
+               -u * (u - 1) * (u - 3) / 2, u * (u - 1) * (u - 2) / 6)
+    return sum(w * table[i + k, col] for k, w in enumerate(weights))
+
+
+def build_table(rtol=RTOL, n_max=N_MAX, e_range=E_RANGE, n_start=256, n_intervals_max=4096, verbose=False):
+    """Build the table of log g, doubling the number of intervals in logit(e) until the cubic interpolation is
+    accurate to ``rtol`` at the midpoint of every interval (the midpoints become the new nodes)
+
+    Parameters
+    ----------
+    rtol : `float`
+        Maximum relative error of the interpolated g for harmonics with more than ``SIGNIFICANT`` of the power
+
+    n_max : `int`
+        Largest harmonic
+
+    e_range : `tuple`
+        Smallest and largest eccentricity
+
+    n_start : `int`
+        Initial number of intervals
+
+    n_intervals_max : `int`
+        Maximum number of intervals
+
+    verbose : `boolean`
+        Whether to print the error after each refinement
+
+    Returns
+    -------
+    table : `dict`
+        ``log_g`` with shape (number of nodes, ``n_max``), the ``y_range`` in logit(e) that the nodes span, the
+        maximum relative ``error`` of the interpolation and the ``rtol`` and ``version`` of the table
+    """
+    n = np.arange(1, n_max + 1)
+    y_range = _logit(np.asarray(e_range, dtype=float))
+
+    n_intervals = n_start
+    y = np.linspace(*y_range, n_intervals + 1)
+    log_g = _exact_log_g(n, 1 / (1 + np.exp(-y)))
+    while True:
+        y_mid = 0.5 * (y[1:] + y[:-1])
+        e_mid = 1 / (1 + np.exp(-y_mid))
+        log_g_mid = _exact_log_g(n, e_mid)
+
+        interp = _cubic(log_g, np.arange(n_intervals)[:, np.newaxis] + 0.5, n[np.newaxis, :] - 1)
+        significant = log_g_mid > np.log(SIGNIFICANT * lw.utils.peters_f(e_mid))[:, np.newaxis]
+        error = np.max(np.expm1(np.abs(interp - log_g_mid)[significant]))
+        if verbose:
+            print("{} intervals: maximum relative error {:1.1e}".format(n_intervals, error))
+
+        # the midpoints are already computed so they always join the nodes
+        y = np.sort(np.concatenate((y, y_mid)))
+        merged = np.empty((len(y), n_max))
+        merged[::2], merged[1::2] = log_g, log_g_mid
+        log_g = merged
+        n_intervals *= 2
+
+        # the error was measured on the coarser grid so it bounds the error of the final one
+        if error <= rtol or n_intervals >= n_intervals_max:
+            return {"log_g": log_g, "y_range": [float(y_range[0]), float(y_range[1])], "error": float(error),
+                    "rtol": rtol, "version": G_TABLE_VERSION}
+
+
+def load_table(rebuild=False, verbose=False):
+    """Map the table from ``paths.data`` read-only, building (and saving) it first if it doesn't exist yet or if
+    it was made with a different ``G_TABLE_VERSION``
+
+    The table is written to a temporary file and then renamed so that processes that start at the same time
+    never map a partially written table.
+
+    Parameters
+    ----------
+    rebuild : `boolean`
+        Whether to rebuild the table even if it exists
+
+    verbose : `boolean`
+        Whether to print progress while building
+
+    Returns
+    -------
+    log_g : `np.memmap`
+        log g with one row per eccentricity node and one column per harmonic
+
+    meta : `dict`
+        Range in logit(e) of the nodes, error, rtol and version of the table
+    """
+    global _table
+    if _table is not None and not rebuild:
+        return _table
+
+    path = paths.data / "peters_g_table_v{}.npy".format(G_TABLE_VERSION)
+    meta_path = path.with_suffix(".json")
+    meta = None
+    if path.exists() and meta_path.exists() and not rebuild:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["version"] != G_TABLE_VERSION or meta["rtol"] > RTOL or meta["n_max"] != N_MAX \
+                or meta["e_range"] != list(E_RANGE):
+            meta = None
+    if meta is None:
+        table = build_table(verbose=verbose)
+        meta = {key: table[key] for key in ["y_range", "error", "rtol", "version"]}
+        meta.update(n_max=N_MAX, e_range=list(E_RANGE))
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = ".{}.tmp".format(os.getpid())
+        np.save(str(path) + suffix, table["log_g"])
+        os.replace(str(path) + suffix + ".npy", path)
+        with open(str(meta_path) + suffix, "w") as f:
+            json.dump(meta, f, indent=1)
+        os.replace(str(meta_path) + suffix, meta_path)
+
+    _table = np.load(path, mmap_mode="r"), meta
+    return _table
+
+
+def peters_g(n, e):
+    """Drop-in replacement for :func:`legwork.utils.peters_g` that interpolates the table
+
+    Parameters
+    ----------
+    n : `int/array`
+        Harmonic(s) of interest
+
+    e : `float/array`
+        Eccentricity, broadcast against ``n``
+
+    Returns
+    -------
+    g : `float/array`
+        g(n, e) from Peters & Mathews (1963) Eq. 20
+    """
+    n, e = np.broadcast_arrays(np.asarray(n), np.asarray(e, dtype=float))
+    log_g, meta = load_table()
+    in_table = np.logical_and.reduce((n >= 1, n <= log_g.shape[1], n == np.round(n),
+                                      e >= E_RANGE[0], e <= E_RANGE[1]))
+
+    g = np.zeros(n.shape)
+    if in_table.any():
+        y_min, y_max = meta["y_range"]
+        t = (_logit(e[in_table]) - y_min) / (y_max - y_min) * (log_g.shape[0] - 1)
+        interp = _cubic(log_g, t, n[in_table].astype(int) - 1)
+        g[in_table] = np.where(interp > LOG_FLOOR, np.exp(interp), 0.0)
+    exact = np.logical_not(in_table)
+    if exact.any():
+        g[exact] = lw.utils.peters_g(n[exact], e[exact])
+    return g if g.ndim > 0 else g.item()
+
+
+def interpolated_g(n, e):
+    """g(n, e) with the call signature of the ``interp2d`` that LEGWORK uses for ``interpolated_g``
+
+    Parameters
+    ----------
+    n : `int/array`
+        Harmonics (1D)
+
+    e : `float/array`
+        Eccentricities (1D)
+
+    Returns
+    -------
+    g : `float/array`
+        g with shape (len(e), len(n)), with the eccentricities sorted like ``interp2d`` does
+    """
+    n = np.atleast_1d(n)
+    e = np.sort(np.atleast_1d(e).astype(float))
+    return peters_g(n[np.newaxis, :], e[:, np.newaxis])
+
+
+def use_table(sources):
+    """Make a Source use the table whenever it (or LEGWORK's strain and SNR functions) needs g(n, e)
+
+    Create the Source with ``interpolate_g=False`` so that it doesn't build its own interpolation first.
+
+    Parameters
+    ----------
+    sources : `legwork.source.Source`
+        Sources to update
+
+    Returns
+    -------
+    sources : `legwork.source.Source`
+        The same sources
+    """
+    load_table()
+    sources.g = interpolated_g
+    return sources
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the shared g(n, e) table in src/data and report its error")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the table even if it already exists")
+    args = parser.parse_args()
+
+    log_g, meta = load_table(rebuild=args.rebuild, verbose=True)
+    print("g(n, e) table: {} eccentricities x {} harmonics, maximum relative error {:1.1e}".format(
+        *log_g.shape, meta["error"]))
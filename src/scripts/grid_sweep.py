@@ -0,0 +1,214 @@
+"""Fast SNR, horizon distance and merger time grids for circular binaries.
+
+For circular binaries the SNR factorises into a chirp mass term, a distance term and a term that depends only
+on frequency, so we can evaluate the expensive part (strain and PSD) once per frequency column instead of once
+per grid point. Only binaries that merge during the mission are passed through the full per-source
+calculation in LEGWORK. :func:`circular_snr_grid_tiled` does the same a tile at a time (see :mod:`tiled_grid`)
+so that the intermediates never grow with the grid.
+"""
+import legwork as lw
+import numpy as np
+import astropy.units as u
+from tiled_grid import evaluate_grid
+
+__all__ = ["circular_snr_grid", "circular_snr_grid_tiled"]
+
+
+def _chirp_mass_to_equal_masses(m_c):
+    """Convert chirp mass to a pair of equal component masses"""
+    m_1 = m_c * 2**(1/5)
+    return m_1, m_1
+
+
+def _merger_time_factor(f_orb):
+    """Merger time of a circular binary with a 1 Msun chirp mass at each orbital frequency (scales as
+    m_c^(-5/3))"""
+    m_1, m_2 = _chirp_mass_to_equal_masses(np.ones(len(f_orb)) * u.Msun)
+    return lw.evol.get_t_merge_circ(m_1=m_1, m_2=m_2, f_orb_i=f_orb).to(u.yr).value
+
+
+def _stationary_snr_factor(f_orb, t_obs, **kwargs):
+    """SNR of a stationary circular binary with a 1 Msun chirp mass at 1 kpc (scales as m_c^(5/3) / d)"""
+    ones = np.ones(len(f_orb))
+    return lw.snr.snr_circ_stationary(m_c=ones * u.Msun, f_orb=f_orb, dist=ones * u.kpc, t_obs=t_obs,
+                                      **kwargs)
+
+
+def _cumulative_snr2(f_gw, t_obs, **kwargs):
+    """Cumulative integral of the SNR^2 integrand over GW frequency for a circular binary with a 1 Msun
+    chirp mass at 1 kpc (scales as m_c^(5/3) / d^2)"""
+    ones = np.ones(len(f_gw))
+    h_c_2 = lw.strain.h_c_n(m_c=ones * u.Msun, f_orb=f_gw / 2, ecc=np.zeros(len(f_gw)), n=2,
+                            dist=ones * u.kpc).flatten()**2
+    h_c_noise_2 = (f_gw**2 * lw.psd.power_spectral_density(f=f_gw, t_obs=t_obs, **kwargs)).to(u.Hz).value
+    integrand = h_c_2 / h_c_noise_2
+
+    # cumulative trapezoid rule (integrand is zero wherever the noise is infinite)
+    integrand = np.nan_to_num(integrand, nan=0.0, posinf=0.0)
+    f_gw = f_gw.to(u.Hz).value
+    cumulative = np.zeros(len(f_gw))
+    cumulative[1:] = np.cumsum(0.5 * (integrand[1:] + integrand[:-1]) * np.diff(f_gw))
+    return f_gw, cumulative
+
+
+def circular_snr_grid(m_c, f_orb, dist=1 * u.kpc, snr_threshold=7, t_obs=4 * u.yr, stat_tol=1e-2,
+                      n_cumulative=10000, verbose=False, **kwargs):
+    """Compute SNR, horizon distance and merger time over a grid of circular binaries
+
+    The grids follow the shape of ``np.meshgrid(m_c, f_orb)``, i.e. rows are frequencies and columns are
+    chirp masses.
+
+    Stationary binaries use an exact scaling of the SNR at each frequency, evolving binaries integrate a
+    cumulative SNR^2 table between their initial and final frequency and binaries that merge during the
+    mission are computed individually with :class:`legwork.source.Source`.
+
+    Parameters
+    ----------
+    m_c : `float/array`
+        Chirp mass axis. Must have astropy units of mass.
+
+    f_orb : `float/array`
+        Orbital frequency axis. Must have astropy units of frequency.
+
+    dist : `float/array`
+        Distance(s) at which to evaluate the SNR (default 1 kpc)
+
+    snr_threshold : `float`
+        SNR above which a source is considered detectable, used for the horizon distance
+
+    t_obs : `float`
+        Observation time (default 4 years)
+
+    stat_tol : `float`
+        Fractional change in frequency over the mission above which a binary is considered evolving (matches
+        the definition in :class:`legwork.source.Source`)
+
+    n_cumulative : `int`
+        Number of frequencies in the cumulative SNR^2 table used for evolving binaries
+
+    verbose : `boolean`
+        Whether to print how many binaries fell into each category
+
+    **kwargs : `various`
+        Keyword args are passed to :meth:`legwork.psd.power_spectral_density`, e.g. ``instrument``
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR for each binary. Shape is (len(f_orb), len(m_c)) if ``dist`` is a single value or
+        (len(dist), len(f_orb), len(m_c)) otherwise.
+
+    horizon_distance : `float/array`
+        Distance at which each binary reaches ``snr_threshold``, shape (len(f_orb), len(m_c))
+
+    t_merge : `float/array`
+        Merger time of each binary, shape (len(f_orb), len(m_c))
+    """
+    m_c, f_orb = np.atleast_1d(m_c).to(u.Msun), np.atleast_1d(f_orb).to(u.Hz)
+    shape = (len(f_orb), len(m_c))
+
+    # broadcast the axes without copying them to the full grid
+    f_orb_grid = np.broadcast_to(f_orb.value[:, np.newaxis], shape)
+    m_c_grid = np.broadcast_to(m_c.value[np.newaxis, :], shape)
+    mass_scaling = m_c_grid**(5/3)
+
+    # merger times are a frequency column divided by a chirp mass row
+    t_merge = _merger_time_factor(f_orb)[:, np.newaxis] / mass_scaling
+    t_obs_yr = t_obs.to(u.yr).value
+
+    # work out the final frequency after the mission for anything that doesn't merge
+    merging = t_merge <= t_obs_yr
+    f_orb_final = np.full(shape, np.inf)
+    f_orb_final[~merging] = f_orb_grid[~merging] * (1 - t_obs_yr / t_merge[~merging])**(-3/8)
+    stationary = (f_orb_final - f_orb_grid) / f_orb_grid <= stat_tol
+    evolving = np.logical_and(~stationary, ~merging)
+
+    if verbose:
+        print("Calculating SNR for {} sources".format(t_merge.size))
+        print("\t{} sources are stationary".format(stationary.sum()))
+        print("\t{} sources are evolving".format(evolving.sum()))
+        print("\t{} sources merge during the mission".format(merging.sum()))
+
+    # SNR at 1 kpc for the reference grid
+    snr_ref = np.zeros(shape)
+
+    # stationary: exact scaling of one evaluation per frequency
+    if stationary.any():
+        snr_factor = _stationary_snr_factor(f_orb, t_obs, **kwargs)
+        snr_ref[stationary] = (snr_factor[:, np.newaxis] * mass_scaling)[stationary]
+
+    # evolving: SNR^2 is the difference of a cumulative table between the initial and final frequency
+    if evolving.any():
+        f_gw_range = np.logspace(np.log10(2 * f_orb.value.min()), np.log10(2 * f_orb_final[evolving].max()),
+                                 n_cumulative) * u.Hz
+        f_gw, cumulative = _cumulative_snr2(f_gw_range, t_obs, **kwargs)
+        snr2_unscaled = (np.interp(np.log10(2 * f_orb_final[evolving]), np.log10(f_gw), cumulative)
+                         - np.interp(np.log10(2 * f_orb_grid[evolving]), np.log10(f_gw), cumulative))
+        snr_ref[evolving] = (np.maximum(snr2_unscaled, 0.0) * mass_scaling[evolving])**0.5
+
+    # merging: fall back to the full per-source calculation
+    if merging.any():
+        n_merging = merging.sum()
+        m_1, m_2 = _chirp_mass_to_equal_masses(m_c_grid[merging] * u.Msun)
+        sources = lw.source.Source(m_1=m_1, m_2=m_2, f_orb=f_orb_grid[merging] * u.Hz, ecc=np.zeros(n_merging),
+                                   dist=np.ones(n_merging) * u.kpc, interpolate_g=False,
+                                   sc_params=dict(t_obs=t_obs, **kwargs))
+        sources.t_merge = (t_merge[merging] * u.yr).to(u.Gyr)
+        snr_ref[merging] = sources.get_snr(t_obs=t_obs)
+
+    # SNR scales inversely with distance so the horizon distance follows directly
+    horizon_distance = snr_ref / snr_threshold * u.kpc
+    dist_kpc = dist.to(u.kpc).value
+    if np.ndim(dist_kpc) == 0:
+        snr = snr_ref / dist_kpc
+    else:
+        snr = snr_ref[np.newaxis, ...] / dist_kpc[:, np.newaxis, np.newaxis]
+
+    return snr, horizon_distance, t_merge * u.yr
+
+
+def circular_snr_grid_tiled(m_c, f_orb, snr_threshold=7, t_obs=4 * u.yr, stat_tol=1e-2, n_cumulative=10000,
+                            max_elements=2**14, out_dir=None, verbose=False, **kwargs):
+    """Same as :func:`circular_snr_grid` at 1 kpc, but evaluated in tiles of whole frequency rows that are
+    written straight into the output grids
+
+    Each tile computes its frequency dependent parts only for its own frequencies, so nothing is repeated between
+    tiles and the peak memory of the intermediates is set by ``max_elements`` rather than by the size of the grid.
+
+    Parameters
+    ----------
+    m_c, f_orb, snr_threshold, t_obs, stat_tol, n_cumulative, **kwargs
+        See :func:`circular_snr_grid`
+
+    max_elements : `int`
+        Maximum number of binaries in each tile, kept small since LEGWORK needs several kB for each binary that
+        merges during the mission
+
+    out_dir : `str`
+        Directory in which to memory-map the output grids, None to keep them in memory
+
+    verbose : `boolean`
+        Whether to print how long the evaluation took
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR for each binary at 1 kpc, shape (len(f_orb), len(m_c))
+
+    horizon_distance : `float/array`
+        Distance at which each binary reaches ``snr_threshold``, shape (len(f_orb), len(m_c))
+
+    t_merge : `float/array`
+        Merger time of each binary, shape (len(f_orb), len(m_c))
+    """
+    m_c, f_orb = np.atleast_1d(m_c).to(u.Msun), np.atleast_1d(f_orb).to(u.Hz)
+
+    def tile(f_orb_rows, m_c_cols):
+        snr, _, t_merge = circular_snr_grid(m_c=m_c_cols[0] * u.Msun, f_orb=f_orb_rows[:, 0] * u.Hz,
+                                            dist=1 * u.kpc, snr_threshold=snr_threshold, t_obs=t_obs,
+                                            stat_tol=stat_tol, n_cumulative=n_cumulative, **kwargs)
+        return {"snr": snr, "horizon_distance": snr / snr_threshold, "t_merge": t_merge.to(u.yr).value}
+
+    grids, _ = evaluate_grid(tile, f_orb.value, m_c.value, out_dir=out_dir, max_elements=max_elements,
+                             verbose=verbose)
+    return grids["snr"], grids["horizon_distance"] << u.kpc, grids["t_merge"] << u.yr
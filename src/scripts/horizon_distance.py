@@ -3,6 +3,9 @@ import numpy as np
 import astropy.units as u
 import matplotlib.pyplot as plt
 import paths
+import fidelity
+import profiling  # noqa: F401 (times the stages of this script when LEGWORK_PROFILE is set)
+import rendering
 
 plt.rc('font', family='serif')
 plt.rcParams['text.usetex'] = False
@@ -21,35 +24,16 @@ params = {'figure.figsize': (12, 8),
           'ytick.minor.size': 4}
 plt.rcParams.update(params)
 
-# create a list of masses and frequencies
-m_c_grid = np.logspace(-1, np.log10(50), 500) * u.Msun
-f_orb_grid = np.logspace(np.log10(4e-5), np.log10(3e-1), 400) * u.Hz
+# load the grids from `compute_horizon_distance.py`
+data = np.load(paths.data / "horizon_distance.npz")
+m_c_grid = data["m_c_grid"] * u.Msun
+f_orb_grid = data["f_orb_grid"] * u.Hz
+horizon_distance = data["horizon_distance"] * u.kpc
+t_merge_grid = data["t_merge_grid"] * u.yr
 
-# turn the two lists into grids
-MC, FORB = np.meshgrid(m_c_grid, f_orb_grid)
-
-# flatten grids
-m_c, f_orb = MC.flatten(), FORB.flatten()
-
-# convert chirp mass to individual masses for source class
-q = 1.0
-m_1 = m_c / q**(3/5) * (1 + q)**(1/5)
-m_2 = m_1 * q
-
-# use a fixed distance and circular binaries
-dist = np.repeat(1, len(m_c)) * u.kpc
-ecc = np.zeros(len(m_c))
-
-# create the source class
-sources = lw.source.Source(m_1=m_1, m_2=m_2, dist=dist, f_orb=f_orb, ecc=ecc, gw_lum_tol=1e-3)
-
-# calculate merger times and then SNR
-sources.get_merger_time()
-sources.get_snr(verbose=True)
-
-# reshape the output into grids
-t_merge_grid = sources.t_merge.reshape(MC.shape)
-snr_grid = sources.snr.reshape(MC.shape)
+# contour over the two lists directly rather than building full coordinate grids (the grids have a row per
+# frequency so they are transposed to have a row per chirp mass)
+log_distance = np.log10(horizon_distance.value).T
 
 def fmt_time(x):
     if x == 4:
@@ -101,20 +85,15 @@ ax.set_xlabel(r"Orbital Frequency, $f_{\rm orb} \, [\rm Hz]$")
 ax.set_ylabel(r"Chirp Mass, $\mathcal{M}_c \, [\rm M_{\odot}]$")
 ax.set_xlim(4e-5, 3e-1)
 
-# calculate the horizon distance
-snr_threshold = 7
-horizon_distance = (snr_grid / snr_threshold * 1 * u.kpc).to(u.kpc)
-
 # set up the contour levels
 distance_levels = np.arange(-3, 6 + 0.5, 0.5)
 distance_tick_levels = distance_levels[::2]
 
 # plot the contours for horizon distance
-distance_cont = ax.contourf(FORB, MC, np.log10(horizon_distance.value), levels=distance_levels)
+distance_cont = ax.contourf(f_orb_grid, m_c_grid, log_distance, levels=distance_levels)
 
-# hide edges that show up in rendered PDFs
-for c in distance_cont.collections:
-    c.set_edgecolor("face")
+# rasterize the filled contours, everything else stays vector
+rendering.heavy(distance_cont)
 
 # create a colour with custom formatted labels
 cbar = fig.colorbar(distance_cont, ax=ax, pad=0.02, ticks=distance_tick_levels, fraction=cbar_space / (size + cbar_space))
@@ -128,13 +107,13 @@ for name in named_distances:
     cbar.ax.axhline(name, color="white", linestyle="dotted")
 
 # plot the same names as contours
-named_cont = ax.contour(FORB, MC, np.log10(horizon_distance.value), levels=named_distances,
+named_cont = ax.contour(f_orb_grid, m_c_grid, log_distance, levels=named_distances,
                         colors="white", alpha=0.8, linestyles="dotted")
 ax.clabel(named_cont, named_cont.levels, fmt=fmt_name, use_clabeltext=True, fontsize=0.7*fs,
           manual=[(1.1e-3, 2e-1), (4e-3, 2.2e-1), (4e-3,1e0), (3e-3, 1.2e1)])
 
 # add a line for when the merger time becomes less than the inspiral time
-time_cont = ax.contour(FORB, MC, t_merge_grid.to(u.yr).value, levels=[4],
+time_cont = ax.contour(f_orb_grid, m_c_grid, t_merge_grid.to(u.yr).value.T, levels=[4],
                        colors="black", linewidths=2, linestyles="dotted") #[1/52, 1/12, 4, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10]
 ax.clabel(time_cont, time_cont.levels, fmt=fmt_time, fontsize=0.7*fs, use_clabeltext=True, manual=[(2.5e-2, 5e0)])
 
@@ -162,6 +141,7 @@ ax.annotate(r"$e = 0.0$", xy=(0.03, 0.04), xycoords="axes fraction", fontsize=0.
 
 ax.set_facecolor(plt.get_cmap("viridis")(0.0))
 
-ax.set_rasterization_zorder(10000)
+fidelity.mark(fig, data["fidelity"])
 
-plt.savefig(paths.figures / "horizon_distance.pdf", format="pdf", bbox_inches="tight")
\ No newline at end of file
+rendering.save(fig, paths.figures / "horizon_distance.pdf", format="pdf", bbox_inches="tight",
+               metadata=fidelity.metadata(data["fidelity"]))
\ No newline at end of file
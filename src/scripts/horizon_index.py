@@ -0,0 +1,572 @@
+"""Batched horizon distance and detectability queries from precomputed SNRs.
+
+The SNR of every binary, stationary or not, is inversely proportional to its distance, so the SNR at 1 kpc of a
+binary with a given chirp mass, orbital frequency and eccentricity answers every question about its
+detectability: the horizon distance for any SNR threshold is just ``snr_1kpc / threshold`` kpc. A
+:class:`HorizonIndex` tabulates log SNR at 1 kpc from :func:`unitless.get_snr` (equal mass binaries, including
+those that evolve or merge during the mission) on a regular grid in (log chirp mass, log orbital frequency,
+eccentricity) for each detector and observation time, and interpolates it trilinearly. As for
+:class:`surrogate.SNRSurrogate`, the error of each grid cell is measured at its centre, and also at two more points
+on its diagonal since the error can peak away from the centre. Cells that don't meet half of the tolerance, and
+cells whose corners are on different sides of a change from stationary to evolving to merging binaries or in the
+number of harmonics (where the SNR jumps), are outside of the validated region, and any query that lands in one of
+them uses the exact solver instead, e.g.
+
+    index = load_index(instruments=["LISA", "TianQin"])
+    d_h = index.horizon_distance(m_c, f_orb, ecc, snr_threshold=[7, 12], instrument="TianQin")
+    frac = index.detectable_fraction(m_c, f_orb, ecc, dist=[1, 8, 50], instrument="LISA")
+    m_c_min = index.min_chirp_mass(f_orb, ecc, dist=8, instrument="LISA")
+
+Chirp mass is in Msun, frequency in Hz, distance in kpc and time in yr throughout. :func:`load_index` saves each
+index in ``paths.data`` the first time that it is built.
+"""
+import argparse
+import time
+
+import numpy as np
+import astropy.units as u
+import paths
+from cache import cache_key
+from psd_engine import PSDEngine
+from unitless import _groups, _harmonics, determine_stationarity, get_snr, get_t_merge_ecc
+
+__all__ = ["HorizonIndex", "load_index"]
+
+# component masses of an equal mass binary with a chirp mass of 1 Msun
+EQUAL_MASS = 2**(1/5)
+
+# fractions of the way along the main diagonal of each cell at which the error is measured (the centre, and
+# halfway from it to two opposite corners)
+CHECK_POINTS = (0.5, 0.25, 0.75)
+
+# the error between the points that are checked can be larger, so a cell is only validated if the error at every
+# point is below rtol / SAFETY
+SAFETY = 2
+
+
+def _t_obs(sc_params):
+    """Observation time in years of a detector configuration"""
+    return PSDEngine(sc_params).configs[0]["t_obs"].to(u.yr).value
+
+
+def _regime(m_c, f_orb, ecc, t_obs, gw_lum_tol, stat_tol):
+    """Label each equal mass binary with the branch of :func:`unitless.get_snr` that it takes (its harmonic
+    group, whether it is stationary and whether it merges during the observation), the SNR jumps between them"""
+    m_c, f_orb, ecc = np.broadcast_arrays(m_c, f_orb, ecc)
+    regime = np.zeros(m_c.shape, dtype=int)
+    for match, harmonics_required in _groups(ecc, np.ones(m_c.shape, dtype=bool), _harmonics(gw_lum_tol)):
+        regime[match] = 4 * (harmonics_required or 0)
+    regime += 2 * determine_stationarity(m_c * EQUAL_MASS, m_c * EQUAL_MASS, f_orb, t_obs, ecc, stat_tol=stat_tol)
+    regime += get_t_merge_ecc(m_c * EQUAL_MASS, m_c * EQUAL_MASS, f_orb, ecc) < t_obs
+    return regime
+
+
+class HorizonIndex():
+    """Interpolated SNRs at 1 kpc over chirp mass, orbital frequency and eccentricity for several detector
+    configurations, use :meth:`build` or :func:`load_index` to create one
+
+    Parameters
+    ----------
+    sc_params : `list`
+        Sensitivity curve parameters of each configuration, as for :class:`legwork.source.Source`
+
+    log_m_c, log_f, ecc : `float/array`
+        Evenly spaced nodes in log10 chirp mass (Msun), log10 orbital frequency (Hz) and eccentricity
+
+    log_snr : `float/array`
+        Natural log of the SNR at 1 kpc at each node, shape (len(sc_params), len(log_m_c), len(log_f), len(ecc))
+
+    error : `float/array`
+        Largest relative error of the interpolation at the ``CHECK_POINTS`` of each cell, one fewer node along
+        each grid axis than ``log_snr``. Infinite for cells whose corners differ in harmonic group, stationarity or
+        whether the binary merges during the observation.
+
+    rtol : `float`
+        Cells with an ``error`` above ``rtol / SAFETY`` are outside of the validated region
+
+    gw_lum_tol, stat_tol : `float`
+        Tolerances used for the harmonics and stationarity (see :class:`legwork.source.Source`)
+
+    n_step : `int`
+        Number of timesteps for the SNR of evolving binaries
+
+    validation_error : `float/array`
+        Median, 99th percentile and maximum relative error of random binaries in the validated region of each
+        configuration, shape (len(sc_params), 3)
+
+    Attributes
+    ----------
+    instruments : `list`
+        Instrument of each configuration
+
+    t_obs : `float/array`
+        Observation time of each configuration in years
+
+    valid : `bool/array`
+        Mask of the cells in the validated region, same shape as ``error``
+
+    coverage : `float/array`
+        Fraction of the cells in the validated region of each configuration
+    """
+    def __init__(self, sc_params, log_m_c, log_f, ecc, log_snr, error, rtol, gw_lum_tol=0.05, stat_tol=1e-2,
+                 n_step=100, validation_error=None):
+        self.sc_params = sc_params
+        self.log_m_c = log_m_c
+        self.log_f = log_f
+        self.ecc = ecc
+        self.log_snr = log_snr
+        self.error = error
+        self.rtol = rtol
+        self.gw_lum_tol = gw_lum_tol
+        self.stat_tol = stat_tol
+        self.n_step = n_step
+        self.validation_error = validation_error
+
+        self.instruments = [params.get("instrument", "LISA") for params in sc_params]
+        self.t_obs = np.array([_t_obs(params) for params in sc_params])
+        self.valid = np.logical_and(SAFETY * error <= rtol, np.isfinite(error))
+        self.coverage = self.valid.reshape(len(sc_params), -1).mean(axis=1)
+
+    @classmethod
+    def build(cls, instruments=["LISA"], t_obs=[None], m_c_range=(0.1, 50), f_range=(1e-5, 1e-1),
+              e_range=(0.0, 0.9), n_m_c=40, n_f=120, n_e=30, rtol=1e-2, gw_lum_tol=0.05, stat_tol=1e-2,
+              n_step=100, n_validate=1000, verbose=False):
+        """Tabulate the SNR at 1 kpc of every combination of detector and observation time with the exact
+        solver
+
+        Parameters
+        ----------
+        instruments : `list`
+            Detectors to index
+
+        t_obs : `list`
+            Observation times in years to index for every detector (None for the mission length)
+
+        m_c_range, f_range, e_range : `tuple`
+            Range of chirp masses in Msun, orbital frequencies in Hz and eccentricities
+
+        n_m_c, n_f, n_e : `int`
+            Number of nodes in log chirp mass, log frequency and eccentricity
+
+        rtol : `float`
+            Maximum relative error of a cell in the validated region
+
+        gw_lum_tol, stat_tol : `float`
+            Tolerances used for the harmonics and stationarity (see :class:`legwork.source.Source`)
+
+        n_step : `int`
+            Number of timesteps for the SNR of evolving binaries
+
+        n_validate : `int`
+            Number of random binaries in the validated region of each configuration on which to check the error
+
+        verbose : `boolean`
+            Whether to print how long each configuration took and its error estimate
+
+        Returns
+        -------
+        index : `HorizonIndex`
+            The index
+        """
+        sc_params = [{"instrument": instrument} if t is None else {"instrument": instrument, "t_obs": t * u.yr}
+                     for instrument in instruments for t in t_obs]
+        axes = (np.linspace(*np.log10(m_c_range), n_m_c), np.linspace(*np.log10(f_range), n_f),
+                np.linspace(*e_range, n_e))
+        shape = (n_m_c, n_f, n_e)
+        mid_shape = (n_m_c - 1, n_f - 1, n_e - 1)
+
+        # nodes and check points are evaluated together, broadcasting the axes rather than repeating them
+        nodes = np.meshgrid(10**axes[0], 10**axes[1], axes[2], indexing="ij", sparse=True)
+        checks = [np.meshgrid(10**((1 - t) * axes[0][:-1] + t * axes[0][1:]),
+                              10**((1 - t) * axes[1][:-1] + t * axes[1][1:]),
+                              (1 - t) * axes[2][:-1] + t * axes[2][1:], indexing="ij", sparse=True)
+                  for t in CHECK_POINTS]
+        m_c, f_orb, ecc = (np.concatenate([np.broadcast_to(nodes[a], shape).ravel()]
+                                          + [np.broadcast_to(check[a], mid_shape).ravel() for check in checks])
+                           for a in range(3))
+
+        log_snr = np.zeros((len(sc_params), *shape))
+        error = np.zeros((len(sc_params), *mid_shape))
+        for c, params in enumerate(sc_params):
+            start = time.perf_counter()
+            with np.errstate(divide="ignore"):
+                log_snr_c = np.log(get_snr(m_c * EQUAL_MASS, m_c * EQUAL_MASS, f_orb, 1.0, ecc, sc_params=params,
+                                           gw_lum_tol=gw_lum_tol, stat_tol=stat_tol, n_step=n_step))
+            log_snr[c] = log_snr_c[:np.prod(shape)].reshape(shape)
+
+            # trilinear interpolation a fraction t along the diagonal weights each corner by t for every axis on
+            # which it is the upper node and by 1 - t for the others
+            exact = log_snr_c[np.prod(shape):].reshape(len(CHECK_POINTS), *mid_shape)
+            for t, exact_t in zip(CHECK_POINTS, exact):
+                interp = sum(t**(i + j + k) * (1 - t)**(3 - i - j - k)
+                             * log_snr[c][i:i + n_m_c - 1, j:j + n_f - 1, k:k + n_e - 1]
+                             for i in (0, 1) for j in (0, 1) for k in (0, 1))
+                with np.errstate(invalid="ignore"):
+                    error[c] = np.maximum(error[c], np.abs(np.exp(interp - exact_t) - 1))
+
+            # the check points can all be on one side of a jump between the corners of a cell, so those cells are
+            # never validated
+            regime = _regime(*nodes, _t_obs(params), gw_lum_tol, stat_tol)
+            uniform = np.logical_and.reduce([regime[i:i + n_m_c - 1, j:j + n_f - 1, k:k + n_e - 1]
+                                             == regime[:-1, :-1, :-1] for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+            error[c][np.logical_not(uniform)] = np.inf
+            if verbose:
+                print("Indexed {} in {:1.1f}s".format(params, time.perf_counter() - start))
+        error[np.logical_not(np.isfinite(error))] = np.inf
+
+        index = cls(sc_params, *axes, log_snr, error, rtol, gw_lum_tol=gw_lum_tol, stat_tol=stat_tol,
+                    n_step=n_step)
+
+        # check random binaries in the validated region of each configuration (away from the nodes and check points)
+        rng = np.random.default_rng(42)
+        index.validation_error = np.zeros((len(sc_params), 3))
+        for c, params in enumerate(sc_params):
+            cells = np.unravel_index(rng.choice(np.flatnonzero(index.valid[c]), size=n_validate), mid_shape)
+            point = [10**(axes[0][cells[0]] + rng.random(n_validate) * (axes[0][1] - axes[0][0])),
+                     10**(axes[1][cells[1]] + rng.random(n_validate) * (axes[1][1] - axes[1][0])),
+                     axes[2][cells[2]] + rng.random(n_validate) * (axes[2][1] - axes[2][0])]
+            exact = get_snr(point[0] * EQUAL_MASS, point[0] * EQUAL_MASS, point[1], 1.0, point[2],
+                            sc_params=params, gw_lum_tol=gw_lum_tol, stat_tol=stat_tol, n_step=n_step)
+            check_error = np.abs(np.exp(index._interpolate(c, *point)[0]) / exact - 1)
+            index.validation_error[c] = np.percentile(check_error, [50, 99, 100])
+
+            if verbose:
+                print("{}: {:1.1f}% of cells validated to {:1.0e}, errors of random binaries: median {:1.1e}, "
+                      "99% {:1.1e}, max {:1.1e}".format(params, 100 * index.coverage[c], rtol,
+                                                        *index.validation_error[c]))
+        return index
+
+    def save(self, path):
+        """Save the index as an ``.npz`` file
+
+        Parameters
+        ----------
+        path : `str`
+            Where to save the index
+        """
+        np.savez(path, instruments=self.instruments, t_obs=self.t_obs, log_m_c=self.log_m_c, log_f=self.log_f,
+                 ecc=self.ecc, log_snr=self.log_snr, error=self.error, rtol=self.rtol, gw_lum_tol=self.gw_lum_tol,
+                 stat_tol=self.stat_tol, n_step=self.n_step, validation_error=self.validation_error)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with :meth:`save`
+
+        Parameters
+        ----------
+        path : `str`
+            Location of the index
+
+        Returns
+        -------
+        index : `HorizonIndex`
+            The index
+        """
+        data = np.load(path)
+        sc_params = [{"instrument": str(instrument), "t_obs": t * u.yr}
+                     for instrument, t in zip(data["instruments"], data["t_obs"])]
+        return cls(sc_params, data["log_m_c"], data["log_f"], data["ecc"], data["log_snr"], data["error"],
+                   float(data["rtol"]), gw_lum_tol=float(data["gw_lum_tol"]), stat_tol=float(data["stat_tol"]),
+                   n_step=int(data["n_step"]), validation_error=data["validation_error"])
+
+    def config(self, instrument="LISA", t_obs=None):
+        """Find the configuration of a detector and observation time
+
+        Parameters
+        ----------
+        instrument : `str`
+            Detector
+
+        t_obs : `float`
+            Observation time in years (None for the mission length)
+
+        Returns
+        -------
+        c : `int`
+            Index of the configuration
+        """
+        if t_obs is None:
+            t_obs = _t_obs({"instrument": instrument})
+        for c, (other, other_t_obs) in enumerate(zip(self.instruments, self.t_obs)):
+            if other == instrument and np.isclose(other_t_obs, t_obs):
+                return c
+        raise ValueError("{} with t_obs = {} yr is not in the index, it has {}".format(
+            instrument, t_obs, ["{} ({} yr)".format(*pair) for pair in zip(self.instruments, self.t_obs)]))
+
+    def _position(self, log_m_c, f_orb, ecc):
+        """Fractional position of each point on the grid along each axis, and whether it is inside the grid"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = [(log_m_c - self.log_m_c[0]) / (self.log_m_c[1] - self.log_m_c[0]),
+                 (np.log10(f_orb) - self.log_f[0]) / (self.log_f[1] - self.log_f[0]),
+                 (ecc - self.ecc[0]) / (self.ecc[1] - self.ecc[0])]
+        inside = np.logical_and.reduce([np.logical_and(x_i >= 0, x_i <= n - 1)
+                                        for x_i, n in zip(x, self.log_snr.shape[1:])])
+        return x, inside
+
+    def _interpolate(self, c, m_c, f_orb, ecc):
+        """Trilinear interpolation of log SNR at 1 kpc, along with whether each point is in the validated
+        region"""
+        x, inside = self._position(np.log10(m_c), f_orb, ecc)
+
+        # the grid is evenly spaced so the cell follows directly (no search needed)
+        i = [np.clip(np.where(inside, x_i, 0).astype(int), 0, n - 2) for x_i, n in zip(x, self.log_snr.shape[1:])]
+        w = [np.where(inside, x_i - i_i, 0) for x_i, i_i in zip(x, i)]
+        log_snr = 0
+        for corner in np.ndindex(2, 2, 2):
+            weight = np.prod([w_k if a else 1 - w_k for a, w_k in zip(corner, w)], axis=0)
+            log_snr = log_snr + weight * self.log_snr[c][i[0] + corner[0], i[1] + corner[1], i[2] + corner[2]]
+        return log_snr, np.logical_and(inside, self.valid[c][i[0], i[1], i[2]])
+
+    def _exact(self, c, m_c, f_orb, ecc):
+        """Exact SNR at 1 kpc"""
+        return get_snr(m_c * EQUAL_MASS, m_c * EQUAL_MASS, f_orb, 1.0, ecc, sc_params=self.sc_params[c],
+                       gw_lum_tol=self.gw_lum_tol, stat_tol=self.stat_tol, n_step=self.n_step)
+
+    def snr(self, m_c, f_orb, ecc=0.0, dist=1.0, instrument="LISA", t_obs=None, exact=True):
+        """SNR of any number of equal mass binaries
+
+        Parameters
+        ----------
+        m_c : `float/array`
+            Chirp mass in Msun
+
+        f_orb : `float/array`
+            Orbital frequency in Hz
+
+        ecc : `float/array`
+            Eccentricity
+
+        dist : `float/array`
+            Distance in kpc
+
+        instrument : `str`
+            Detector
+
+        t_obs : `float`
+            Observation time in years (None for the mission length)
+
+        exact : `boolean`
+            Whether to use the exact solver for binaries outside of the validated region (otherwise they are NaN)
+
+        Returns
+        -------
+        snr : `float/array`
+            SNR of each binary, with the broadcast shape of the inputs
+        """
+        c = self.config(instrument, t_obs)
+        m_c, f_orb, ecc, dist = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (m_c, f_orb, ecc, dist)))
+        log_snr, valid = self._interpolate(c, m_c, f_orb, ecc)
+
+        snr = np.full(valid.shape, np.nan)
+        snr[valid] = np.exp(log_snr[valid])
+        rest = np.logical_not(valid)
+        if exact and rest.any():
+            snr[rest] = self._exact(c, m_c[rest], f_orb[rest], ecc[rest])
+        return snr / dist
+
+    def horizon_distance(self, m_c, f_orb, ecc=0.0, snr_threshold=7, instrument="LISA", t_obs=None):
+        """Distance out to which binaries are detectable
+
+        Parameters
+        ----------
+        m_c, f_orb, ecc, instrument, t_obs
+            See :meth:`snr`
+
+        snr_threshold : `float/array`
+            SNR above which a binary is detectable, broadcast against the binaries (so use e.g.
+            ``snr_threshold[:, np.newaxis]`` for several thresholds for every binary)
+
+        Returns
+        -------
+        horizon_distance : `float/array`
+            Horizon distance of each binary in kpc
+        """
+        return self.snr(m_c, f_orb, ecc, instrument=instrument, t_obs=t_obs) / np.asarray(snr_threshold)
+
+    def detectable_fraction(self, m_c, f_orb, ecc=0.0, dist=1.0, snr_threshold=7, weights=None,
+                            instrument="LISA", t_obs=None):
+        """Fraction of a population that would be detectable if it were at each of a list of distances
+
+        Parameters
+        ----------
+        m_c, f_orb, ecc : `float/array`
+            Chirp mass (Msun), orbital frequency (Hz) and eccentricity of each binary in the population
+
+        dist : `float/array`
+            Distances in kpc
+
+        snr_threshold : `float`
+            SNR above which a binary is detectable
+
+        weights : `float/array`
+            Statistical weight of each binary (default all 1)
+
+        instrument, t_obs
+            See :meth:`snr`
+
+        Returns
+        -------
+        fraction : `float/array`
+            Weighted fraction of the population that is detectable at each distance, same shape as ``dist``
+        """
+        horizon = np.ravel(self.horizon_distance(m_c, f_orb, ecc, snr_threshold=snr_threshold,
+                                                 instrument=instrument, t_obs=t_obs))
+        weights = np.ones(len(horizon)) if weights is None else np.broadcast_to(weights, horizon.shape)
+
+        # a binary is detectable at every distance inside its horizon, so one sort answers every distance
+        order = np.argsort(horizon)
+        beyond = np.concatenate((np.cumsum(weights[order][::-1])[::-1], [0]))
+        return beyond[np.searchsorted(horizon[order], np.asarray(dist, dtype=float), side="left")] / weights.sum()
+
+    def min_chirp_mass(self, f_orb, ecc=0.0, dist=1.0, snr_threshold=7, instrument="LISA", t_obs=None,
+                       rtol=1e-3):
+        """Smallest chirp mass that is detectable at each orbital frequency, eccentricity and distance
+
+        The SNR of each configuration is interpolated at every chirp mass node and the crossing of the threshold
+        is interpolated in log chirp mass. Crossings in a cell outside of the validated region are found by
+        bisection with the exact solver instead. Below the smallest chirp mass in the index the SNR of stationary
+        binaries is extrapolated exactly with its m_c^(5/3) scaling (lighter binaries evolve even more slowly),
+        and the rest are bisected with the exact solver down to a thousandth of that chirp mass.
+
+        Parameters
+        ----------
+        f_orb, ecc : `float/array`
+            Orbital frequency (Hz) and eccentricity
+
+        dist : `float/array`
+            Distance in kpc
+
+        snr_threshold : `float/array`
+            SNR above which a binary is detectable
+
+        instrument, t_obs
+            See :meth:`snr`
+
+        rtol : `float`
+            Relative tolerance of the chirp mass found by bisection
+
+        Returns
+        -------
+        m_c : `float/array`
+            Minimum detectable chirp mass in Msun, NaN where no chirp mass in the index is detectable, with the
+            broadcast shape of the inputs
+        """
+        c = self.config(instrument, t_obs)
+        f_orb, ecc, dist, snr_threshold = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                                                for a in (f_orb, ecc, dist, snr_threshold)))
+        shape = f_orb.shape
+        f_orb, ecc, target = f_orb.ravel(), ecc.ravel(), np.log(snr_threshold * dist).ravel()
+        n_m_c = len(self.log_m_c)
+
+        # log SNR along every chirp mass node, shape (queries, nodes)
+        x, inside = self._position(np.full(len(f_orb), self.log_m_c[0]), f_orb, ecc)
+        j = np.clip(np.where(inside, x[1], 0).astype(int), 0, len(self.log_f) - 2)
+        k = np.clip(np.where(inside, x[2], 0).astype(int), 0, len(self.ecc) - 2)
+        w_f, w_e = np.where(inside, x[1] - j, 0)[:, np.newaxis], np.where(inside, x[2] - k, 0)[:, np.newaxis]
+        table = self.log_snr[c].transpose(1, 2, 0)
+        log_snr = (1 - w_f) * ((1 - w_e) * table[j, k] + w_e * table[j, k + 1]) \
+            + w_f * ((1 - w_e) * table[j + 1, k] + w_e * table[j + 1, k + 1])
+
+        # first node above the target, interpolating the crossing in log chirp mass from the node below
+        above = log_snr >= target[:, np.newaxis]
+        first = np.argmax(above, axis=1)
+        found = np.logical_and(inside, above.any(axis=1))
+        m_c = np.full(len(f_orb), np.nan)
+
+        m_c_low = 10**self.log_m_c[0]
+        below_range = np.logical_and(found, first == 0)
+        below_range[below_range] = determine_stationarity(m_c_low * EQUAL_MASS, m_c_low * EQUAL_MASS,
+                                                          f_orb[below_range], self.t_obs[c], ecc[below_range],
+                                                          stat_tol=self.stat_tol)
+        m_c[below_range] = m_c_low * np.exp(0.6 * (target[below_range] - log_snr[below_range, 0]))
+        evolving_low = np.flatnonzero(np.logical_and.reduce((found, first == 0, np.logical_not(below_range))))
+
+        cross = np.flatnonzero(np.logical_and(found, first > 0))
+        lower, upper = log_snr[cross, first[cross] - 1], log_snr[cross, first[cross]]
+        frac = (target[cross] - lower) / (upper - lower)
+        m_c[cross] = 10**(self.log_m_c[first[cross] - 1] + frac * (self.log_m_c[1] - self.log_m_c[0]))
+
+        # bisect with the exact solver where the crossing is in a cell outside of the validated region
+        valid = self.valid[c][np.clip(first[cross] - 1, 0, n_m_c - 2), j[cross], k[cross]]
+        bisect = cross[np.logical_not(valid)]
+        outside = np.flatnonzero(np.logical_not(inside))
+        if len(bisect) > 0:
+            m_c[bisect] = self._bisect(c, f_orb[bisect], ecc[bisect], target[bisect],
+                                       10**self.log_m_c[first[bisect] - 1], 10**self.log_m_c[first[bisect]], rtol)
+        if len(evolving_low) > 0:
+            m_c[evolving_low] = self._bisect(c, f_orb[evolving_low], ecc[evolving_low], target[evolving_low],
+                                             np.full(len(evolving_low), 1e-3 * m_c_low),
+                                             np.full(len(evolving_low), m_c_low), rtol)
+        if len(outside) > 0:
+            m_c[outside] = self._bisect(c, f_orb[outside], ecc[outside], target[outside],
+                                        np.full(len(outside), 10**self.log_m_c[0]),
+                                        np.full(len(outside), 10**self.log_m_c[-1]), rtol)
+        return m_c.reshape(shape)
+
+    def _bisect(self, c, f_orb, ecc, target, low, high, rtol):
+        """Bisect in log chirp mass with the exact solver for the chirp mass at which log SNR reaches the target,
+        NaN if even ``high`` doesn't"""
+        m_c = np.full(len(f_orb), np.nan)
+        with np.errstate(divide="ignore"):
+            reached = np.log(self._exact(c, high, f_orb, ecc)) >= target
+        low, high, f_orb, ecc, target = low[reached], high[reached], f_orb[reached], ecc[reached], target[reached]
+        while len(high) > 0 and np.max(high / low) > 1 + rtol:
+            mid = np.sqrt(low * high)
+            with np.errstate(divide="ignore"):
+                detectable = np.log(self._exact(c, mid, f_orb, ecc)) >= target
+            high, low = np.where(detectable, mid, high), np.where(detectable, low, mid)
+        m_c[reached] = high
+        return m_c
+
+
+def load_index(instruments=["LISA"], t_obs=[None], rebuild=False, verbose=False, **kwargs):
+    """Load the index of some detector configurations from ``paths.data``, building and saving it first if it
+    doesn't exist yet (or if LEGWORK or any of the scripts that build it, e.g. :mod:`unitless`, have changed)
+
+    Parameters
+    ----------
+    instruments : `list`
+        Detectors to index
+
+    t_obs : `list`
+        Observation times in years to index for every detector (None for the mission length)
+
+    rebuild : `boolean`
+        Whether to build the index even if it has already been saved
+
+    verbose : `boolean`
+        Whether to print the error estimate when building the index
+
+    **kwargs
+        Passed to :meth:`HorizonIndex.build`
+
+    Returns
+    -------
+    index : `HorizonIndex`
+        The index
+    """
+    path = paths.data / "horizon_index_{}.npz".format(cache_key(HorizonIndex.build, instruments, t_obs,
+                                                                **kwargs)[:16])
+    if path.exists() and not rebuild:
+        return HorizonIndex.load(path)
+
+    index = HorizonIndex.build(instruments, t_obs, verbose=verbose, **kwargs)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    index.save(path)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the horizon index of some detectors and report its error")
+    parser.add_argument("instruments", nargs="*", default=["LISA"], help="detectors to index")
+    parser.add_argument("--t-obs", type=float, nargs="*", help="observation times in years (default: mission "
+                        "length)")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index if it already exists")
+    args = parser.parse_args()
+
+    index = load_index(args.instruments, [None] if args.t_obs is None else args.t_obs, rebuild=args.rebuild,
+                       verbose=True)
+    for c in range(len(index.sc_params)):
+        print("{} ({:1.1f} yr): {:1.1f}% of cells validated to {:1.0e}, errors of random binaries: median {:1.1e}, "
+              "99% {:1.1e}, max {:1.1e}".format(index.instruments[c], index.t_obs[c], 100 * index.coverage[c],
+                                                index.rtol, *index.validation_error[c]))
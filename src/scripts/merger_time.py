@@ -1,8 +1,10 @@
-import legwork as lw
 import numpy as np
 import astropy.units as u
 import matplotlib.pyplot as plt
 import paths
+import fidelity
+import profiling  # noqa: F401 (times the stages of this script when LEGWORK_PROFILE is set)
+import rendering
 
 plt.rc('font', family='serif')
 plt.rcParams['text.usetex'] = False
@@ -21,40 +23,38 @@ params = {'figure.figsize': (12, 8),
           'ytick.minor.size': 4}
 plt.rcParams.update(params)
 
-f_range = np.logspace(-5, -1, 100) * u.Hz
-e_range = np.linspace(0, 0.99, 500)
+# load the grid from `compute_merger_time.py`
+data = np.load(paths.data / "merger_time.npz")
+f_range = data["f_range"] * u.Hz
+e_range = data["e_range"]
+m_1 = data["m_1"] * u.Msun
+m_2 = data["m_2"] * u.Msun
+t_merge = data["t_merge"] * u.yr
 
-m_1 = np.repeat(10, len(f_range) * len(e_range)) * u.Msun
-m_2 = np.repeat(10, len(f_range) * len(e_range)) * u.Msun
-
-F, E = np.meshgrid(f_range, e_range)
-
-t_merge = lw.evol.get_t_merge_ecc(ecc_i=E.flatten(), f_orb_i=F.flatten(), m_1=m_1, m_2=m_2,
-                                  small_e_tol=0.15, large_e_tol=0.9999).reshape(F.shape)
 fig, ax = plt.subplots()
 
-cont = ax.contourf(F, E, np.log10(t_merge.to(u.yr).value), cmap="plasma_r", levels=np.linspace(-6, 10, 17))
+cont = ax.contourf(f_range, e_range, np.log10(t_merge.to(u.yr).value), cmap="plasma_r", levels=np.linspace(-6, 10, 17))
 cbar = fig.colorbar(cont, label=r"Merger time, $\log_{10} (t_{\rm merge} / {\rm yr})$")
 ax.set_xscale("log")
 
-# hide edges that show up in rendered PDFs
-for c in cont.collections:
-    c.set_edgecolor("face")
+# rasterize the filled contours, everything else stays vector
+rendering.heavy(cont)
 
 mass_string = ""
-mass_string += r"$m_1 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_1[0].value)
+mass_string += r"$m_1 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_1.value)
 mass_string += "\n"
-mass_string += r"$m_2 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_2[0].value)
+mass_string += r"$m_2 = {{{}}} \, {{ \rm M_{{\odot}}}}$".format(m_2.value)
 ax.annotate(mass_string, xy=(0.5, 0.04), xycoords="axes fraction", fontsize=0.6*fs,
             bbox=dict(boxstyle="round", color="white", ec="white", alpha=0.5), ha="center", va="bottom")
 
 ax.set_xlabel(r"Orbital frequency, $f_{\rm orb} \, [\rm Hz]$")
 ax.set_ylabel(r"Eccentricity, $e$")
 
-mission_length = ax.contour(F, E, np.log10(t_merge.to(u.yr).value), levels=np.log10([4]),
+mission_length = ax.contour(f_range, e_range, np.log10(t_merge.to(u.yr).value), levels=np.log10([4]),
                             linestyles="--", linewidths=2)
 ax.clabel(mission_length, fmt={np.log10(4): r"$t_{\rm merge} = 4\,{\rm years}$"}, fontsize=0.7*fs, manual=[(1e-2, 0.5)])
 
-ax.set_rasterization_zorder(10000)
+fidelity.mark(fig, data["fidelity"])
 
-plt.savefig(paths.figures / "merger_time.pdf", format="pdf", bbox_inches="tight")
\ No newline at end of file
+rendering.save(fig, paths.figures / "merger_time.pdf", format="pdf", bbox_inches="tight",
+               metadata=fidelity.metadata(data["fidelity"]))
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""SNR of one set of sources for several detector configurations at once.
+
+Computing the SNR of a :class:`legwork.source.Source` for a second detector with
+``sources.update_sc_params(...)`` repeats everything (the masks, the orbital evolution and the strain in
+every harmonic) even though only the noise curve has changed. Here the source side of the calculation is done
+once and each configuration only evaluates its own power spectral density at the harmonic frequencies.
+Configurations with the same observation time share the orbital evolution of evolving sources, and the
+stationary strains are shared by every configuration.
+"""
+import functools
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+from scipy.interpolate import interp1d
+from psd_engine import PSDEngine
+from t_merge_table import get_t_merge_ecc
+
+__all__ = ["snr_multi_detector"]
+
+# harmonic groups used by `legwork.source.Source` so that results match exactly
+HARMONIC_GROUPS = [(1, 10), (10, 100), (100, 1000), (1000, 10000)]
+
+
+def _noise_functions(engine, interpolate):
+    """PSD of each configuration of a :class:`PSDEngine` as a function of frequency, interpolated in the same
+    way as a Source if needed (the curves are evaluated together so that configurations can share their
+    instrument noise)"""
+    if not interpolate:
+        return [functools.partial(lambda f, i: engine.exact(f, which_configs=[i])[0], i=i)
+                for i in range(engine.n_configs)]
+
+    frequency_range = np.logspace(-7, np.log10(2), 10000) * u.Hz
+    curves = engine.exact(frequency_range)
+    noise = []
+    for sc in curves:
+        interp_sc = interp1d(frequency_range, sc, bounds_error=False, fill_value=1e30)
+        noise.append(functools.partial(lambda f, interp_sc: interp_sc(f.to(u.Hz)) / u.Hz, interp_sc=interp_sc))
+    return noise
+
+
+def _stationary_terms(sources, mask):
+    """Harmonic frequencies and the strain part of the SNR^2 (without t_obs) of stationary sources
+
+    Returns a list of (source mask, h_0_n^2, f_n) tuples, each with shape (n_sources, n_harmonics)
+    """
+    terms = []
+    c_mask = np.logical_and(mask, sources.ecc <= sources.ecc_tol)
+    e_mask = np.logical_and(mask, sources.ecc > sources.ecc_tol)
+
+    if c_mask.any():
+        position = sources.position[c_mask] if sources.position is not None else None
+        polarisation = sources.polarisation[c_mask] if sources.position is not None else None
+        inclination = sources.inclination[c_mask] if sources.position is not None else None
+        h_0_2 = lw.strain.h_0_n(m_c=sources.m_c[c_mask], f_orb=sources.f_orb[c_mask],
+                                ecc=np.zeros(c_mask.sum()), n=2, dist=sources.dist[c_mask],
+                                position=position, polarisation=polarisation, inclination=inclination,
+                                interpolated_g=sources.g).flatten()**2
+        terms.append((c_mask, h_0_2[:, np.newaxis], 2 * sources.f_orb[c_mask][:, np.newaxis]))
+
+    if e_mask.any():
+        harmonics_required = sources.harmonics_required(sources.ecc)
+        for lower, upper in HARMONIC_GROUPS:
+            match = np.logical_and.reduce((harmonics_required > lower, harmonics_required <= upper, e_mask))
+            if not match.any():
+                continue
+            n_range = np.arange(1, upper + 1).astype(int)
+            h_0_n_2 = lw.strain.h_0_n(m_c=sources.m_c[match], f_orb=sources.f_orb[match],
+                                      ecc=sources.ecc[match], n=n_range, dist=sources.dist[match],
+                                      interpolated_g=sources.g)**2
+            h_0_n_2 = h_0_n_2.reshape(match.sum(), upper)
+            terms.append((match, h_0_n_2, n_range[np.newaxis, :] * sources.f_orb[match][:, np.newaxis]))
+
+    return terms
+
+
+def _evolving_terms(sources, mask, t_obs, n_step):
+    """Harmonic frequencies and characteristic strains of evolving sources over an observation
+
+    Returns a list of (source mask, h_c_n^2, f_n) tuples, each with shape (n_sources, n_step, n_harmonics)
+    """
+    terms = []
+    c_mask = np.logical_and(mask, sources.ecc <= sources.ecc_tol)
+    e_mask = np.logical_and(mask, sources.ecc > sources.ecc_tol)
+
+    if c_mask.any():
+        m_1, m_2, f_orb_i = sources.m_1[c_mask], sources.m_2[c_mask], sources.f_orb[c_mask]
+        if sources.t_merge is None:
+            t_merge = lw.evol.get_t_merge_circ(m_1=m_1, m_2=m_2, f_orb_i=f_orb_i)
+        else:
+            t_merge = sources.t_merge[c_mask]
+        t_evol = np.minimum(t_merge - (1 * u.s), t_obs)
+        f_orb_evol = lw.evol.evol_circ(t_evol=t_evol, n_step=n_step, m_1=m_1, m_2=m_2, f_orb_i=f_orb_i)
+
+        # replace the frequency of merged timesteps by the last frequency before the merger
+        merged = f_orb_evol == 1e2 * u.Hz
+        maxes = np.where(merged, -1 * u.Hz, f_orb_evol).max(axis=1)
+        f_orb_evol = np.where(merged, maxes[:, np.newaxis], f_orb_evol)
+
+        h_c_2 = lw.strain.h_c_n(m_c=sources.m_c[c_mask], f_orb=f_orb_evol, ecc=np.zeros(f_orb_evol.shape),
+                                n=2, dist=sources.dist[c_mask], interpolated_g=sources.g)**2
+        h_c_2 = h_c_2.reshape(c_mask.sum(), n_step)
+        terms.append((c_mask, h_c_2[..., np.newaxis], 2 * f_orb_evol[..., np.newaxis]))
+
+    if e_mask.any():
+        harmonics_required = sources.harmonics_required(sources.ecc)
+        t_before = 0.1 * u.yr
+        for lower, upper in HARMONIC_GROUPS:
+            match = np.logical_and.reduce((harmonics_required > lower, harmonics_required <= upper, e_mask))
+            if not match.any():
+                continue
+            m_1, m_2, f_orb_i = sources.m_1[match], sources.m_2[match], sources.f_orb[match]
+            ecc = sources.ecc[match]
+            if sources.t_merge is None:
+                t_merge = get_t_merge_ecc(m_1=m_1, m_2=m_2, f_orb_i=f_orb_i, ecc_i=ecc)
+            else:
+                t_merge = sources.t_merge[match]
+            t_evol = np.minimum(t_merge - t_before, t_obs).to(u.s)
+            e_evol, f_orb_evol = lw.evol.evol_ecc(ecc_i=ecc, t_evol=t_evol, n_step=n_step, m_1=m_1, m_2=m_2,
+                                                  f_orb_i=f_orb_i, n_proc=sources.n_proc, t_before=t_before,
+                                                  t_merge=t_merge)
+
+            merged = np.logical_and(e_evol == 0.0, f_orb_evol == 1e2 * u.Hz)
+            maxes = np.where(merged, -1 * u.Hz, f_orb_evol).max(axis=1)
+            f_orb_evol = np.where(f_orb_evol == 1e2 * u.Hz, maxes[:, np.newaxis], f_orb_evol)
+
+            harms = np.arange(1, upper + 1).astype(int)
+            m_c, dist = sources.m_c[match], sources.dist[match]
+            if sources.g is not None and len(ecc) == 1:
+                # `legwork.strain.h_c_n` only puts interpolated g(n, e) back in order for more than one source
+                h_c_n_2 = lw.strain.h_c_n(m_c=np.repeat(m_c, 2), f_orb=np.repeat(f_orb_evol, 2, axis=0),
+                                          ecc=np.repeat(e_evol, 2, axis=0), n=harms, dist=np.repeat(dist, 2),
+                                          interpolated_g=sources.g)[:1]**2
+            else:
+                h_c_n_2 = lw.strain.h_c_n(m_c=m_c, f_orb=f_orb_evol, ecc=e_evol, n=harms, dist=dist,
+                                          interpolated_g=sources.g)**2
+            terms.append((match, h_c_n_2, harms[np.newaxis, np.newaxis, :] * f_orb_evol[..., np.newaxis]))
+
+    return terms
+
+
+def snr_multi_detector(sources, sc_params, n_step=100, which_sources=None, verbose=False):
+    """Compute the SNR of a set of sources for several detector configurations
+
+    This gives the same result as calling :meth:`legwork.source.Source.get_snr` after
+    :meth:`legwork.source.Source.update_sc_params` for each configuration in turn, but computes the
+    orbital evolution and the strain in each harmonic only once.
+
+    Parameters
+    ----------
+    sources : `legwork.source.Source`
+        Sources for which to compute the SNR
+
+    sc_params : `list of dicts`
+        Sensitivity curve parameters for each detector configuration, with the same keys as the
+        ``sc_params`` of :class:`legwork.source.Source` (e.g. ``[{"instrument": "LISA"},
+        {"instrument": "TianQin"}, {"instrument": "LISA", "t_obs": 10 * u.yr}]``)
+
+    n_step : `int`
+        Number of time steps during the observation for evolving sources
+
+    which_sources : `bool/array`
+        Mask of which sources to calculate the SNR for, SNR is 0 for the rest (default all sources)
+
+    verbose : `boolean`
+        Whether to print how many sources there are in each group
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR of each source for each configuration, shape (len(sc_params), sources.n_sources)
+    """
+    engine = PSDEngine(sc_params)
+    t_obs_list = [params["t_obs"].to(u.yr) for params in engine.configs]
+    snr_2 = np.zeros((engine.n_configs, sources.n_sources))
+
+    insp = np.logical_not(sources.merged)
+    if which_sources is not None:
+        insp = np.logical_and(insp, which_sources)
+
+    # stationarity only depends on the observation time (and any source that is stationary for a long
+    # mission is stationary for a shorter one), so the shortest mission covers every stationary source
+    t_obs_values = sorted(set(t_obs.value for t_obs in t_obs_list))
+    stat_masks = {}
+    for t in t_obs_values:
+        stationary = lw.evol.determine_stationarity(m_c=sources.m_c, f_orb_i=sources.f_orb, t_evol=t * u.yr,
+                                                    ecc_i=sources.ecc, stat_tol=sources.stat_tol)
+        stat_masks[t] = np.logical_and(insp, stationary)
+    stationary_terms = _stationary_terms(sources, stat_masks[t_obs_values[0]])
+
+    noise = _noise_functions(engine, sources.interpolate_sc)
+
+    # stationary: SNR^2 = sum_n h_0_n^2 t_obs / S(f_n)
+    for match, h_0_n_2, f_n in stationary_terms:
+        for i, t_obs in enumerate(t_obs_list):
+            keep = stat_masks[t_obs.value][match]
+            if not keep.any():
+                continue
+            psd = noise[i](f_n[keep].flatten()).reshape(f_n[keep].shape)
+            snr_2[i, np.flatnonzero(match)[keep]] = (h_0_n_2[keep] * t_obs / psd).decompose().value.sum(axis=1)
+
+    # evolving: SNR^2 = sum_n int h_c_n^2 / (f_n^2 S(f_n)) df_n, with the evolution shared for each t_obs
+    for t in t_obs_values:
+        evol_mask = np.logical_and(insp, np.logical_not(stat_masks[t]))
+        if verbose:
+            print("t_obs = {:1.2f} yr: {} stationary and {} evolving sources".format(
+                t, stat_masks[t].sum(), evol_mask.sum()))
+        if not evol_mask.any():
+            continue
+        for match, h_c_n_2, f_n in _evolving_terms(sources, evol_mask, t * u.yr, n_step):
+            for i, t_obs in enumerate(t_obs_list):
+                if t_obs.value != t:
+                    continue
+                h_c_noise_2 = f_n**2 * noise[i](f_n.flatten()).reshape(f_n.shape)
+                snr_n_2 = np.trapz(y=h_c_n_2 / h_c_noise_2, x=f_n, axis=1)
+                snr_2[i, match] = snr_n_2.decompose().value.sum(axis=1)
+
+    return snr_2**0.5
@@ -0,0 +1,268 @@
+"""Compute SNRs (or anything else per source) of a :class:`legwork.source.Source` on several cores.
+
+The SNR of each source doesn't depend on any of the others, so a Source can be split into contiguous shards that
+are evaluated in a pool of worker processes. The pool is forked after the job is set up, so workers see the
+parent's Source (and its interpolated g(n, e) and sensitivity curve) through shared copy-on-write pages rather
+than having the inputs pickled and sent to them, and they write their results straight into output arrays in
+shared memory. Only the index of each shard goes through a pipe. Results come back in the original order and
+are identical to computing them serially, e.g.
+
+    snr = get_snr_parallel(sources, n_workers=8, merger_time=True, verbose=True)
+
+The number of workers defaults to the ``LEGWORK_WORKERS`` environment variable (or every core if it isn't set).
+"""
+import copy
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+from multi_detector import HARMONIC_GROUPS
+
+__all__ = ["default_workers", "shard_sources", "map_shards", "get_snr_parallel"]
+
+# attributes of a Source with one entry per source that are sliced for each shard (results are left out so
+# that a shard never writes into the arrays of the full Source)
+PER_SOURCE_ATTRIBUTES = ["m_1", "m_2", "m_c", "ecc", "dist", "f_orb", "a", "position", "inclination",
+                         "polarisation", "weights", "merged", "t_merge"]
+
+# job of the current pool, set before forking so that workers inherit it
+_job = None
+
+
+def default_workers():
+    """Number of workers to use when none is given, ``LEGWORK_WORKERS`` if set and otherwise every core
+
+    Returns
+    -------
+    n_workers : `int`
+        Number of worker processes
+    """
+    n_workers = os.environ.get("LEGWORK_WORKERS")
+    if n_workers is None:
+        return os.cpu_count() or 1
+    if not n_workers.isdigit() or int(n_workers) < 1:
+        raise ValueError("LEGWORK_WORKERS: `{}` is not a positive integer".format(n_workers))
+    return int(n_workers)
+
+
+def shard_sources(sources, rows):
+    """Create a Source that contains only some of the sources without recomputing anything
+
+    Parameters
+    ----------
+    sources : `legwork.source.Source`
+        Sources to take the shard from
+
+    rows : `slice` or `int/array`
+        Which sources to take
+
+    Returns
+    -------
+    shard : `legwork.source.Source`
+        Shallow copy of ``sources`` (sharing its interpolated functions) with every per-source attribute sliced
+    """
+    shard = copy.copy(sources)
+    for attribute in PER_SOURCE_ATTRIBUTES:
+        value = getattr(sources, attribute, None)
+        if value is not None:
+            setattr(shard, attribute, value[rows])
+    shard.snr, shard.max_snr_harmonic = None, None
+    shard._sc_params = dict(sources._sc_params)
+    shard.n_sources = len(shard.m_1)
+    return shard
+
+
+def _lone_sources(sources, which_sources=None, t_obs=None):
+    """Evolving eccentric sources that are the only source in their harmonic group
+
+    :meth:`legwork.source.Source.get_snr` only puts the interpolated g(n, e) of a group back into the order of
+    its sources if there is more than one of them, so a lone source would get the wrong SNR
+    """
+    if sources.g is None:
+        return np.array([], dtype=int)
+    evolving = np.logical_and(sources.get_source_mask(circular=False, stationary=False, t_obs=t_obs),
+                              np.logical_not(sources.merged))
+    if which_sources is not None:
+        evolving = np.logical_and(evolving, which_sources)
+    harmonics_required = sources.harmonics_required(sources.ecc)
+    lone = []
+    for lower, upper in HARMONIC_GROUPS:
+        match = np.flatnonzero(np.logical_and.reduce((evolving, harmonics_required > lower,
+                                                       harmonics_required <= upper)))
+        if len(match) == 1:
+            lone.append(match[0])
+    return np.array(lone, dtype=int)
+
+
+def _run_shard(index):
+    """Evaluate one shard of the current job and write its results into shared memory"""
+    start = time.perf_counter()
+    rows = _job["shards"][index]
+    results = _job["func"](shard_sources(_job["sources"], rows), rows)
+    for name, output in _job["outputs"].items():
+        output[rows] = results[name]
+    return index, rows.stop - rows.start, time.perf_counter() - start
+
+
+def map_shards(sources, func, outputs, n_workers=None, shard_size=None, progress=None):
+    """Apply a function to shards of a Source in a pool of worker processes
+
+    Parameters
+    ----------
+    sources : `legwork.source.Source`
+        Sources to split into shards
+
+    func : `function`
+        Function called as ``func(shard, rows)`` for each shard, where ``rows`` is the slice of ``sources`` in
+        the shard (e.g. for slicing a mask), that returns a dict of arrays with one entry per source in the
+        shard. It doesn't need to be picklable.
+
+    outputs : `dict`
+        Name and dtype of each array returned by ``func``
+
+    n_workers : `int`
+        Number of worker processes (default :func:`default_workers`), ``func`` is called once on every source
+        in this process if this is 1
+
+    shard_size : `int`
+        Number of sources in each shard (default splits the sources into four shards per worker so that shards
+        of mostly eccentric sources don't hold up the others)
+
+    progress : `function`
+        Called as ``progress(n_done, n_shards, n_sources_done, n_sources, run_time)`` in this process after each
+        shard finishes (``run_time`` is how long the shard took)
+
+    Returns
+    -------
+    results : `dict`
+        Array of each output for every source, in the same order as ``sources``
+    """
+    global _job
+    n_workers = default_workers() if n_workers is None else n_workers
+    n_sources = sources.n_sources
+    if shard_size is None:
+        shard_size = int(np.ceil(n_sources / (4 * n_workers)))
+    shards = [slice(start, min(start + shard_size, n_sources)) for start in range(0, n_sources, shard_size)]
+
+    if n_workers == 1 or len(shards) <= 1:
+        start = time.perf_counter()
+        results = func(sources, slice(0, n_sources))
+        if progress is not None:
+            progress(1, 1, n_sources, n_sources, time.perf_counter() - start)
+        return {name: np.asarray(results[name], dtype=dtype) for name, dtype in outputs.items()}
+
+    blocks, shared = [], {}
+    try:
+        for name, dtype in outputs.items():
+            dtype = np.dtype(dtype)
+            block = shared_memory.SharedMemory(create=True, size=max(n_sources * dtype.itemsize, 1))
+            blocks.append(block)
+            shared[name] = np.ndarray(n_sources, dtype=dtype, buffer=block.buf)
+            shared[name][:] = 0
+
+        _job = {"sources": sources, "func": func, "shards": shards, "outputs": shared}
+        n_done, n_sources_done = 0, 0
+        with multiprocessing.get_context("fork").Pool(min(n_workers, len(shards))) as pool:
+            for _, n_shard, run_time in pool.imap_unordered(_run_shard, range(len(shards))):
+                n_done += 1
+                n_sources_done += n_shard
+                if progress is not None:
+                    progress(n_done, len(shards), n_sources_done, n_sources, run_time)
+        return {name: array.copy() for name, array in shared.items()}
+    finally:
+        _job = None
+        shared.clear()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def get_snr_parallel(sources, n_workers=None, shard_size=None, merger_time=False, which_sources=None,
+                     progress=None, verbose=False, **kwargs):
+    """Parallel version of :meth:`legwork.source.Source.get_snr`
+
+    The SNR, maximum SNR harmonic and (if requested) merger time of every source are saved in ``sources`` just
+    as they would be by the serial methods.
+
+    Parameters
+    ----------
+    sources : `legwork.source.Source`
+        Sources for which to compute the SNR
+
+    n_workers, shard_size : `int`
+        Number of worker processes and sources per shard (see :func:`map_shards`)
+
+    merger_time : `boolean` or `function`
+        Whether to also compute merger times with :meth:`legwork.source.Source.get_merger_time` in each shard
+        before the SNR, or a function of a Source that does it instead (e.g.
+        :func:`t_merge_table.get_merger_time`). Merger times that are already in ``sources`` are used as is.
+
+    which_sources : `boolean/array`
+        Mask of which sources to calculate the SNR for (others get an SNR of 0)
+
+    progress : `function`
+        Called after each shard finishes (see :func:`map_shards`)
+
+    verbose : `boolean`
+        Whether to print the progress after each shard
+
+    **kwargs
+        Passed to :meth:`legwork.source.Source.get_snr` (e.g. ``t_obs`` or ``n_step``)
+
+    Returns
+    -------
+    snr : `array`
+        SNR of each source
+    """
+    compute_merger_time = merger_time is not False and sources.t_merge is None
+    merger_time_func = lw.source.Source.get_merger_time if merger_time is True else merger_time
+
+    def shard_snr(shard, rows):
+        results = {}
+        if compute_merger_time:
+            merger_time_func(shard)
+            results["t_merge"] = shard.t_merge.to(u.Gyr).value
+        which = None if which_sources is None else which_sources[rows]
+
+        # a shard can leave a source alone in its harmonic group when it wasn't in the full Source, so pad
+        # the group with a copy of it to get the same SNR as the serial calculation
+        n_shard = shard.n_sources
+        lone = _lone_sources(shard, which, kwargs.get("t_obs"))
+        if len(lone) > 0:
+            shard = shard_sources(shard, np.concatenate((np.arange(n_shard), lone)))
+            which = None if which is None else np.concatenate((which, which[lone]))
+
+        results["snr"] = shard.get_snr(which_sources=which, **kwargs)[:n_shard]
+        results["max_snr_harmonic"] = np.zeros(n_shard, dtype=int) if shard.max_snr_harmonic is None \
+            else shard.max_snr_harmonic[:n_shard]
+        return results
+
+    outputs = {"snr": float, "max_snr_harmonic": int}
+    if compute_merger_time:
+        outputs["t_merge"] = float
+
+    if verbose:
+        n_workers = default_workers() if n_workers is None else n_workers
+        n_snr = sources.n_sources if which_sources is None else np.count_nonzero(which_sources)
+        print("Calculating SNR for {} sources on {} workers".format(n_snr, n_workers))
+        start = time.perf_counter()
+
+        def report(n_done, n_shards, n_sources_done, n_sources, run_time):
+            print("\tshard {}/{} done in {:1.2f}s, {}/{} sources after {:1.1f}s".format(
+                n_done, n_shards, run_time, n_sources_done, n_sources, time.perf_counter() - start))
+            if progress is not None:
+                progress(n_done, n_shards, n_sources_done, n_sources, run_time)
+    else:
+        report = progress
+
+    results = map_shards(sources, shard_snr, outputs, n_workers=n_workers, shard_size=shard_size,
+                         progress=report)
+    if compute_merger_time:
+        sources.t_merge = results["t_merge"] * u.Gyr
+    sources.snr = results["snr"]
+    sources.max_snr_harmonic = results["max_snr_harmonic"]
+    return sources.snr
@@ -0,0 +1,236 @@
+"""Opt-in timing of the stages of every figure script.
+
+Set ``LEGWORK_PROFILE=1`` (e.g. ``LEGWORK_PROFILE=1 showyourwork build``) and each script that imports this
+module records named spans with their wall time, CPU time, peak memory and the sizes of the arrays involved, and
+writes them to ``src/tex/output/profile/<script>.json`` when it finishes. The expensive library calls (Source
+setup, SNRs, merger times, orbital evolution, PSD evaluation, sensitivity curves, contouring and writing
+figures) are wrapped in spans automatically, and scripts can mark their own stages with
+
+    with profiling.span("snr", n_sources=len(f_orb)):
+        ...
+
+At the end of a successful build the Snakefile runs ``python src/scripts/profiling.py``, which combines the reports
+of that build into ``src/tex/output/profile.json`` and prints the slowest stages across all figures. Each report
+records the ``LEGWORK_BUILD_ID`` that the Snakefile sets once per build (a script run by hand is a build of its
+own), and only the reports of the latest build are combined, so scripts that Snakemake skipped because they were up
+to date don't bring in spans from earlier builds or other fidelity modes. When ``LEGWORK_PROFILE`` is not set
+nothing is wrapped and :func:`span` returns a shared object that does nothing.
+"""
+import atexit
+import functools
+import json
+import os
+import resource
+import sys
+import time
+
+import paths
+
+__all__ = ["enabled", "span", "write_report", "summary"]
+
+enabled = os.environ.get("LEGWORK_PROFILE", "0").strip().lower() not in ("", "0", "false", "no", "off")
+
+# where each script writes its report and where the combined report goes
+report_dir = paths.tex / "output" / "profile"
+combined_report = paths.tex / "output" / "profile.json"
+
+_records = []
+_stack = []
+_start = (time.perf_counter(), time.process_time())
+_written = False
+
+# build that this script is part of, set by the Snakefile (otherwise this run is a build of its own)
+build_id = os.environ.get("LEGWORK_BUILD_ID") or "{}-{}".format(time.strftime("%Y%m%dT%H%M%S"), os.getpid())
+
+
+def _max_rss_mb():
+    """Peak resident set size of this process so far in MB (ru_maxrss is in kB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _describe(value):
+    """Size of an array-like value (or the value itself for plain numbers)"""
+    if hasattr(value, "shape"):
+        return {"shape": list(value.shape), "nbytes": int(getattr(value, "nbytes", 0))}
+    if isinstance(value, (list, tuple)):
+        return {"shape": [len(value)]}
+    return value
+
+
+class _Span():
+    """Timer for one stage, use through :func:`span`"""
+    def __init__(self, name, sizes):
+        self.name = name
+        self.sizes = {key: _describe(value) for key, value in sizes.items()}
+
+    def add(self, **sizes):
+        """Record more sizes, e.g. of arrays that only exist once the stage is running"""
+        self.sizes.update({key: _describe(value) for key, value in sizes.items()})
+
+    def __enter__(self):
+        _stack.append(self.name)
+        self.path = "/".join(_stack)
+        self.rss = _max_rss_mb()
+        self.start = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall, cpu = time.perf_counter() - self.start, time.process_time() - self.cpu
+        _stack.pop()
+        rss = _max_rss_mb()
+        _records.append({"name": self.name, "path": self.path, "depth": self.path.count("/"),
+                         "start": self.start - _start[0], "wall_time": wall, "cpu_time": cpu,
+                         "peak_rss_mb": rss, "rss_growth_mb": rss - self.rss, "sizes": self.sizes})
+        return False
+
+
+class _NullSpan():
+    """Stand-in for :class:`_Span` when profiling is off"""
+    def add(self, **sizes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **sizes):
+    """Time a stage of a script
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the stage, spans opened inside it are recorded as ``outer/inner``
+
+    **sizes
+        Sizes to record with the span, arrays are stored as their shape and size in bytes
+
+    Returns
+    -------
+    span : context manager
+        Use in a ``with`` statement, its ``add`` method records more sizes
+    """
+    return _Span(name, sizes) if enabled else _NULL_SPAN
+
+
+def _wrap(owner, attribute, name, sizes=None):
+    """Replace ``owner.attribute`` by a version that runs inside a span"""
+    function = getattr(owner, attribute, None)
+    if function is None or getattr(function, "_profiled", False):
+        return
+
+    @functools.wraps(function)
+    def wrapped(*args, **kwargs):
+        with span(name) as s:
+            result = function(*args, **kwargs)
+            if sizes is not None:
+                try:
+                    s.add(**sizes(args, kwargs, result))
+                except Exception:
+                    pass
+            return result
+
+    wrapped._profiled = True
+    setattr(owner, attribute, wrapped)
+
+
+def _first(args, kwargs, key, position=0):
+    return kwargs[key] if key in kwargs else (args[position] if len(args) > position else None)
+
+
+def _instrument():
+    """Wrap the library calls that the figure scripts spend their time in"""
+    import legwork as lw
+    import matplotlib.axes
+    import matplotlib.figure
+
+    _wrap(lw.source.Source, "__init__", "source setup",
+          lambda a, k, r: {"n_sources": len(_first(a, k, "m_1", 1))})
+    _wrap(lw.source.Source, "get_snr", "snr", lambda a, k, r: {"n_sources": a[0].n_sources})
+    for function in ["get_t_merge_circ", "get_t_merge_ecc"]:
+        _wrap(lw.evol, function, "merger times")
+    for function in ["evol_circ", "evol_ecc"]:
+        _wrap(lw.evol, function, "evolution", lambda a, k, r: {"output": r})
+    _wrap(lw.psd, "power_spectral_density", "psd", lambda a, k, r: {"f": _first(a, k, "f")})
+    _wrap(lw.visualisation, "plot_sensitivity_curve", "sensitivity curve")
+    for method in ["contour", "contourf", "tricontour", "tricontourf"]:
+        _wrap(matplotlib.axes.Axes, method, "contouring")
+
+    def savefig_size(args, kwargs, result):
+        fname = _first(args, kwargs, "fname", 1)
+        return {"bytes": os.path.getsize(fname)} if isinstance(fname, (str, os.PathLike)) \
+            and os.path.exists(fname) else {}
+    _wrap(matplotlib.figure.Figure, "savefig", "savefig", savefig_size)
+
+
+def write_report():
+    """Write the spans recorded so far to ``report_dir``, this happens automatically when the script exits"""
+    global _written
+    if not enabled or _written:
+        return
+    _written = True
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "interactive"
+    report = {"script": script, "build": build_id, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "fidelity": os.environ.get("LEGWORK_FIDELITY", "publication"),
+              "wall_time": time.perf_counter() - _start[0], "cpu_time": time.process_time() - _start[1],
+              "peak_rss_mb": _max_rss_mb(), "spans": sorted(_records, key=lambda r: r["start"])}
+    report_dir.mkdir(parents=True, exist_ok=True)
+    with open(report_dir / "{}.json".format(script), "w") as f:
+        json.dump(report, f, indent=1)
+
+
+def summary(top=15, build=None, verbose=True):
+    """Combine the reports of every script in a build into ``combined_report`` and rank the slowest stages
+
+    Parameters
+    ----------
+    top : `int`
+        Number of stages to print
+
+    build : `str`
+        Build whose reports to combine, default is the build of the most recently written report
+
+    verbose : `boolean`
+        Whether to print the ranking
+
+    Returns
+    -------
+    stages : `list of dicts`
+        Every span of every script, slowest first
+    """
+    reports = []
+    for path in sorted(report_dir.glob("*.json"), key=os.path.getmtime):
+        with open(path) as f:
+            reports.append(json.load(f))
+    if build is None and len(reports) > 0:
+        build = reports[-1].get("build")
+    reports = sorted((report for report in reports if report.get("build") == build), key=lambda r: r["script"])
+    stages = sorted(({"script": report["script"], **record} for report in reports for record in report["spans"]),
+                    key=lambda r: r["wall_time"], reverse=True)
+    with open(combined_report, "w") as f:
+        json.dump({"build": build, "scripts": reports, "stages": stages}, f, indent=1)
+
+    if verbose:
+        total = sum(report["wall_time"] for report in reports)
+        print("build {}: {} scripts, {:1.2f}s in total".format(build, len(reports), total))
+        for report in sorted(reports, key=lambda r: r["wall_time"], reverse=True):
+            print("  {:<32s} {:8.2f}s wall {:8.2f}s cpu {:8.1f} MB peak".format(
+                report["script"], report["wall_time"], report["cpu_time"], report["peak_rss_mb"]))
+        print("\nslowest stages (nested stages are included in their parents)")
+        for stage in stages[:top]:
+            print("  {:<32s} {:<40s} {:8.2f}s wall {:8.2f}s cpu {:+8.1f} MB".format(
+                stage["script"], stage["path"], stage["wall_time"], stage["cpu_time"], stage["rss_growth_mb"]))
+    return stages
+
+
+if __name__ == "__main__":
+    summary(top=int(sys.argv[1]) if len(sys.argv) > 1 else 15, build=sys.argv[2] if len(sys.argv) > 2 else None)
+elif enabled:
+    _instrument()
+    atexit.register(write_report)
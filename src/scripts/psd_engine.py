@@ -0,0 +1,263 @@
+"""Power spectral densities for several detector configurations at once, exactly or from tables.
+
+Most detector configurations that we compare differ only in their confusion noise (e.g. a different mission
+length) and so share the expensive instrument part of the PSD (the LISA response function is re-splined from
+file on every call to :func:`legwork.psd.lisa_psd`). :class:`PSDEngine` evaluates the instrument part once per
+distinct instrument and adds the confusion noise of each configuration on top, returning a
+(configs x frequencies) array.
+
+For repeated evaluation at arbitrary frequencies (e.g. every harmonic of every source) the engine also builds a
+log-spaced table of each PSD, refined until linear interpolation in log-log space is accurate to a given
+relative tolerance, and interpolates all of the requested frequencies at once.
+"""
+import legwork as lw
+import numpy as np
+import astropy.units as u
+
+__all__ = ["PSDEngine"]
+
+# same defaults as `legwork.source.Source`
+DEFAULT_SC_PARAMS = {"instrument": "LISA", "custom_psd": None, "t_obs": "auto", "L": "auto",
+                     "approximate_R": False, "confusion_noise": "auto"}
+
+# frequencies at which a confusion noise model jumps (the Huang+20 fit is cut to [1e-4, 1] Hz)
+CONFUSION_NOISE_BREAKS = {"huang20": [1e-4, 1e0]}
+
+
+def _fill_sc_params(sc_params):
+    """Fill in the default sensitivity curve parameters and resolve the instrument specific ones"""
+    params = dict(DEFAULT_SC_PARAMS)
+    params.update(sc_params)
+    if params["instrument"] in ["LISA", "TianQin"]:
+        lisa = params["instrument"] == "LISA"
+        if isinstance(params["t_obs"], str) and params["t_obs"] == "auto":
+            params["t_obs"] = 4 * u.yr if lisa else 5 * u.yr
+        if isinstance(params["L"], str) and params["L"] == "auto":
+            params["L"] = 2.5e9 * u.m if lisa else np.sqrt(3) * 1e5 * u.km
+        if isinstance(params["confusion_noise"], str) and params["confusion_noise"] == "auto":
+            params["confusion_noise"] = "robson19" if lisa else "huang20"
+    elif params["instrument"] != "custom":
+        raise ValueError("instrument: `{}` not recognised".format(params["instrument"]))
+    return params
+
+
+def _instrument_key(params):
+    """Parameters that determine the instrument part of the PSD (everything except the confusion noise)"""
+    if params["instrument"] == "custom":
+        return None
+    L = params["L"].to(u.m).value
+    approximate_R = bool(params["approximate_R"]) if params["instrument"] == "LISA" else None
+    return params["instrument"], L, approximate_R
+
+
+class PSDEngine():
+    """Evaluate and tabulate the PSD of several detector configurations
+
+    Parameters
+    ----------
+    sc_params : `list of dicts`
+        Sensitivity curve parameters for each configuration, with the same keys as the ``sc_params`` of
+        :class:`legwork.source.Source` (e.g. ``[{"instrument": "LISA"}, {"instrument": "TianQin"}]``)
+
+    rtol : `float`
+        Maximum relative error of the interpolated PSD
+
+    f_min, f_max : `float`
+        Frequency range of the tables. Must have units of frequency. The PSD is infinite outside of this
+        range (as for LISA outside of the range of its response function).
+
+    points_per_decade : `int`
+        Initial resolution of the tables, this is doubled until ``rtol`` is reached
+
+    max_points_per_decade : `int`
+        Largest resolution to try. If ``rtol`` can't be reached before this then the table is kept at this
+        resolution and the error that was reached is recorded in ``error``.
+
+    Attributes
+    ----------
+    configs : `list of dicts`
+        Full sensitivity curve parameters of each configuration (with "auto" values resolved)
+
+    n_configs : `int`
+        Number of configurations
+
+    error : `float/array`
+        Maximum relative interpolation error of each table, measured at the midpoint of every table interval
+        (where the error of linear interpolation peaks). Only available after the tables are built by
+        :meth:`tabulate` or the first call to :meth:`interpolate`.
+
+    n_points : `int/array`
+        Number of points in each table
+    """
+    def __init__(self, sc_params, rtol=1e-3, f_min=1e-7 * u.Hz, f_max=2 * u.Hz, points_per_decade=50,
+                 max_points_per_decade=25600):
+        if isinstance(sc_params, dict):
+            sc_params = [sc_params]
+        self.configs = [_fill_sc_params(params) for params in sc_params]
+        self.n_configs = len(self.configs)
+        self.rtol = rtol
+        self.f_min = f_min.to(u.Hz).value
+        self.f_max = f_max.to(u.Hz).value
+        self.points_per_decade = points_per_decade
+        self.max_points_per_decade = max_points_per_decade
+
+        self._tables = None
+        self.error = None
+        self.n_points = None
+
+    def exact(self, f, which_configs=None):
+        """Evaluate the PSD of every configuration exactly
+
+        Parameters
+        ----------
+        f : `float/array`
+            Frequencies at which to evaluate the PSD. Must have units of frequency.
+
+        which_configs : `list`
+            Indices of the configurations to evaluate, default is all of them
+
+        Returns
+        -------
+        psd : `float/array`
+            PSD of each configuration, shape (n_configs, \\*f.shape)
+        """
+        f = np.atleast_1d(f).to(u.Hz)
+        configs = [self.configs[i] for i in (range(self.n_configs) if which_configs is None else which_configs)]
+        psd = np.zeros((len(configs), *f.shape)) / u.Hz
+
+        # evaluate each distinct instrument without confusion noise only once
+        instrument_noise = {}
+        for i, params in enumerate(configs):
+            key = _instrument_key(params)
+            if key is None:
+                psd[i] = lw.psd.power_spectral_density(f=f, **params)
+                continue
+            if key not in instrument_noise:
+                instrument_noise[key] = lw.psd.power_spectral_density(f=f, **{**params, "confusion_noise": None})
+
+            # add the confusion noise, in the same way as `lisa_psd` and `tianqin_psd`
+            cn = params["confusion_noise"]
+            if cn is None:
+                psd[i] = instrument_noise[key]
+                continue
+            if isinstance(cn, str):
+                confusion = lw.psd.get_confusion_noise(f=f, model=cn, t_obs=params["t_obs"])
+            else:
+                confusion = cn(f.value, params["t_obs"]) if params["instrument"] == "LISA" \
+                    else cn(f, params["t_obs"])
+            psd[i] = np.where(np.isinf(instrument_noise[key]), np.inf / u.Hz,
+                              instrument_noise[key] + confusion)
+        return psd
+
+    def _segments(self, params):
+        """Split the table range at any discontinuities of the confusion noise"""
+        breaks = CONFUSION_NOISE_BREAKS.get(params["confusion_noise"], []) \
+            if isinstance(params["confusion_noise"], str) else []
+        edges = [self.f_min] + [b for b in breaks if self.f_min < b < self.f_max] + [self.f_max]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _tabulate_segment(self, i, f_lo, f_hi):
+        """Refine a table on [f_lo, f_hi) until it meets the tolerance"""
+        n_decades = np.log10(f_hi / f_lo)
+        points_per_decade = self.points_per_decade
+        while True:
+            n = max(int(np.ceil(n_decades * points_per_decade)), 1) + 1
+            log_f = np.linspace(np.log10(f_lo), np.log10(f_hi), n)
+
+            # evaluate the nodes and midpoints together (right end nudged to stay inside the segment)
+            log_f_mid = 0.5 * (log_f[1:] + log_f[:-1])
+            nodes = np.append(log_f[:-1], np.log10(f_hi * (1 - 1e-12)))
+            log_psd = np.log10(self._exact_config(i, 10**np.concatenate((nodes, log_f_mid))))
+            log_psd, log_psd_mid = log_psd[:n], log_psd[n:]
+
+            error = np.max(np.abs(10**(np.interp(log_f_mid, log_f, log_psd) - log_psd_mid) - 1))
+            if error <= self.rtol or points_per_decade >= self.max_points_per_decade:
+                return log_f, log_psd, error
+            points_per_decade *= 2
+
+    def _exact_config(self, i, f):
+        """Exact PSD of a single configuration in 1/Hz, without units"""
+        return self.exact(f * u.Hz, which_configs=[i])[0].to(1 / u.Hz).value
+
+    def tabulate(self):
+        """Build the interpolation table of each configuration
+
+        Returns
+        -------
+        error : `float/array`
+            Maximum relative interpolation error of each table
+        """
+        self._tables, self.error, self.n_points = [], np.zeros(self.n_configs), np.zeros(self.n_configs, int)
+        for i, params in enumerate(self.configs):
+            segments = []
+            for f_lo, f_hi in self._segments(params):
+                log_f, log_psd, error = self._tabulate_segment(i, f_lo, f_hi)
+                segments.append((log_f, log_psd))
+                self.error[i] = max(self.error[i], error)
+                self.n_points[i] += len(log_f)
+            self._tables.append(segments)
+        return self.error
+
+    def interpolate(self, f, which_configs=None):
+        """Interpolate the PSD of each configuration at arbitrary frequencies
+
+        Parameters
+        ----------
+        f : `float/array`
+            Frequencies at which to evaluate the PSD (any shape, e.g. sources x harmonics). Must have units of
+            frequency.
+
+        which_configs : `int/list`
+            Index (or indices) of the configurations to evaluate, default is all of them
+
+        Returns
+        -------
+        psd : `float/array`
+            PSD of each configuration, shape (n_configs, \\*f.shape), or just \\*f.shape if
+            ``which_configs`` is a single index
+        """
+        if self._tables is None:
+            self.tabulate()
+
+        single = np.ndim(which_configs) == 0 and which_configs is not None
+        configs = range(self.n_configs) if which_configs is None else np.atleast_1d(which_configs)
+
+        f = np.asarray(f.to(u.Hz).value)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_f = np.log10(f)
+        psd = np.full((len(configs), *f.shape), np.inf)
+        for j, i in enumerate(configs):
+            segments = self._tables[i]
+            for k, (log_f_table, log_psd_table) in enumerate(segments):
+                last = k == len(segments) - 1
+                inside = np.logical_and(log_f >= log_f_table[0],
+                                        log_f <= log_f_table[-1] if last else log_f < log_f_table[-1])
+
+                # the tables are evenly spaced in log f so the interval follows directly (no search needed)
+                step = log_f_table[1] - log_f_table[0]
+                x = (log_f[inside] - log_f_table[0]) / step
+                ind = np.minimum(x.astype(int), len(log_f_table) - 2)
+                w = x - ind
+                psd[j][inside] = 10**((1 - w) * log_psd_table[ind] + w * log_psd_table[ind + 1])
+
+        return (psd[0] if single else psd) / u.Hz
+
+    def __call__(self, f, which_configs=None):
+        """Shortcut for :meth:`interpolate`"""
+        return self.interpolate(f, which_configs=which_configs)
+
+    def interpolator(self, i):
+        """Interpolated PSD of a single configuration as a function of frequency, suitable for the
+        ``interpolated_sc`` argument of the functions in :mod:`legwork.snr`
+
+        Parameters
+        ----------
+        i : `int`
+            Index of the configuration
+
+        Returns
+        -------
+        interpolated_sc : `function`
+            Function that takes frequencies and returns the PSD
+        """
+        return lambda f: self.interpolate(f, which_configs=i)
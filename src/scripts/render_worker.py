@@ -0,0 +1,240 @@
+"""Long-lived worker that renders figure scripts without paying the import cost every time.
+
+Every figure script starts a fresh interpreter and imports LEGWORK, astropy, numpy and matplotlib before it
+does any work, which dominates the runtime of the cheaper plots. Start a worker once with
+
+    python src/scripts/render_worker.py serve &
+
+and then render any script through it with
+
+    python src/scripts/render_worker.py render src/scripts/detector_sc_compare.py
+
+The worker keeps the heavy modules imported (and the fonts loaded) and forks a fresh child for each request,
+so every script still starts with clean figure state, default ``rcParams`` and freshly imported repository
+modules (``paths``, ``fidelity``, ...) while sharing everything else with the worker. If no worker is running
+then ``render`` simply runs the script in a new interpreter instead, so it is always safe to use.
+"""
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+__all__ = ["socket_path", "serve", "render"]
+
+# location of the socket, kept in the temporary directory since AF_UNIX paths are limited in length
+socket_path = os.environ.get("LEGWORK_RENDER_SOCKET",
+                             os.path.join(tempfile.gettempdir(), "legwork-render-{}.sock".format(os.getuid())))
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# modules that are loaded once by the worker and shared by every request
+PRELOAD = ["numpy", "scipy.integrate", "scipy.interpolate", "astropy.units", "astropy.visualization",
+           "matplotlib", "matplotlib.pyplot", "matplotlib.backends.backend_pdf", "legwork"]
+
+
+def _send(conn, message, fds=()):
+    """Send a length-prefixed JSON message (and optionally some file descriptors)"""
+    data = json.dumps(message).encode()
+    header = struct.pack("!I", len(data))
+    if fds:
+        socket.send_fds(conn, [header], list(fds))
+    else:
+        conn.sendall(header)
+    conn.sendall(data)
+
+
+def _recv(conn, max_fds=0):
+    """Receive a length-prefixed JSON message (and any file descriptors sent alongside it)"""
+    if max_fds:
+        header, fds, _, _ = socket.recv_fds(conn, 4, max_fds)
+    else:
+        header, fds = conn.recv(4), []
+    if len(header) < 4:
+        raise ConnectionError("connection closed before a message was received")
+    length, = struct.unpack("!I", header)
+    data = b""
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed in the middle of a message")
+        data += chunk
+    return json.loads(data), fds
+
+
+def _preload():
+    """Import the shared modules and warm up matplotlib, returning the time that this took"""
+    start = time.perf_counter()
+    import importlib
+    for module in PRELOAD:
+        importlib.import_module(module)
+
+    import matplotlib.pyplot as plt
+
+    # draw a throwaway figure in the style of the paper so that the font cache and PDF backend are loaded
+    with plt.rc_context({"font.family": "serif", "text.usetex": False}):
+        fig, ax = plt.subplots()
+        ax.set_xlabel(r"$f_{\rm orb}$")
+        fig.savefig(os.devnull, format="pdf")
+        plt.close(fig)
+    return time.perf_counter() - start
+
+
+def _run_request(conn, startup_time):
+    """Run a single render request, this is always called in a freshly forked child"""
+    accepted = time.perf_counter()
+    request, fds = _recv(conn, max_fds=2)
+
+    # point stdout and stderr at the client's so output shows up where the script was requested
+    log = os.fdopen(os.dup(2), "w")
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for fd, target in zip(fds, (1, 2)):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+
+    # forget repository modules imported by earlier code so they see this request's environment
+    for name, module in list(sys.modules.items()):
+        if os.path.dirname(os.path.abspath(getattr(module, "__file__", None) or "")) == SCRIPTS_DIR:
+            del sys.modules[name]
+
+    import matplotlib
+    import matplotlib.pyplot as plt
+    plt.close("all")
+    matplotlib.rc_file_defaults()
+
+    script = os.path.abspath(request["script"])
+    sys.argv = [script] + request["args"]
+    sys.path[0] = os.path.dirname(script)
+
+    import runpy
+    start = time.perf_counter()
+    returncode = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        # the child exits without running atexit handlers so write the profile (if any) here
+        if "profiling" in sys.modules:
+            sys.modules["profiling"].write_report()
+        plt.close("all")
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    run_time = time.perf_counter() - start
+    saved = max(startup_time - (start - accepted), 0.0)
+    print("render_worker: {} finished in {:1.2f}s, saved {:1.2f}s of startup".format(
+        os.path.basename(script), run_time, saved), file=log, flush=True)
+    _send(conn, {"returncode": returncode, "run_time": run_time, "startup_saved": saved})
+
+
+def serve(path=None):
+    """Start a worker listening on a local socket, runs until interrupted
+
+    Parameters
+    ----------
+    path : `str`
+        Path of the socket (default ``socket_path``)
+    """
+    path = socket_path if path is None else path
+    os.environ.setdefault("MATPLOTLIBRC", SCRIPTS_DIR)
+    startup_time = _preload()
+    print("render_worker: loaded modules in {:1.2f}s, listening on {}".format(startup_time, path), flush=True)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    # children are never waited on so let the kernel reap them, and shut down cleanly when killed
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            conn, _ = server.accept()
+            if os.fork() == 0:
+                server.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                try:
+                    _run_request(conn, startup_time)
+                finally:
+                    os._exit(0)
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def render(script, args=(), path=None):
+    """Render a script with the worker, falling back to a fresh interpreter if none is running
+
+    Parameters
+    ----------
+    script : `str`
+        Path to the script
+
+    args : `list`
+        Command line arguments to pass to the script
+
+    path : `str`
+        Path of the worker socket (default ``socket_path``)
+
+    Returns
+    -------
+    result : `dict`
+        Return code of the script, time spent running it and the startup time that was saved
+        (``startup_saved`` is None if the script wasn't run by the worker)
+    """
+    path = socket_path if path is None else path
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError:
+        conn.close()
+        import subprocess
+        start = time.perf_counter()
+        returncode = subprocess.call([sys.executable, script] + list(args))
+        return {"returncode": returncode, "run_time": time.perf_counter() - start, "startup_saved": None}
+
+    with conn:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _send(conn, {"script": script, "args": list(args), "cwd": os.getcwd(), "env": dict(os.environ)},
+              fds=(sys.stdout.fileno(), sys.stderr.fileno()))
+        try:
+            result, _ = _recv(conn)
+        except ConnectionError:
+            # the child died without reporting back (e.g. it was killed)
+            result = {"returncode": 1, "run_time": None, "startup_saved": None}
+    return result
+
+
+if __name__ == "__main__":
+    usage = "usage: render_worker.py serve | render SCRIPT [ARGS...]"
+    if len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        serve()
+    elif len(sys.argv) >= 3 and sys.argv[1] == "render":
+        result = render(sys.argv[2], sys.argv[3:])
+        if result["startup_saved"] is not None:
+            print("render_worker: saved {:1.2f}s of startup for {}".format(result["startup_saved"], sys.argv[2]),
+                  file=sys.stderr)
+        sys.exit(result["returncode"])
+    else:
+        sys.exit(usage)
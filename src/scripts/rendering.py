@@ -0,0 +1,97 @@
+"""Rasterize the heavy layers of a figure and report how long each figure takes to write.
+
+Filled contours over large grids are thousands of polygons in a vector PDF, which makes the file large and slow
+to write, to include in LaTeX and to display. Layers passed to :func:`heavy` are instead drawn as images at
+``dpi`` while the axes, labels, contour lines and annotations stay vector, e.g.
+
+    cont = ax.contourf(X, Y, Z, levels=levels)
+    rendering.heavy(cont)
+    ...
+    rendering.save(fig, paths.figures / "figure.pdf", bbox_inches="tight")
+
+The resolution is read from the ``LEGWORK_RASTER_DPI`` environment variable (default 300). Set it to ``0`` or
+``vector`` to keep every layer vector, in which case the edges of the filled polygons are drawn in their face
+colour so that no seams show between them. :func:`save` prints how long the figure took to write and its size
+and records them in ``src/tex/output/render/<figure>.json``.
+"""
+import json
+import os
+import time
+
+from matplotlib.artist import Artist
+import paths
+
+__all__ = ["dpi", "heavy", "save"]
+
+# resolution of the rasterized layers, None if everything is vector
+_dpi = os.environ.get("LEGWORK_RASTER_DPI", "300").strip().lower()
+if _dpi in ["0", "vector", "none", "off"]:
+    dpi = None
+elif _dpi.isdigit():
+    dpi = int(_dpi)
+else:
+    raise ValueError("LEGWORK_RASTER_DPI: `{}` is not a positive integer or `vector`".format(_dpi))
+
+# where the write time and size of each figure are recorded
+report_dir = paths.tex / "output" / "render"
+
+
+def _artists(layer):
+    """Artists that make up a layer, contour sets are made of one collection per level before matplotlib 3.8"""
+    return [layer] if isinstance(layer, Artist) else list(layer.collections)
+
+
+def heavy(*layers):
+    """Mark layers to be rasterized at ``dpi`` when the figure is saved
+
+    Parameters
+    ----------
+    *layers : `various`
+        Filled contour sets (from ``contourf`` or ``tricontourf``) or any other artists, e.g. a large scatter
+        or image
+    """
+    for layer in layers:
+        for artist in _artists(layer):
+            if dpi is not None:
+                artist.set_rasterized(True)
+            elif hasattr(artist, "set_edgecolor"):
+                # hide the seams that PDF viewers draw between neighbouring vector polygons
+                artist.set_edgecolor("face")
+
+
+def save(fig, path, **kwargs):
+    """Save a figure with its heavy layers at ``dpi``, then report how long it took and how large it is
+
+    Parameters
+    ----------
+    fig : `matplotlib.figure.Figure`
+        Figure to save
+
+    path : `str`
+        Where to save the figure
+
+    **kwargs
+        Passed to ``fig.savefig``
+
+    Returns
+    -------
+    report : `dict`
+        Write time in seconds, size in bytes, DPI of the rasterized layers and number of rasterized artists
+    """
+    n_rasterized = sum(artist.get_rasterized() for artist in fig.findobj(Artist))
+    if dpi is not None:
+        kwargs.setdefault("dpi", dpi)
+
+    start = time.perf_counter()
+    fig.savefig(path, **kwargs)
+    report = {"write_time": time.perf_counter() - start, "bytes": os.path.getsize(path), "dpi": dpi,
+              "n_rasterized": int(n_rasterized)}
+
+    name = os.path.splitext(os.path.basename(str(path)))[0]
+    print("Saved {} in {:1.2f}s ({:1.1f} kB, {})".format(
+        name, report["write_time"], report["bytes"] / 1e3,
+        "{} layers at {} dpi".format(n_rasterized, dpi) if dpi is not None and n_rasterized > 0 else "vector"))
+    report_dir.mkdir(parents=True, exist_ok=True)
+    with open(report_dir / "{}.json".format(name), "w") as f:
+        json.dump(report, f, indent=1)
+    return report
@@ -3,6 +3,10 @@ import numpy as np
 import astropy.units as u
 import matplotlib.pyplot as plt
 import paths
+import fidelity
+import profiling  # noqa: F401 (times the stages of this script when LEGWORK_PROFILE is set)
+import rendering
+from psd_engine import PSDEngine
 
 from astropy.visualization import quantity_support
 quantity_support()
@@ -24,33 +28,27 @@ params = {'figure.figsize': (12, 8),
           'ytick.minor.size': 4}
 plt.rcParams.update(params)
 
-# set eccentricities
-ecc = np.array([1e-6, 0.6, 0.9])
-n_binaries = len(ecc)
-
-# use constant values for mass, f_orb and distance
-m_1 = np.repeat(0.6, n_binaries) * u.Msun
-m_2 = np.repeat(0.6, n_binaries) * u.Msun
-f_orb = np.repeat(1.5e-3, n_binaries) * u.Hz
-dist = np.repeat(15, n_binaries) * u.kpc
-
-# get the SNR in each harmonic
-snr2_n = lw.snr.snr_ecc_evolving(m_1=m_1, m_2=m_2, f_orb_i=f_orb, ecc=ecc, dist=dist,
-                                 harmonics_required=100, t_obs=4 * u.yr, n_step=1000,
-                                 ret_snr2_by_harmonic=True)
+# load the SNR in each harmonic from `compute_role_eccentricity.py`
+data = np.load(paths.data / "role_eccentricity.npz")
+ecc = data["ecc"]
+f_orb = data["f_orb"] * u.Hz
+snr2_n = data["snr2_n"]
 
 snr = snr2_n.sum(axis=1)**(0.5)
 
 # plot LISA sensitivity curve
-fig, ax = lw.visualisation.plot_sensitivity_curve(frequency_range=np.logspace(-3.5, 0, 1000) * u.Hz,
-                                                  show=False)
+frequency_range = np.logspace(-3.5, 0, fidelity.scale(1000)) * u.Hz
+fig, ax = lw.visualisation.plot_sensitivity_curve(frequency_range=frequency_range, show=False)
+
+# work out the harmonic frequencies and the LISA ASD at each of them for every source at once
+f_harms = f_orb[:, np.newaxis] * np.arange(1, len(snr2_n[0]) + 1)[np.newaxis, :]
+asd_harms = PSDEngine({"instrument": "LISA"}).exact(f_harms)[0]**(0.5)
 
 # plot each sources
 colours = [plt.get_cmap("plasma")(i) for i in [0.1, 0.5, 0.8]]
 for i in range(len(snr2_n)):
-    # work out the harmonic frequencies and ASDs
-    f_harm = f_orb[i] * range(1, len(snr2_n[0]) + 1)
-    y_vals = lw.psd.lisa_psd(f_harm)**(0.5) * np.sqrt(snr2_n)[i]
+    f_harm = f_harms[i]
+    y_vals = asd_harms[i] * np.sqrt(snr2_n)[i]
 
     # only plot points above the sensitivity curve
     mask = np.sqrt(snr2_n)[i] > 1.0
@@ -88,6 +86,7 @@ ax.annotate(annotation_string, xy=(3.5e-1, 1.3e-20), ha="center", va="bottom", f
 
 ax.set_ylim(1e-20, 2e-18)
 
-ax.set_rasterization_zorder(10000)
+fidelity.mark(fig, data["fidelity"])
 
-plt.savefig(paths.figures / "role_eccentricity.pdf", format="pdf", bbox_inches="tight")
\ No newline at end of file
+rendering.save(fig, paths.figures / "role_eccentricity.pdf", format="pdf", bbox_inches="tight",
+               metadata=fidelity.metadata(data["fidelity"]))
\ No newline at end of file
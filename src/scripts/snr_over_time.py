@@ -1,8 +1,10 @@
-import legwork as lw
 import numpy as np
 import astropy.units as u
 import matplotlib.pyplot as plt
 import paths
+import fidelity
+import profiling  # noqa: F401 (times the stages of this script when LEGWORK_PROFILE is set)
+import rendering
 
 plt.rc('font', family='serif')
 plt.rcParams['text.usetex'] = False
@@ -21,31 +23,16 @@ params = {'figure.figsize': (12, 8),
           'ytick.minor.size': 4}
 plt.rcParams.update(params)
 
-m_1 = 15 * u.Msun
-m_2 = 15 * u.Msun
-dist = 20 * u.kpc
-ecc = 0.5
-f_orb = 3e-5 * u.Hz
-
-t_merge = lw.evol.get_t_merge_ecc(m_1=m_1, m_2=m_2, ecc_i=ecc, f_orb_i=f_orb)
-
-ecc_evol, f_orb_evol, timesteps = lw.evol.evol_ecc(m_1=m_1,
-                                                   m_2=m_2,
-                                                   ecc_i=ecc,
-                                                   f_orb_i=f_orb,
-                                                   t_evol=t_merge - 100 * u.yr,
-                                                   avoid_merger=False,
-                                                   output_vars=["ecc", "f_orb", "timesteps"],
-                                                   n_step=1000)
-
-source = lw.source.Source(m_1=np.repeat(m_1, len(ecc_evol)),
-                          m_2=np.repeat(m_2, len(ecc_evol)),
-                          dist=np.repeat(dist, len(ecc_evol)),
-                          ecc=ecc_evol,
-                          f_orb=f_orb_evol,
-                          interpolate_g=False)
-
-snr = source.get_snr()
+# load the evolution from `compute_snr_over_time.py`
+data = np.load(paths.data / "snr_over_time.npz")
+m_1 = data["m_1"] * u.Msun
+m_2 = data["m_2"] * u.Msun
+dist = data["dist"] * u.kpc
+t_merge = data["t_merge"] * u.yr
+timesteps = data["timesteps"] * u.yr
+ecc_evol = data["ecc_evol"]
+f_orb_evol = data["f_orb_evol"] * u.Hz
+snr = data["snr"]
 
 fig, axes = plt.subplots(3, 1, figsize=(8, 15))
 fig.subplots_adjust(hspace=0.3)
@@ -54,16 +41,16 @@ fig.subplots_adjust(hspace=0.3)
 t_before_merger = (t_merge - timesteps).to(u.Myr)
 
 # plot the eccentricity
-axes[0].plot(t_before_merger, source.ecc, lw=3)
+axes[0].plot(t_before_merger, ecc_evol, lw=3)
 axes[0].set_ylabel(r"Eccentricity, $e$")
 
 # plot the frequency on a log scale
-axes[1].plot(t_before_merger, source.f_orb, lw=3, color="tab:red")
+axes[1].plot(t_before_merger, f_orb_evol, lw=3, color="tab:red")
 axes[1].set_yscale("log")
 axes[1].set_ylabel(r"Orbital Frequency, $f_{\rm orb}\ [\rm Hz]$")
 
 # plot the SNR on a log scale
-axes[2].plot(t_before_merger, source.snr, lw=3, color="tab:purple")
+axes[2].plot(t_before_merger, snr, lw=3, color="tab:purple")
 axes[2].set_yscale("log")
 axes[2].set_ylabel(r"Signal-to-noise Ratio, $\rho$")
 
@@ -85,6 +72,7 @@ for ax in axes:
                 xycoords="axes fraction", va="top" if ax != axes[0] else "bottom",
                 fontsize=0.5*fs, bbox=dict(boxstyle="round", fc="white", ec="white"))
 
-ax.set_rasterization_zorder(10000)
+fidelity.mark(fig, data["fidelity"])
 
-plt.savefig(paths.figures / "snr_over_time.pdf", format="pdf", bbox_inches="tight")
\ No newline at end of file
+rendering.save(fig, paths.figures / "snr_over_time.pdf", format="pdf", bbox_inches="tight",
+               metadata=fidelity.metadata(data["fidelity"]))
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""Density of large populations of sources on the sensitivity curve.
+
+:meth:`legwork.source.Source.plot_sources_on_sc` draws one marker per source, which is fine for a few dozen
+verification binaries but very slow (and makes huge files) for a Galactic population with millions of
+detectable sources. Here sources are instead binned in (frequency, ASD) with a vectorized 2D histogram and drawn
+as a single image (or filled contours) on the axes from :func:`legwork.visualisation.plot_sensitivity_curve`.
+Each source sits at the same place as with ``plot_sources_on_sc``, at its dominant harmonic frequency and an ASD
+such that its height above the curve is its SNR. Colour is either the number of sources in each bin or a
+quantity aggregated over the sources in the bin (e.g. the mean primary mass), e.g.
+
+    fig, ax = lw.visualisation.plot_sensitivity_curve(show=False)
+    fig, ax, density = plot_sources_density(sources, snr_cutoff=7, c=sources.m_1.to(u.Msun).value,
+                                            fig=fig, ax=ax)
+    fig.colorbar(density)
+"""
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+import rendering
+from psd_engine import PSDEngine
+
+__all__ = ["STATISTICS", "bin_sources", "plot_density_on_sc", "plot_sources_density"]
+
+# ways of aggregating a quantity over the sources in a bin
+STATISTICS = ["mean", "sum", "min", "max"]
+
+
+def bin_sources(x, y, x_edges, y_edges, c=None, weights=None, statistic="mean"):
+    """Bin sources in 2D, counting them and optionally aggregating a quantity in each bin
+
+    Parameters
+    ----------
+    x, y : `float/array`
+        Coordinates of each source, sources outside of the edges are left out
+
+    x_edges, y_edges : `float/array`
+        Increasing bin edges in each coordinate
+
+    c : `float/array`
+        Quantity to aggregate over the sources in each bin
+
+    weights : `float/array`
+        Weight of each source (default all 1)
+
+    statistic : `str`
+        How to aggregate ``c``, one of ``STATISTICS`` (``mean`` and ``sum`` use the weights)
+
+    Returns
+    -------
+    counts : `float/array`
+        Total weight of the sources in each bin, shape (len(x_edges) - 1, len(y_edges) - 1)
+
+    aggregate : `float/array`
+        Aggregated ``c`` in each bin (NaN for empty bins), or None if ``c`` isn't given
+    """
+    if statistic not in STATISTICS:
+        raise ValueError("statistic: `{}` not recognised, must be one of {}".format(statistic, STATISTICS))
+    n_x, n_y = len(x_edges) - 1, len(y_edges) - 1
+
+    # flat index of the bin of every source, the right edges are included in the last bins
+    i = np.searchsorted(x_edges, x, side="right") - 1
+    j = np.searchsorted(y_edges, y, side="right") - 1
+    i[x == x_edges[-1]] = n_x - 1
+    j[y == y_edges[-1]] = n_y - 1
+    inside = np.logical_and.reduce((i >= 0, i < n_x, j >= 0, j < n_y))
+    flat = i[inside] * n_y + j[inside]
+    w = np.ones(len(flat)) if weights is None else np.asarray(weights)[inside]
+
+    counts = np.bincount(flat, weights=w, minlength=n_x * n_y)
+    if c is None:
+        return counts.reshape(n_x, n_y), None
+
+    c = np.asarray(c)[inside]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if statistic in ["mean", "sum"]:
+            aggregate = np.bincount(flat, weights=w * c, minlength=n_x * n_y)
+            if statistic == "mean":
+                aggregate = aggregate / counts
+        else:
+            aggregate = np.full(n_x * n_y, np.inf if statistic == "min" else -np.inf)
+            (np.minimum if statistic == "min" else np.maximum).at(aggregate, flat, c)
+    aggregate[counts == 0] = np.nan
+    return counts.reshape(n_x, n_y), aggregate.reshape(n_x, n_y)
+
+
+def plot_density_on_sc(f_dom, snr, snr_cutoff=0, c=None, statistic="mean", weights=None, bins=(300, 200),
+                       kind="image", sc_params={}, fig=None, ax=None, levels=10, **kwargs):
+    """Plot the density of sources on the sensitivity curve, the binned equivalent of
+    :func:`legwork.visualisation.plot_sources_on_sc`
+
+    Parameters
+    ----------
+    f_dom : `float/array`
+        Dominant harmonic frequency of each source. Must have units of frequency.
+
+    snr : `float/array`
+        SNR of each source
+
+    snr_cutoff : `float`
+        SNR above which to plot sources
+
+    c : `float/array`
+        Quantity to colour the bins by (aggregated with ``statistic``), default is to colour by the number of
+        sources
+
+    statistic : `str`
+        How to aggregate ``c`` over the sources in a bin, one of ``STATISTICS``
+
+    weights : `float/array`
+        Statistical weight of each source
+
+    bins : `tuple`
+        Number of log-spaced bins in frequency and ASD, spread over the current limits of ``ax``
+
+    kind : `str`
+        ``image`` to draw the bins as an image or ``contour`` for filled contours through the bin centres
+
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    fig, ax : `matplotlib Figure`, `matplotlib Axis`
+        Figure and axis to plot on, default is a new sensitivity curve
+
+    levels : `int/array`
+        Contour levels if ``kind`` is ``contour``
+
+    **kwargs
+        Passed to ``ax.pcolormesh`` or ``ax.contourf`` (e.g. ``cmap``, ``vmin`` and ``vmax``)
+
+    Returns
+    -------
+    fig : `matplotlib Figure`
+        The figure
+
+    ax : `matplotlib Axis`
+        The axis
+
+    mappable : `matplotlib.cm.ScalarMappable`
+        The image or contour set, e.g. for a colourbar (None if no sources are above the cutoff)
+    """
+    if fig is None or ax is None:
+        fig, ax = lw.visualisation.plot_sensitivity_curve(show=False, **sc_params)
+
+    detectable = snr > snr_cutoff
+    if not detectable.any():
+        print("ERROR: There are no binaries above provided `snr_cutoff`")
+        return fig, ax, None
+
+    # ASD that puts each source at a height above the curve equal to its SNR
+    f_dom = f_dom[detectable].to(u.Hz)
+    psd = PSDEngine(sc_params).interpolate(f_dom, which_configs=0).to(1 / u.Hz).value
+    asd = snr[detectable] * np.sqrt(psd)
+
+    x_lims, y_lims = ax.get_xlim(), ax.get_ylim()
+    x_edges = np.logspace(*np.log10(x_lims), bins[0] + 1)
+    y_edges = np.logspace(*np.log10(y_lims), bins[1] + 1)
+    counts, aggregate = bin_sources(f_dom.value, asd, x_edges, y_edges,
+                                    c=None if c is None else np.asarray(c)[detectable],
+                                    weights=None if weights is None else np.asarray(weights)[detectable],
+                                    statistic=statistic)
+
+    # empty bins are left transparent so the curve shows through
+    if aggregate is None:
+        values = np.ma.masked_equal(counts, 0)
+        if "norm" not in kwargs:
+            kwargs["norm"] = LogNorm(vmin=kwargs.pop("vmin", values.min()), vmax=kwargs.pop("vmax", values.max()))
+    else:
+        values = np.ma.masked_invalid(aggregate)
+
+    if kind == "image":
+        mappable = ax.pcolormesh(x_edges, y_edges, values.T, **kwargs)
+    elif kind == "contour":
+        x_mid, y_mid = np.sqrt(x_edges[1:] * x_edges[:-1]), np.sqrt(y_edges[1:] * y_edges[:-1])
+        if "norm" in kwargs and isinstance(kwargs["norm"], LogNorm) and np.ndim(levels) == 0:
+            levels = np.logspace(*np.log10([kwargs["norm"].vmin, kwargs["norm"].vmax]), levels)
+        mappable = ax.contourf(x_mid, y_mid, values.T, levels=levels, **kwargs)
+    else:
+        raise ValueError("kind: `{}` not recognised, must be `image` or `contour`".format(kind))
+    rendering.heavy(mappable)
+
+    ax.set_xlim(x_lims)
+    ax.set_ylim(y_lims)
+    return fig, ax, mappable
+
+
+def plot_sources_density(sources, snr_cutoff=0, c=None, statistic="mean", fig=None, ax=None, show=False,
+                         **kwargs):
+    """Plot the density of the stationary sources of a Source on the sensitivity curve, the binned equivalent
+    of :meth:`legwork.source.Source.plot_sources_on_sc`
+
+    Parameters
+    ----------
+    sources : `legwork.source.Source`
+        Sources with an SNR already calculated
+
+    snr_cutoff : `float`
+        SNR above which to plot sources
+
+    c : `float/array`
+        Quantity of every source in ``sources`` to colour the bins by, default is to colour by the number of
+        sources
+
+    statistic : `str`
+        How to aggregate ``c`` over the sources in a bin, one of ``STATISTICS``
+
+    fig, ax : `matplotlib Figure`, `matplotlib Axis`
+        Figure and axis to plot on, default is a new sensitivity curve
+
+    show : `boolean`
+        Whether to immediately show the plot
+
+    **kwargs
+        Passed to :func:`plot_density_on_sc`
+
+    Returns
+    -------
+    fig : `matplotlib Figure`
+        The figure
+
+    ax : `matplotlib Axis`
+        The axis
+
+    mappable : `matplotlib.cm.ScalarMappable`
+        The image or contour set (None if no sources were plotted)
+    """
+    if sources.snr is None:
+        print("ERROR: No SNR has been calculated yet")
+        return fig, ax, None
+
+    # evolving sources aren't plotted by `plot_sources_on_sc` either
+    stat = np.logical_and.reduce((sources.get_source_mask(stationary=True), sources.snr > snr_cutoff,
+                                  np.logical_not(sources.merged)))
+    n_evolving = np.logical_and.reduce((sources.get_source_mask(stationary=False), sources.snr > snr_cutoff,
+                                        np.logical_not(sources.merged))).sum()
+    if n_evolving > 0:
+        print("{} evolving sources detected, these are not plotted".format(n_evolving))
+
+    f_dom = sources.f_orb[stat] * sources.max_snr_harmonic[stat]
+    weights = sources.weights[stat] if sources.weights is not None else None
+    fig, ax, mappable = plot_density_on_sc(f_dom, sources.snr[stat], snr_cutoff=snr_cutoff,
+                                           c=None if c is None else np.asarray(c)[stat], statistic=statistic,
+                                           weights=weights, sc_params=sources._sc_params, fig=fig, ax=ax,
+                                           **kwargs)
+    if show:
+        plt.show()
+    return fig, ax, mappable
@@ -0,0 +1,345 @@
+"""Interpolated SNRs of stationary binaries over orbital frequency and eccentricity for a detector configuration.
+
+The SNR of a stationary binary only depends on its chirp mass and distance through a scaling,
+
+    rho = Phi(f_orb, e) * m_c^(5/3) / d
+
+so for each detector configuration we tabulate Phi (the SNR at m_c = 1 Msun and d = 1 kpc) from the exact
+harmonic sum of :func:`unitless.snr_stationary` on a regular grid in log f_orb and e, and interpolate log Phi
+bilinearly. The error of every grid cell is measured at its centre (where bilinear interpolation is worst) and
+cells that don't meet the tolerance, e.g. those that straddle a change in the number of harmonics, are left out
+of the validated region. The error is then checked again on random binaries inside the region.
+
+Binaries outside of the validated region (or that evolve during the observation, whose SNR depends on their
+masses in a more complicated way) fall back to the exact :func:`unitless.get_snr`, e.g.
+
+    surrogate = load_surrogate({"instrument": "TianQin"})
+    snr = surrogate.snr(m_1=m_1, m_2=m_2, f_orb=f_orb, dist=dist, ecc=ecc)
+
+:func:`load_surrogate` saves each model in ``paths.data`` the first time that it is built.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import astropy.units as u
+import paths
+from cache import cache_key
+from psd_engine import PSDEngine
+from unitless import chirp_mass, determine_stationarity, get_snr, snr_stationary
+
+__all__ = ["SNRSurrogate", "load_surrogate"]
+
+
+def _describe(sc_params):
+    """Human readable description of the sensitivity curve parameters of a surrogate"""
+    return json.dumps({key: str(value) for key, value in sorted(sc_params.items())})
+
+
+class SNRSurrogate():
+    """Interpolated SNR of stationary binaries for a single detector configuration, use :meth:`build` or
+    :func:`load_surrogate` to create one
+
+    Parameters
+    ----------
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    log_f : `float/array`
+        Evenly spaced nodes in log10 orbital frequency (Hz)
+
+    ecc : `float/array`
+        Evenly spaced nodes in eccentricity
+
+    log_phi : `float/array`
+        Natural log of the SNR at each node for m_c = 1 Msun and d = 1 kpc, shape (len(ecc), len(log_f))
+
+    error : `float/array`
+        Relative error of the interpolation at the centre of each cell, shape (len(ecc) - 1, len(log_f) - 1)
+
+    rtol : `float`
+        Cells with an ``error`` above this are outside of the validated region
+
+    gw_lum_tol, stat_tol : `float`
+        Tolerances used for the harmonics and stationarity (see :class:`legwork.source.Source`)
+
+    validation_error : `float/array`
+        Median, 99th percentile and maximum relative error of random binaries in the validated region
+
+    Attributes
+    ----------
+    valid : `bool/array`
+        Mask of the cells in the validated region, shape (len(ecc) - 1, len(log_f) - 1)
+
+    coverage : `float`
+        Fraction of the cells in the validated region
+
+    t_obs : `float`
+        Observation time in years
+    """
+    def __init__(self, sc_params, log_f, ecc, log_phi, error, rtol, gw_lum_tol=0.05, stat_tol=1e-2,
+                 validation_error=None):
+        self.sc_params = sc_params
+        self.log_f = log_f
+        self.ecc = ecc
+        self.log_phi = log_phi
+        self.error = error
+        self.rtol = rtol
+        self.gw_lum_tol = gw_lum_tol
+        self.stat_tol = stat_tol
+        self.validation_error = validation_error
+
+        self.t_obs = PSDEngine(sc_params).configs[0]["t_obs"].to(u.yr).value
+        self.valid = np.logical_and(error <= rtol, np.isfinite(error))
+        self.coverage = self.valid.mean()
+
+    @classmethod
+    def build(cls, sc_params={}, f_range=(1e-5, 1e-1), e_range=(0.0, 0.9), n_f=400, n_e=200, rtol=1e-2,
+              gw_lum_tol=0.05, stat_tol=1e-2, n_validate=1000, verbose=False):
+        """Tabulate the SNR of a detector configuration from the exact harmonic sum
+
+        Parameters
+        ----------
+        sc_params : `dict`
+            Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+        f_range : `tuple`
+            Range of orbital frequencies in Hz
+
+        e_range : `tuple`
+            Range of eccentricities
+
+        n_f, n_e : `int`
+            Number of nodes in log frequency and eccentricity
+
+        rtol : `float`
+            Maximum relative error of a cell in the validated region
+
+        gw_lum_tol, stat_tol : `float`
+            Tolerances used for the harmonics and stationarity (see :class:`legwork.source.Source`)
+
+        n_validate : `int`
+            Number of random binaries in the validated region on which to check the error
+
+        verbose : `boolean`
+            Whether to print how long the sweep took and the error estimate
+
+        Returns
+        -------
+        surrogate : `SNRSurrogate`
+            The surrogate
+        """
+        start = time.perf_counter()
+        log_f = np.linspace(*np.log10(f_range), n_f)
+        ecc = np.linspace(*e_range, n_e)
+        log_f_mid = 0.5 * (log_f[1:] + log_f[:-1])
+        ecc_mid = 0.5 * (ecc[1:] + ecc[:-1])
+
+        # evaluate the nodes and the cell centres together with m_c = 1 Msun (m_1 = m_2 = 2^(1/5) Msun)
+        f_orb = np.concatenate((np.broadcast_to(10**log_f, (n_e, n_f)).ravel(),
+                                np.broadcast_to(10**log_f_mid, (n_e - 1, n_f - 1)).ravel()))
+        e = np.concatenate((np.broadcast_to(ecc[:, np.newaxis], (n_e, n_f)).ravel(),
+                            np.broadcast_to(ecc_mid[:, np.newaxis], (n_e - 1, n_f - 1)).ravel()))
+        with np.errstate(divide="ignore"):
+            log_snr = np.log(snr_stationary(m_1=2**(1/5), m_2=2**(1/5), f_orb=f_orb, dist=1, ecc=e,
+                                            sc_params=sc_params, gw_lum_tol=gw_lum_tol))
+        log_phi, log_phi_mid = log_snr[:n_e * n_f].reshape(n_e, n_f), log_snr[n_e * n_f:].reshape(n_e - 1, n_f - 1)
+
+        # bilinear interpolation at the centre of a cell is the mean of its corners
+        corners = 0.25 * (log_phi[:-1, :-1] + log_phi[:-1, 1:] + log_phi[1:, :-1] + log_phi[1:, 1:])
+        with np.errstate(invalid="ignore"):
+            error = np.abs(np.exp(corners - log_phi_mid) - 1)
+        error[np.logical_not(np.isfinite(error))] = np.inf
+
+        surrogate = cls(sc_params, log_f, ecc, log_phi, error, rtol, gw_lum_tol=gw_lum_tol, stat_tol=stat_tol)
+
+        # check random binaries in the validated region (away from the nodes and centres used above)
+        rng = np.random.default_rng(42)
+        cells = rng.choice(np.flatnonzero(surrogate.valid), size=n_validate)
+        row, col = np.unravel_index(cells, surrogate.valid.shape)
+        f_check = 10**(log_f[col] + rng.random(n_validate) * (log_f[1] - log_f[0]))
+        e_check = ecc[row] + rng.random(n_validate) * (ecc[1] - ecc[0])
+        exact = snr_stationary(m_1=2**(1/5), m_2=2**(1/5), f_orb=f_check, dist=1, ecc=e_check, sc_params=sc_params,
+                               gw_lum_tol=gw_lum_tol)
+        check_error = np.abs(np.exp(surrogate._interpolate(f_check, e_check)[0]) / exact - 1)
+        surrogate.validation_error = np.percentile(check_error, [50, 99, 100])
+
+        if verbose:
+            print("Built SNR surrogate from {} exact SNRs in {:1.1f}s: {:1.1f}% of cells validated to {:1.0e}, "
+                  "errors of random binaries: median {:1.1e}, 99% {:1.1e}, max {:1.1e}".format(
+                      len(f_orb) + n_validate, time.perf_counter() - start, 100 * surrogate.coverage, rtol,
+                      *surrogate.validation_error))
+        return surrogate
+
+    def save(self, path):
+        """Save the surrogate as an ``.npz`` file
+
+        Parameters
+        ----------
+        path : `str`
+            Where to save the surrogate
+        """
+        np.savez(path, log_f=self.log_f, ecc=self.ecc, log_phi=self.log_phi, error=self.error, rtol=self.rtol,
+                 gw_lum_tol=self.gw_lum_tol, stat_tol=self.stat_tol, validation_error=self.validation_error,
+                 sc_params=_describe(self.sc_params))
+
+    @classmethod
+    def load(cls, path, sc_params={}):
+        """Load a surrogate saved with :meth:`save`
+
+        Parameters
+        ----------
+        path : `str`
+            Location of the surrogate
+
+        sc_params : `dict`
+            Sensitivity curve parameters that the surrogate was built with, used for the exact fallback
+
+        Returns
+        -------
+        surrogate : `SNRSurrogate`
+            The surrogate
+        """
+        data = np.load(path)
+        if str(data["sc_params"]) != _describe(sc_params):
+            raise ValueError("{} was built for sc_params {}, not {}".format(path, data["sc_params"],
+                                                                           _describe(sc_params)))
+        return cls(sc_params, data["log_f"], data["ecc"], data["log_phi"], data["error"], float(data["rtol"]),
+                   gw_lum_tol=float(data["gw_lum_tol"]), stat_tol=float(data["stat_tol"]),
+                   validation_error=data["validation_error"])
+
+    def _interpolate(self, f_orb, ecc):
+        """Bilinear interpolation of log Phi, along with whether each point is in the validated region"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = (np.log10(f_orb) - self.log_f[0]) / (self.log_f[1] - self.log_f[0])
+        y = (ecc - self.ecc[0]) / (self.ecc[1] - self.ecc[0])
+        inside = np.logical_and.reduce((x >= 0, x <= len(self.log_f) - 1, y >= 0, y <= len(self.ecc) - 1))
+
+        # the grid is evenly spaced so the cell follows directly (no search needed)
+        i = np.clip(np.where(inside, y, 0).astype(int), 0, len(self.ecc) - 2)
+        j = np.clip(np.where(inside, x, 0).astype(int), 0, len(self.log_f) - 2)
+        w_y, w_x = np.where(inside, y - i, 0), np.where(inside, x - j, 0)
+        log_phi = (1 - w_y) * ((1 - w_x) * self.log_phi[i, j] + w_x * self.log_phi[i, j + 1]) \
+            + w_y * ((1 - w_x) * self.log_phi[i + 1, j] + w_x * self.log_phi[i + 1, j + 1])
+        return log_phi, np.logical_and(inside, self.valid[i, j])
+
+    def covered(self, m_1, m_2, f_orb, ecc=0.0):
+        """Which binaries get their SNR from the surrogate (stationary and in the validated region)
+
+        Parameters
+        ----------
+        m_1, m_2 : `float/array`
+            Primary and secondary mass in Msun
+
+        f_orb : `float/array`
+            Orbital frequency in Hz
+
+        ecc : `float/array`
+            Eccentricity
+
+        Returns
+        -------
+        covered : `bool/array`
+            Mask of the binaries covered by the surrogate
+        """
+        _, valid = self._interpolate(*np.broadcast_arrays(np.asarray(f_orb, dtype=float),
+                                                          np.asarray(ecc, dtype=float)))
+        stationary = determine_stationarity(m_1, m_2, f_orb, self.t_obs, ecc, stat_tol=self.stat_tol)
+        return np.logical_and(np.broadcast_to(valid, stationary.shape), stationary)
+
+    def snr(self, m_1, m_2, f_orb, dist, ecc=0.0, exact=True, n_step=100):
+        """SNR of any number of binaries
+
+        Parameters
+        ----------
+        m_1, m_2 : `float/array`
+            Primary and secondary mass in Msun
+
+        f_orb : `float/array`
+            Orbital frequency in Hz
+
+        dist : `float/array`
+            Distance in kpc
+
+        ecc : `float/array`
+            Eccentricity
+
+        exact : `boolean`
+            Whether to compute the SNR of binaries that aren't covered by the surrogate with
+            :func:`unitless.get_snr` (otherwise they are NaN)
+
+        n_step : `int`
+            Number of timesteps for the exact SNR of evolving binaries
+
+        Returns
+        -------
+        snr : `float/array`
+            SNR of each binary, with the broadcast shape of the inputs
+        """
+        m_1, m_2, f_orb, dist, ecc = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                                           for a in (m_1, m_2, f_orb, dist, ecc)))
+        covered = self.covered(m_1, m_2, f_orb, ecc)
+        log_phi, _ = self._interpolate(f_orb[covered], ecc[covered])
+
+        snr = np.full(covered.shape, np.nan)
+        snr[covered] = np.exp(log_phi) * chirp_mass(m_1[covered], m_2[covered])**(5/3) / dist[covered]
+        rest = np.logical_not(covered)
+        if exact and rest.any():
+            snr[rest] = get_snr(m_1[rest], m_2[rest], f_orb[rest], dist[rest], ecc[rest], sc_params=self.sc_params,
+                                gw_lum_tol=self.gw_lum_tol, stat_tol=self.stat_tol, n_step=n_step)
+        return snr
+
+    def __call__(self, *args, **kwargs):
+        """Shortcut for :meth:`snr`"""
+        return self.snr(*args, **kwargs)
+
+
+def load_surrogate(sc_params={}, rebuild=False, verbose=False, **kwargs):
+    """Load the surrogate of a detector configuration from ``paths.data``, building and saving it first if it
+    doesn't exist yet (or if LEGWORK or any of the scripts that build it, e.g. :mod:`unitless`, have changed)
+
+    Parameters
+    ----------
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    rebuild : `boolean`
+        Whether to build the surrogate even if it has already been saved
+
+    verbose : `boolean`
+        Whether to print the error estimate when building the surrogate
+
+    **kwargs
+        Passed to :meth:`SNRSurrogate.build`
+
+    Returns
+    -------
+    surrogate : `SNRSurrogate`
+        The surrogate
+    """
+    path = paths.data / "snr_surrogate_{}.npz".format(cache_key(SNRSurrogate.build, sc_params, **kwargs)[:16])
+    if path.exists() and not rebuild:
+        return SNRSurrogate.load(path, sc_params)
+
+    surrogate = SNRSurrogate.build(sc_params, verbose=verbose, **kwargs)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    surrogate.save(path)
+    return surrogate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the SNR surrogate of each detector and report its error")
+    parser.add_argument("instruments", nargs="*", default=["LISA"], help="detectors to build surrogates for")
+    parser.add_argument("--t-obs", type=float, help="observation time in years (default: mission length)")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild surrogates that already exist")
+    args = parser.parse_args()
+
+    for instrument in args.instruments:
+        sc_params = {"instrument": instrument}
+        if args.t_obs is not None:
+            sc_params["t_obs"] = args.t_obs * u.yr
+        surrogate = load_surrogate(sc_params, rebuild=args.rebuild, verbose=True)
+        print("{}: {:1.1f}% of cells validated to {:1.0e}, errors of random binaries: median {:1.1e}, "
+              "99% {:1.1e}, max {:1.1e}".format(instrument, 100 * surrogate.coverage, surrogate.rtol,
+                                                *surrogate.validation_error))
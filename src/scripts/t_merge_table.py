@@ -0,0 +1,288 @@
+"""Fast eccentric merger times from a precomputed table of the eccentricity dependence.
+
+The merger time from Peters (1964) Eq. 5.14 is the circular merger time of a binary with the same semi-major
+axis multiplied by a function of the initial eccentricity alone,
+
+    t_merge = a_i^4 / (4 beta) * F(e),    F(e) = 48/19 * (c_0 / a_i)^4 * int_0^e peters_5_14(e') de'
+
+where c_0 / a_i only depends on e. Rather than integrating Eq. 5.14 for every binary (as
+:func:`legwork.evol.get_t_merge_ecc` does for intermediate eccentricities) we tabulate F(e) once, save the
+table in ``paths.data`` and interpolate it. Since F(e) vanishes as (1 - e^2)^(7/2) for e -> 1 we actually
+tabulate H = F(e) / (1 - e^2)^(7/2) as a function of s = sqrt(1 - e^2), which is smooth over the whole range
+(H = 1 at s = 1 and H = 768/425 at s = 0).
+"""
+import argparse
+import os
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+from scipy.integrate import quad
+from scipy.interpolate import CubicSpline
+import paths
+
+__all__ = ["TABLE_VERSION", "eccentricity_factor", "merger_time_factor", "get_t_merge_ecc", "get_merger_time",
+           "build_table", "load_table"]
+
+# bump this whenever the way the table is computed changes so that old tables are rebuilt
+TABLE_VERSION = 1
+
+# maximum relative error of the interpolated eccentricity factor
+RTOL = 1e-8
+
+# loaded table, only read from disk once per session
+_table = None
+
+
+def _peters_5_14_s(s):
+    """Integrand of Peters Eq. 5.14 after changing variable to s = sqrt(1 - e^2), this avoids losing precision
+    in 1 - e^2 as e -> 1"""
+    e_2 = 1 - s**2
+    return e_2**(5/19) * (1 + (121/304) * e_2)**(1181/2299) / s**2
+
+
+def _c_0_ratio_4(e):
+    """(c_0 / a_i)^4 from Peters Eq. 5.11, a function of eccentricity only"""
+    return ((1 - e**2) / (e**(12/19) * (1 + (121/304) * e**2)**(870/2299)))**4
+
+
+def _exact_h(s):
+    """Exact H(s) = F(e) / s^7 for sorted ``s`` in (0, 1], integrating Eq. 5.14 one interval at a time"""
+    # integral of Eq. 5.14 from 0 to e is the integral from s to 1 in terms of s
+    pieces = [quad(_peters_5_14_s, lower, upper, epsabs=0, epsrel=1e-13, limit=200)[0]
+              for lower, upper in zip(s, np.append(s[1:], 1.0))]
+    integral = np.cumsum(pieces[::-1])[::-1]
+
+    # H = 48/19 * (c_0 / a_i)^4 * integral / s^7, written in terms of s
+    e_2 = 1 - s**2
+    h = np.ones(len(s))
+    ecc = e_2 > 0
+    h[ecc] = 48 / 19 * s[ecc] * integral[ecc] / (e_2[ecc]**(24/19) * (1 + (121/304) * e_2[ecc])**(3480/2299))
+    return h
+
+
+def build_table(rtol=RTOL, n_start=64, n_max=2**16):
+    """Build the table of H(s), doubling the number of nodes until the cubic spline through them is accurate to
+    ``rtol`` at the midpoint of every interval
+
+    Parameters
+    ----------
+    rtol : `float`
+        Maximum relative error of the interpolated factor
+
+    n_start : `int`
+        Initial number of intervals
+
+    n_max : `int`
+        Maximum number of intervals
+
+    Returns
+    -------
+    table : `dict`
+        Nodes in ``s``, values of ``H`` at each node, maximum relative ``error`` of the interpolation and the
+        table ``version``
+    """
+    n = n_start
+    while True:
+        s = np.linspace(0, 1, 2 * n + 1)
+        h = np.concatenate(([768 / 425], _exact_h(s[1:])))
+        nodes, mid = slice(None, None, 2), slice(1, None, 2)
+
+        spline = CubicSpline(s[nodes], h[nodes])
+        error = np.max(np.abs(spline(s[mid]) / h[mid] - 1))
+        if error <= rtol or n >= n_max:
+            return {"s": s, "h": h, "error": error, "rtol": rtol, "version": TABLE_VERSION}
+        n *= 2
+
+
+def load_table(rebuild=False):
+    """Load the table from ``paths.data``, building (and saving) it first if it doesn't exist yet or if it was
+    made with a different ``TABLE_VERSION``
+
+    The table is written to a temporary file and then renamed so that processes that start at the same time
+    never read a partially written table.
+
+    Parameters
+    ----------
+    rebuild : `boolean`
+        Whether to rebuild the table even if it exists
+
+    Returns
+    -------
+    spline : `scipy.interpolate.CubicSpline`
+        Spline giving H as a function of s
+    """
+    global _table
+    if _table is not None and not rebuild:
+        return _table
+
+    path = paths.data / "t_merge_ecc_table_v{}.npz".format(TABLE_VERSION)
+    table = None
+    if path.exists() and not rebuild:
+        table = dict(np.load(path))
+        if int(table["version"]) != TABLE_VERSION or float(table["rtol"]) > RTOL:
+            table = None
+    if table is None:
+        table = build_table()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = ".{}.tmp".format(os.getpid())
+        np.savez(str(path) + suffix, **table)
+        os.replace(str(path) + suffix + ".npz", path)
+
+    # every node was used to check the error so we can use them all for interpolation
+    _table = CubicSpline(table["s"], table["h"])
+    return _table
+
+
+def eccentricity_factor(ecc):
+    """Factor by which the eccentricity of a binary changes its merger time (exact Peters 1964 Eq. 5.14)
+
+    Parameters
+    ----------
+    ecc : `float/array`
+        Initial eccentricity
+
+    Returns
+    -------
+    factor : `float/array`
+        Factor by which to multiply the circular merger time (for the same semi-major axis)
+    """
+    ecc = np.asarray(ecc, dtype=float)
+    s = np.sqrt(1 - ecc**2)
+    return load_table()(s) * s**7
+
+
+def get_t_merge_ecc(ecc_i, a_i=None, f_orb_i=None, beta=None, m_1=None, m_2=None,
+                    small_e_tol=0.15, large_e_tol=1 - 1e-4, exact=True):
+    """Drop-in replacement for :func:`legwork.evol.get_t_merge_ecc` that interpolates the eccentricity
+    dependence from a table instead of integrating Peters Eq. 5.14 for each binary
+
+    The small and large eccentricity approximations are applied outside of ``small_e_tol`` and
+    ``large_e_tol`` exactly as in LEGWORK so that results agree. Since the table is accurate for all
+    eccentricities you can set ``small_e_tol=0`` and ``large_e_tol=1`` to use it everywhere instead.
+
+    Parameters
+    ----------
+    ecc_i : `float/array`
+        Initial eccentricity
+
+    a_i : `float/array`
+        Initial semi-major axis (if supplied `f_orb_i` is ignored)
+
+    f_orb_i : `float/array`
+        Initial orbital frequency (required if `a_i` is None)
+
+    beta : `float/array`
+        Constant defined in Peters and Mathews (1964) Eq. 5.9. See :meth:`legwork.utils.beta`
+        (if supplied `m_1` and `m_2` are ignored)
+
+    m_1 : `float/array`
+        Primary mass (required if `beta` is None)
+
+    m_2 : `float/array`
+        Secondary mass (required if `beta` is None)
+
+    small_e_tol : `float`
+        Eccentricity below which to apply the small e approximation
+
+    large_e_tol : `float`
+        Eccentricity above which to apply the large e approximation
+
+    exact : `boolean`
+        Whether to use the (interpolated) exact result or the fit from Mandel 2021 in the intermediate range
+
+    Returns
+    -------
+    t_merge : `float/array`
+        Merger time
+    """
+    beta, a_i = lw.evol.check_mass_freq_input(beta=beta, m_1=m_1, m_2=m_2, a_i=a_i, f_orb_i=f_orb_i)
+    ecc_i, t_circ = np.broadcast_arrays(np.asarray(ecc_i, dtype=float), (a_i**4 / (4 * beta)).to(u.Gyr),
+                                        subok=True)
+
+    t_merge = t_circ * merger_time_factor(ecc_i, small_e_tol=small_e_tol, large_e_tol=large_e_tol, exact=exact)
+    return t_merge[()] if t_merge.ndim == 0 else t_merge
+
+
+def merger_time_factor(ecc_i, small_e_tol=0.15, large_e_tol=1 - 1e-4, exact=True):
+    """Ratio of the merger time of an eccentric binary to that of a circular binary with the same semi-major
+    axis, using the same approximations as :func:`get_t_merge_ecc`
+
+    Parameters
+    ----------
+    ecc_i : `float/array`
+        Initial eccentricity
+
+    small_e_tol, large_e_tol, exact
+        See :func:`get_t_merge_ecc`
+
+    Returns
+    -------
+    factor : `float/array`
+        Factor by which to multiply the circular merger time
+    """
+    ecc_i = np.asarray(ecc_i, dtype=float)
+    circular = ecc_i == 0.0
+    small_e = np.logical_and(ecc_i > 0.0, ecc_i < small_e_tol)
+    large_e = ecc_i > large_e_tol
+    other_e = np.logical_and(ecc_i >= small_e_tol, ecc_i <= large_e_tol)
+
+    factor = np.ones(ecc_i.shape)
+
+    # low and high e approximations (equations after Peters Eq. 5.14)
+    approx = np.logical_or(small_e, large_e)
+    factor[approx] = _c_0_ratio_4(ecc_i[approx]) * ecc_i[approx]**(48/19)
+    factor[large_e] *= (768 / 425) * (1 - ecc_i[large_e]**2)**(-1/2) \
+        * (1 + 121/304 * ecc_i[large_e]**2)**(3480/2299)
+
+    # general binaries (Peters Eq. 5.14)
+    factor[other_e] = eccentricity_factor(ecc_i[other_e]) if exact \
+        else lw.evol.t_merge_mandel_fit(ecc_i[other_e])
+    factor[circular] = 1.0
+    return factor
+
+
+def get_merger_time(sources, save_in_class=True, which_sources=None):
+    """Equivalent of :meth:`legwork.source.Source.get_merger_time` that uses the table
+
+    Parameters
+    ----------
+    sources : `legwork.source.Source`
+        Sources for which to compute the merger time
+
+    save_in_class : `bool`, optional
+        Whether the save the result into ``sources.t_merge``, by default True
+
+    which_sources : `bool/array`, optional
+        A mask for the subset of sources for which to calculate the merger time, by default all sources
+        (ignored if ``save_in_class`` is True)
+
+    Returns
+    -------
+    t_merge : `float/array`
+        Merger times
+    """
+    if save_in_class or which_sources is None:
+        which_sources = np.repeat(True, sources.n_sources)
+    t_merge = np.zeros(len(which_sources)) * u.Gyr
+
+    # only compute merger times for inspiralling binaries
+    insp = np.logical_and(which_sources, np.logical_not(sources.merged))
+    t_merge[insp] = get_t_merge_ecc(ecc_i=sources.ecc[insp], f_orb_i=sources.f_orb[insp],
+                                    m_1=sources.m_1[insp], m_2=sources.m_2[insp])
+    if save_in_class:
+        sources.t_merge = t_merge
+
+    return t_merge[which_sources]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the shared merger time table in src/data and report its "
+                                                 "error")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the table even if it already exists")
+    args = parser.parse_args()
+
+    load_table(rebuild=args.rebuild)
+    table = np.load(paths.data / "t_merge_ecc_table_v{}.npz".format(TABLE_VERSION))
+    print("merger time table: {} nodes, maximum relative error {:1.1e}".format(len(table["s"]),
+                                                                                 float(table["error"])))
@@ -0,0 +1,261 @@
+"""Evaluate a function over a large 2D parameter grid in tiles so that memory doesn't grow with the grid.
+
+Flattening a full ``np.meshgrid`` and repeating masses and distances to its length creates several copies of the
+grid before anything is computed, and every intermediate array inside the calculation is grid-sized too. At the
+resolution of a zoomed production map (e.g. 5000 x 4000) that is more than the memory of most machines.
+:func:`evaluate_grid` instead walks through the grid in row-major tiles of at most ``max_elements`` points. Each
+tile only sees its slice of each axis, as views that broadcast against each other
+(``row_values[rows, np.newaxis]`` and ``col_values[np.newaxis, cols]``), so the full inputs are never created.
+The results of each tile are written straight into preallocated output grids, which can be ``.npy`` files that
+are memory-mapped from disk, and can also be fed to streaming reductions (e.g. :class:`RowMin` or
+:class:`LevelCrossing`) so that a grid that is only needed for a summary never has to be kept at all, e.g.
+
+    def tile(ecc, f_orb):
+        return {"t_merge": unitless.get_t_merge_ecc(m_1=10, m_2=10, f_orb_i=f_orb, ecc_i=ecc)}
+
+    grids, reduced = evaluate_grid(tile, e_range, f_range, out_dir=paths.data / "t_merge_grid",
+                                   reductions={"f_merge": LevelCrossing("t_merge", level=4)})
+
+The peak memory is then a few tiles of intermediates plus whatever the reductions keep (one value per row).
+"""
+import pathlib
+import time
+
+import numpy as np
+
+__all__ = ["MAX_ELEMENTS", "tiles", "allocate", "evaluate_grid", "RowMin", "RowMax", "LevelCrossing"]
+
+# default number of grid points in each tile
+MAX_ELEMENTS = 2**20
+
+
+def tiles(shape, max_elements=MAX_ELEMENTS):
+    """Split a grid into row-major tiles of whole rows, or pieces of a single row if one row is too long
+
+    Parameters
+    ----------
+    shape : `tuple`
+        Number of rows and columns of the grid
+
+    max_elements : `int`
+        Maximum number of grid points in a tile
+
+    Yields
+    ------
+    rows, cols : `slice`
+        Rows and columns of each tile, in order (so the columns of each row are visited from left to right)
+    """
+    n_rows, n_cols = shape
+    if n_cols <= max_elements:
+        rows_per_tile = max(max_elements // max(n_cols, 1), 1)
+        for start in range(0, n_rows, rows_per_tile):
+            yield slice(start, min(start + rows_per_tile, n_rows)), slice(0, n_cols)
+    else:
+        for row in range(n_rows):
+            for start in range(0, n_cols, max_elements):
+                yield slice(row, row + 1), slice(start, min(start + max_elements, n_cols))
+
+
+def allocate(shape, dtype=float, path=None):
+    """Preallocate an output grid, either in memory or as a ``.npy`` file that is memory-mapped from disk
+
+    Parameters
+    ----------
+    shape : `tuple`
+        Shape of the grid
+
+    dtype : `type`
+        Data type of the grid
+
+    path : `str`
+        Where to create the ``.npy`` file, None to keep the grid in memory
+
+    Returns
+    -------
+    grid : `np.ndarray` or `np.memmap`
+        Uninitialised grid
+    """
+    if path is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+class RowMin():
+    """Minimum of an output over each row of the grid, and the column at which it occurs
+
+    Parameters
+    ----------
+    key : `str`
+        Output to reduce
+    """
+    _better = staticmethod(np.less)
+    _reduce, _arg = staticmethod(np.min), staticmethod(np.argmin)
+    _start = np.inf
+
+    def __init__(self, key):
+        self.key = key
+        self.values = None
+        self.index = None
+
+    def update(self, values, rows, cols):
+        """Fold in one tile of values (shape (rows, cols)) at the given slices of the grid"""
+        # NaNs are skipped, so a row that is all NaN in this tile leaves the row unchanged
+        missing = np.isnan(values)
+        values = np.where(missing, self._start, values)
+        best = self._reduce(values, axis=1)
+        index = self._arg(values, axis=1) + cols.start
+        better = np.logical_and(self._better(best, self.values[rows]), np.logical_not(missing.all(axis=1)))
+        self.values[rows] = np.where(better, best, self.values[rows])
+        self.index[rows] = np.where(better, index, self.index[rows])
+
+    def start(self, shape):
+        """Reset the reduction for a grid of the given shape"""
+        self.values = np.full(shape[0], self._start)
+        self.index = np.full(shape[0], -1)
+
+    def result(self):
+        """Extreme value of each row and the column index where it occurs (-1 for rows that were all NaN)"""
+        return self.values, self.index
+
+
+class RowMax(RowMin):
+    """Maximum of an output over each row of the grid, and the column at which it occurs
+
+    Parameters
+    ----------
+    key : `str`
+        Output to reduce
+    """
+    _better = staticmethod(np.greater)
+    _reduce, _arg = staticmethod(np.max), staticmethod(np.argmax)
+    _start = -np.inf
+
+
+class LevelCrossing():
+    """Where an output first crosses a level along each row of the grid, e.g. the frequency at which the merger
+    time drops below the mission length for each eccentricity
+
+    Crossings between the last column of one tile and the first column of the next are found too.
+
+    Parameters
+    ----------
+    key : `str`
+        Output to reduce
+
+    level : `float`
+        Level to look for
+    """
+    def __init__(self, key, level):
+        self.key = key
+        self.level = level
+        self.position = None
+        self.count = None
+        self._last = None
+
+    def start(self, shape):
+        """Reset the reduction for a grid of the given shape"""
+        self.position = np.full(shape[0], np.nan)
+        self.count = np.zeros(shape[0], dtype=int)
+        self._last = np.full(shape[0], np.nan)
+
+    def update(self, values, rows, cols):
+        """Fold in one tile of values (shape (rows, cols)) at the given slices of the grid"""
+        # prepend the last value of each row from the previous tile (NaN at the start of a row)
+        previous = self._last[rows] if cols.start > 0 else np.full(values.shape[0], np.nan)
+        values = np.concatenate((previous[:, np.newaxis], values - self.level), axis=1)
+        self._last[rows] = values[:, -1]
+
+        with np.errstate(invalid="ignore"):
+            crossed = values[:, :-1] * values[:, 1:] < 0
+            crossed |= np.logical_and(values[:, 1:] == 0, values[:, :-1] != 0)
+        self.count[rows] += crossed.sum(axis=1)
+
+        # linear interpolation between the columns on either side of the first crossing in each row
+        first = np.argmax(crossed, axis=1)
+        new = np.logical_and(crossed.any(axis=1), np.isnan(self.position[rows]))
+        i = np.arange(values.shape[0])[new]
+        left, right = values[i, first[new]], values[i, first[new] + 1]
+        position = self.position[rows]
+        position[new] = cols.start - 1 + first[new] + left / (left - right)
+        self.position[rows] = position
+
+    def result(self):
+        """Fractional column index of the first crossing in each row (NaN if it never crosses) and the number
+        of crossings in each row, use ``np.interp(position, np.arange(n_cols), col_values)`` for the value of
+        the column axis"""
+        return self.position, self.count
+
+
+def evaluate_grid(func, row_values, col_values, out=None, out_dir=None, keep=None, reductions={},
+                  max_elements=MAX_ELEMENTS, verbose=False):
+    """Evaluate a function over the grid of two axes one tile at a time
+
+    Parameters
+    ----------
+    func : `function`
+        Called as ``func(row_values[rows, np.newaxis], col_values[np.newaxis, cols])`` for each tile and returns
+        a dict of arrays that broadcast to the shape of the tile
+
+    row_values, col_values : `float/array`
+        Axes of the grid, so the grid has shape (len(row_values), len(col_values))
+
+    out : `dict`
+        Preallocated output grids to write into (e.g. from :func:`allocate`), any other outputs that are kept are
+        allocated when the first tile is done
+
+    out_dir : `str` or `pathlib.Path`
+        Directory in which to memory-map newly allocated outputs as ``<key>.npy``, None to keep them in memory
+
+    keep : `list`
+        Outputs to keep, default all of them. Outputs that aren't kept are only passed to the reductions.
+
+    reductions : `dict`
+        Streaming reductions (e.g. :class:`RowMin`, :class:`LevelCrossing`) by name
+
+    max_elements : `int`
+        Maximum number of grid points in each tile
+
+    verbose : `boolean`
+        Whether to print how long the evaluation took
+
+    Returns
+    -------
+    grids : `dict`
+        Output grids that were kept, by key
+
+    reduced : `dict`
+        Result of each reduction, by name
+    """
+    shape = (len(row_values), len(col_values))
+    grids = {} if out is None else dict(out)
+    if out_dir is not None:
+        out_dir = pathlib.Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+    for reduction in reductions.values():
+        reduction.start(shape)
+
+    start = time.perf_counter()
+    n_tiles = 0
+    for rows, cols in tiles(shape, max_elements=max_elements):
+        tile_shape = (rows.stop - rows.start, cols.stop - cols.start)
+        results = func(row_values[rows, np.newaxis], col_values[np.newaxis, cols])
+
+        for key, values in results.items():
+            if keep is not None and key not in keep:
+                continue
+            values = np.broadcast_to(values, tile_shape)
+            if key not in grids:
+                grids[key] = allocate(shape, dtype=values.dtype,
+                                      path=None if out_dir is None else out_dir / "{}.npy".format(key))
+            grids[key][rows, cols] = values
+        for reduction in reductions.values():
+            reduction.update(np.broadcast_to(results[reduction.key], tile_shape), rows, cols)
+        n_tiles += 1
+
+    for grid in grids.values():
+        if isinstance(grid, np.memmap):
+            grid.flush()
+    if verbose:
+        print("Evaluated {} grid points in {} tiles in {:1.2f}s".format(shape[0] * shape[1], n_tiles,
+                                                                      time.perf_counter() - start))
+    return grids, {name: reduction.result() for name, reduction in reductions.items()}
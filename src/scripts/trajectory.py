@@ -0,0 +1,444 @@
+"""Stream the evolution and SNR of binaries one timestep at a time.
+
+Tracking the SNR of a binary as it inspirals usually means integrating the evolution with
+:func:`legwork.evol.evol_ecc` for every timestep and then building a new :class:`legwork.source.Source` out of the
+snapshots. :func:`snr_along_trajectory` instead advances every binary from one timestep to the next and yields
+(time, eccentricity, orbital frequency, SNR) as it goes, so memory only scales with the number of binaries that
+are still being tracked and binaries can be dropped as soon as they cross an SNR threshold or a frequency cutoff.
+
+:func:`evolve_binaries` evolves whole populations in the same way without the SNR, writing the eccentricity and
+frequency of each binary at each timestep into preallocated (and optionally memory-mapped) arrays.
+
+No ODE needs to be integrated. Along a Peters (1964) trajectory with constant c_0 (Eq. 5.11) the time left until
+the merger is
+
+    t_merge(e) = c_0^4 / (4 beta) * K(e),    K(e) = 48/19 * int_0^e peters_5_14(e') de'
+
+so evolving a binary by a time t just lowers K by 4 beta t / c_0^4 and the new eccentricity follows by inverting
+K, which comes from the same table as :mod:`t_merge_table`. Each inversion starts from the eccentricity of the
+previous timestep, so a couple of Newton steps are enough.
+"""
+import os
+from collections import namedtuple
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import astropy.constants as const
+from scipy.special import expit
+import g_table
+from multi_detector import HARMONIC_GROUPS
+from psd_engine import PSDEngine
+from t_merge_table import load_table
+
+__all__ = ["TrajectoryStep", "Evolution", "evolve_binaries", "snr_along_trajectory"]
+
+TrajectoryStep = namedtuple("TrajectoryStep", ["index", "t", "ecc", "f_orb", "snr"])
+TrajectoryStep.__doc__ = """State of the binaries that are still being tracked at one timestep
+
+index : indices of the binaries in the input arrays
+t : time since the start of the evolution
+ecc : eccentricity
+f_orb : orbital frequency
+snr : SNR of an observation starting at this time"""
+
+Evolution = namedtuple("Evolution", ["t", "ecc", "f_orb", "n_valid"])
+Evolution.__doc__ = """Evolution of a set of binaries from :func:`evolve_binaries`, each with shape (n_binaries, n_step)
+
+t : time since the start of the evolution in years
+ecc : eccentricity
+f_orb : orbital frequency in Hz
+n_valid : number of timesteps of each binary before it was stopped (the rest are NaN)"""
+
+G = const.G.si.value
+C = const.c.si.value
+
+# time before the merger at which evolving binaries are cut off, the same as `legwork.snr.snr_ecc_evolving`
+T_BEFORE = (0.1 * u.yr).to(u.s).value
+
+# grid in y = log(e / (1 - e)) for the initial guess of the inversion
+_Y_GRID = np.linspace(-40, 40, 801)
+_log_k_grid = None
+
+
+def _log_k(y):
+    """log K(e) with e = expit(y), precise for e -> 0 and e -> 1 (K from the table of H(s) = F(e) / s^7)"""
+    e, one_minus_e = expit(y), expit(-y)
+    e_2 = e**2
+    s = np.sqrt(one_minus_e * (1 + e))
+    return (np.log(load_table()(s)) + (48 / 19) * np.log(e) + (3480 / 2299) * np.log1p((121 / 304) * e_2)
+            - np.log(s))
+
+
+def _d_log_k_dy(y):
+    """Derivative of log K with respect to y, from Peters Eq. 5.14"""
+    e, one_minus_e = expit(y), expit(-y)
+    s = np.sqrt(one_minus_e * (1 + e))
+    dk_de = (48 / 19) * e**(29 / 19) * (1 + (121 / 304) * e**2)**(1181 / 2299) / s**3
+    return dk_de * e * one_minus_e / np.exp(_log_k(y))
+
+
+def _invert_log_k(log_k, y=None, max_iter=20, tol=1e-12):
+    """Find y = log(e / (1 - e)) such that log K(e) = ``log_k``, starting from ``y`` if given"""
+    global _log_k_grid
+    if y is None:
+        if _log_k_grid is None:
+            _log_k_grid = _log_k(_Y_GRID)
+        y = np.interp(log_k, _log_k_grid, _Y_GRID)
+
+    # log K is close to linear in y at both ends so Newton's method converges quickly
+    for _ in range(max_iter):
+        step = (_log_k(y) - log_k) / _d_log_k_dy(y)
+        y = y - step
+        if np.all(np.abs(step) < tol):
+            break
+    return y
+
+
+def _a_from_ecc(y, c_0):
+    """Semi-major axis for eccentricity e = expit(y) on the track with constant c_0 (Peters Eq. 5.11)"""
+    e, one_minus_e = expit(y), expit(-y)
+    return c_0 * e**(12 / 19) / (one_minus_e * (1 + e)) * (1 + (121 / 304) * e**2)**(870 / 2299)
+
+
+class _Binaries():
+    """Evolution state of a set of binaries, all quantities in SI units without astropy units"""
+    def __init__(self, m_1, m_2, f_orb_i, ecc_i):
+        self.m_tot = (m_1 + m_2).to(u.kg).value
+        self.beta = lw.utils.beta(m_1, m_2).to(u.m**4 / u.s).value
+        a_i = lw.utils.get_a_from_f_orb(f_orb_i, m_1, m_2).to(u.m).value
+
+        # circular binaries stay circular and a^4 decreases linearly in time, the rest follow K(e)
+        self.circular = ecc_i == 0.0
+        self.a_4 = a_i**4
+        self.c_0 = np.zeros(len(ecc_i))
+        self.log_k = np.full(len(ecc_i), -np.inf)
+
+        # y = log(e / (1 - e)) of the latest timestep, the starting point of the next inversion
+        self.y = np.full(len(ecc_i), -np.inf)
+        ecc = np.logical_not(self.circular)
+        if ecc.any():
+            self.c_0[ecc] = lw.utils.c_0(a_i[ecc] * u.m, ecc_i[ecc]).to(u.m).value
+            self.y[ecc] = np.log(ecc_i[ecc] / (1 - ecc_i[ecc]))
+            self.log_k[ecc] = _log_k(self.y[ecc])
+
+    def t_merge(self, which=slice(None)):
+        """Time until the merger at the start of the evolution in seconds"""
+        circular = self.circular[which]
+        return np.where(circular, self.a_4[which], self.c_0[which]**4 * np.exp(self.log_k[which])) \
+            / (4 * self.beta[which])
+
+    def state(self, t, which, y_guess=None):
+        """Eccentricity, y = log(e / (1 - e)) and semi-major axis at times ``t`` (in seconds after the start),
+        ``t`` must be before the merger and broadcastable with ``which``"""
+        beta, circular = self.beta[which], self.circular[which]
+        y = np.broadcast_to(self.y[which], np.broadcast(t, beta).shape).copy()
+        a = np.zeros(y.shape)
+        c_0 = self.c_0[which] * np.ones(y.shape)
+        circular = np.broadcast_to(circular, y.shape)
+        beta = np.broadcast_to(beta, y.shape)
+        t = np.broadcast_to(t, y.shape)
+
+        a[circular] = (np.broadcast_to(self.a_4[which], y.shape)[circular]
+                       - 4 * beta[circular] * t[circular])**(1 / 4)
+
+        ecc = np.logical_not(circular)
+        if ecc.any():
+            # K(t) = K_i - 4 beta t / c_0^4, written relative to K_i to keep precision close to the merger
+            log_k_i = np.broadcast_to(self.log_k[which], y.shape)[ecc]
+            ratio = 4 * beta[ecc] * t[ecc] / (c_0[ecc]**4 * np.exp(log_k_i))
+            guess = None if y_guess is None else np.broadcast_to(y_guess, y.shape)[ecc]
+            y[ecc] = _invert_log_k(log_k_i + np.log1p(-ratio), y=guess)
+            a[ecc] = _a_from_ecc(y[ecc], c_0[ecc])
+
+        return expit(y) * ecc, y, a
+
+    def f_orb(self, a, which):
+        """Orbital frequency in Hz from the semi-major axis in metres (Kepler's third law)"""
+        return np.sqrt(G * self.m_tot[which] / a**3) / (2 * np.pi)
+
+
+def _stationary(m_c, f_orb, ecc, t_obs, stat_tol):
+    """Same criterion as :func:`legwork.evol.determine_stationarity`, in SI units without astropy units"""
+    inner = f_orb**(-8/3) - 2**(32/3) * np.pi**(8/3) * t_obs / (5 * C**5) * (G * m_c)**(5/3) \
+        * lw.utils.peters_f(ecc)
+    f_orb_f = np.where(inner >= 0.0, np.abs(inner)**(-3/8), 1e9)
+    return (f_orb_f - f_orb) / f_orb <= stat_tol
+
+
+def _stationary_snr_2(m_c, f_orb, ecc, dist, t_obs, harmonics_required, psd):
+    """SNR^2 of a single harmonic group of stationary binaries, as in :func:`legwork.snr.snr_ecc_stationary`
+    (in SI units without astropy units since this runs at every timestep)"""
+    n_range = np.arange(1, harmonics_required + 1)[np.newaxis, :]
+    h_0_2 = (2**(28/3) / 5) * G**(10/3) / C**8 * m_c**(10/3) * (np.pi * f_orb)**(4/3) / dist**2
+    h_0_n_2 = h_0_2[:, np.newaxis] * g_table.peters_g(n_range, ecc[:, np.newaxis]) / n_range**2
+    f_n = n_range * f_orb[:, np.newaxis]
+    return (h_0_n_2 * t_obs / psd(f_n * u.Hz).to(1 / u.Hz).value).sum(axis=1)
+
+
+def _evolving_snr_2(binaries, which, m_c, dist, y, t, t_obs, n_step, harmonics_required, psd, circular):
+    """SNR^2 of a single harmonic group of evolving binaries, as in :func:`legwork.snr.snr_ecc_evolving` but
+    sampling the same analytic evolution as the trajectory itself (``circular`` binaries only use n = 2 with
+    the strain of a circular binary, as in :func:`legwork.snr.snr_circ_evolving`)"""
+    t_merge = binaries.t_merge(which) - t
+    t_evol = np.minimum(t_merge - (1.0 if circular else T_BEFORE), t_obs.to(u.s).value)
+    times = t[:, np.newaxis] + t_evol[:, np.newaxis] * np.linspace(0, 1, n_step)[np.newaxis, :]
+    ecc_evol, _, a_evol = binaries.state(times, which[:, np.newaxis], y_guess=y[:, np.newaxis])
+    f_orb_evol = binaries.f_orb(a_evol, which[:, np.newaxis]) * u.Hz
+    if circular:
+        ecc_evol = np.zeros(ecc_evol.shape)
+
+    n_range = np.arange(1, harmonics_required + 1)
+    h_c_n_2 = lw.strain.h_c_n(m_c=m_c, f_orb=f_orb_evol, ecc=ecc_evol, n=n_range, dist=dist)**2
+    h_c_n_2 = h_c_n_2.reshape(len(m_c), n_step, harmonics_required)
+    f_n = n_range[np.newaxis, np.newaxis, :] * f_orb_evol[..., np.newaxis]
+    return np.trapz(y=h_c_n_2 / (f_n**2 * psd(f_n)), x=f_n, axis=1).decompose().value.sum(axis=1)
+
+
+def evolve_binaries(m_1, m_2, f_orb_i, ecc_i, t_evol=None, n_step=100, timesteps=None, t_before=None,
+                    chunk_size=10000, out_dir=None):
+    """Evolve many binaries at once, the vectorized equivalent of calling :func:`legwork.evol.evol_ecc` for
+    each binary
+
+    Each binary stops at its own time, either the end of ``t_evol`` or ``t_before`` before its merger. With
+    ``t_evol`` every binary gets ``n_step`` evenly spaced timesteps up to when it stops (so each is resampled
+    on its own grid), while with ``timesteps`` every binary shares the same times and those after a binary
+    stops are NaN (so the arrays are ragged, with ``n_valid`` timesteps in each row).
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass
+
+    f_orb_i : `float/array`
+        Initial orbital frequency
+
+    ecc_i : `float/array`
+        Initial eccentricity
+
+    t_evol : `float/array`
+        Length of the evolution of each binary (ignored if ``timesteps`` is supplied)
+
+    n_step : `int`
+        Number of timesteps (ignored if ``timesteps`` is supplied)
+
+    timesteps : `float/array`
+        Times after the start at which to record every binary, must be increasing. Either shared by every binary
+        or one row for each binary, with shape (n_binaries, n_step).
+
+    t_before : `float`
+        Stop each binary this long before its merger (like ``avoid_merger`` in :func:`legwork.evol.evol_ecc`),
+        default is to evolve up to the merger, after which binaries have e = 0 and f_orb = 100 Hz as in LEGWORK.
+        Binaries that are already closer than this to their merger are only recorded at the start.
+
+    chunk_size : `int`
+        Number of binaries evolved together, which sets the memory used on top of the outputs
+
+    out_dir : `str`
+        Directory in which to write the outputs as memory-mapped ``.npy`` files (``t``, ``ecc``, ``f_orb`` and
+        ``n_valid``) rather than keeping them in memory
+
+    Returns
+    -------
+    evolution : `Evolution`
+        Times (yr), eccentricities and orbital frequencies (Hz), each with shape (n_binaries, n_step), and the
+        number of valid timesteps of each binary
+    """
+    m_1, m_2, f_orb_i = (np.atleast_1d(q) for q in (m_1, m_2, f_orb_i))
+    ecc_i = np.atleast_1d(ecc_i).astype(float)
+    n_binaries = max(len(m_1), len(m_2), len(f_orb_i), len(ecc_i))
+    m_1, m_2, f_orb_i, ecc_i = (q if len(q) == n_binaries else np.broadcast_to(q, (n_binaries,))
+                                for q in (m_1, m_2, f_orb_i, ecc_i))
+    if timesteps is not None:
+        timesteps = np.atleast_1d(timesteps.to(u.s).value)
+        n_step = timesteps.shape[-1]
+    elif t_evol is not None:
+        t_evol = np.broadcast_to(t_evol.to(u.s).value, (n_binaries,))
+    else:
+        raise ValueError("Either `timesteps` or `t_evol` must be supplied")
+    t_before = None if t_before is None else t_before.to(u.s).value
+
+    # preallocate the outputs, on disk if requested
+    shapes = {"t": (n_binaries, n_step), "ecc": (n_binaries, n_step), "f_orb": (n_binaries, n_step),
+              "n_valid": (n_binaries,)}
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        outputs = {name: np.lib.format.open_memmap(os.path.join(out_dir, "{}.npy".format(name)), mode="w+",
+                                                   dtype=int if name == "n_valid" else float, shape=shape)
+                   for name, shape in shapes.items()}
+    else:
+        outputs = {name: np.zeros(shape, dtype=int if name == "n_valid" else float)
+                   for name, shape in shapes.items()}
+
+    for start in range(0, n_binaries, chunk_size):
+        rows = slice(start, min(start + chunk_size, n_binaries))
+        binaries = _Binaries(m_1[rows], m_2[rows], f_orb_i[rows], ecc_i[rows])
+        n_chunk = len(binaries.beta)
+        t_merge = binaries.t_merge()
+        t_stop = np.full(n_chunk, np.inf) if t_before is None else t_merge - t_before
+
+        if timesteps is None:
+            times = np.maximum(np.minimum(t_evol[rows], t_stop), 0.0)[:, np.newaxis] \
+                * np.linspace(0, 1, n_step)[np.newaxis, :]
+        else:
+            times = np.broadcast_to(timesteps if timesteps.ndim == 1 else timesteps[rows], (n_chunk, n_step))
+        # binaries that are already within `t_before` of their merger are only recorded at the start
+        valid = np.logical_and(times <= t_stop[:, np.newaxis], t_stop[:, np.newaxis] > 0.0)
+        valid[:, 0] = True
+
+        # step every binary through its timesteps together, each inversion starting from the previous one
+        ecc, f_orb = np.full((n_chunk, n_step), np.nan), np.full((n_chunk, n_step), np.nan)
+        index = np.arange(n_chunk)
+        for k in range(n_step):
+            t = times[:, k]
+            inspiral = np.logical_and(valid[:, k], t < t_merge)
+            merged = np.logical_and(valid[:, k], np.logical_not(inspiral))
+            ecc[merged, k], f_orb[merged, k] = 0.0, 1e2
+            if inspiral.any():
+                which = index[inspiral]
+                ecc[which, k], binaries.y[which], a = binaries.state(t[which], which, y_guess=binaries.y[which])
+                f_orb[which, k] = binaries.f_orb(a, which)
+
+        outputs["t"][rows] = np.where(valid, times, np.nan) / (1 * u.yr).to(u.s).value
+        outputs["ecc"][rows] = ecc
+        outputs["f_orb"][rows] = f_orb
+        outputs["n_valid"][rows] = valid.sum(axis=1)
+
+    if out_dir is not None:
+        for output in outputs.values():
+            output.flush()
+    return Evolution(**outputs)
+
+
+def snr_along_trajectory(m_1, m_2, f_orb_i, ecc_i, dist, t_evol=None, n_step=100, timesteps=None,
+                         snr_threshold=None, f_orb_max=None, sc_params={}, gw_lum_tol=0.05,
+                         stat_tol=1e-2, n_step_evolving=100):
+    """Evolve binaries through a series of timesteps, yielding their state and SNR at each one
+
+    The SNR at each timestep is the SNR of an observation starting at that time, calculated in the same way as
+    :meth:`legwork.source.Source.get_snr` would for a source with the current eccentricity and frequency
+    (stationary or evolving depending on how much the frequency changes during the observation).
+
+    Parameters
+    ----------
+    m_1 : `float/array`
+        Primary mass
+
+    m_2 : `float/array`
+        Secondary mass
+
+    f_orb_i : `float/array`
+        Initial orbital frequency
+
+    ecc_i : `float/array`
+        Initial eccentricity
+
+    dist : `float/array`
+        Distance to each binary
+
+    t_evol : `float/array`
+        Length of the evolution of each binary, timesteps are evenly spaced between 0 and ``t_evol``
+        (ignored if ``timesteps`` is supplied)
+
+    n_step : `int`
+        Number of timesteps (ignored if ``timesteps`` is supplied)
+
+    timesteps : `float/array`
+        Times after the start at which to yield the state of every binary, must be increasing
+
+    snr_threshold : `float`
+        Stop tracking a binary once its SNR reaches this value (the timestep at which it does is still yielded)
+
+    f_orb_max : `float`
+        Stop tracking a binary once its orbital frequency reaches this value (the timestep at which it does is
+        still yielded)
+
+    sc_params : `dict`
+        Sensitivity curve parameters, with the same keys as the ``sc_params`` of :class:`legwork.source.Source`
+        (``t_obs`` is the length of the observation that starts at each timestep)
+
+    gw_lum_tol : `float`
+        Allowed error on the GW luminosity when choosing the number of harmonics, as in
+        :class:`legwork.source.Source`
+
+    stat_tol : `float`
+        Fractional change in frequency during the observation above which a binary is evolving
+
+    n_step_evolving : `int`
+        Number of timesteps in the SNR integral of evolving binaries
+
+    Yields
+    ------
+    step : `TrajectoryStep`
+        Indices, times, eccentricities, orbital frequencies and SNRs of the binaries that are still being
+        tracked. Binaries are dropped after they merge, cross ``snr_threshold`` or ``f_orb_max``, or run out
+        of timesteps.
+    """
+    m_1, m_2, f_orb_i, dist = (np.atleast_1d(q) for q in (m_1, m_2, f_orb_i, dist))
+    ecc_i = np.atleast_1d(ecc_i).astype(float)
+    n_binaries = max(len(m_1), len(m_2), len(f_orb_i), len(ecc_i), len(dist))
+    m_1, m_2, f_orb_i, ecc_i, dist = (q if len(q) == n_binaries else np.broadcast_to(q, (n_binaries,))
+                                      for q in (m_1, m_2, f_orb_i, ecc_i, dist))
+    m_c = lw.utils.chirp_mass(m_1, m_2)
+
+    if timesteps is not None:
+        times = np.broadcast_to(np.atleast_1d(timesteps.to(u.s).value)[:, np.newaxis],
+                                (len(np.atleast_1d(timesteps)), n_binaries))
+    elif t_evol is not None:
+        times = np.linspace(0, 1, n_step)[:, np.newaxis] * np.broadcast_to(t_evol.to(u.s).value, (n_binaries,))
+    else:
+        raise ValueError("Either `timesteps` or `t_evol` must be supplied")
+
+    # the noise and the harmonics needed for each eccentricity are the same at every timestep
+    engine = PSDEngine(sc_params)
+    psd, t_obs = engine.interpolator(0), engine.configs[0]["t_obs"]
+    m_c_si, dist_si, t_obs_si = m_c.to(u.kg).value, dist.to(u.m).value, t_obs.to(u.s).value
+    harmonics = lw.source.Source(m_1=[1] * u.Msun, m_2=[1] * u.Msun, f_orb=[1e-3] * u.Hz, ecc=[0.1],
+                                 dist=[1] * u.kpc, gw_lum_tol=gw_lum_tol, interpolate_g=False,
+                                 interpolate_sc=False)
+
+    binaries = _Binaries(m_1, m_2, f_orb_i, ecc_i)
+    t_merge = binaries.t_merge()
+    active = np.arange(n_binaries)
+    for t in times:
+        # drop anything that has merged, from here on every tracked binary is still inspiralling
+        active = active[t[active] < t_merge[active]]
+        if len(active) == 0:
+            return
+        t_now = t[active]
+
+        ecc, binaries.y[active], a = binaries.state(t_now, active, y_guess=binaries.y[active])
+        f_orb = binaries.f_orb(a, active)
+
+        stationary = _stationary(m_c_si[active], f_orb, ecc, t_obs_si, stat_tol)
+        circular = ecc <= harmonics.ecc_tol
+        harmonics_required = np.where(circular, 2, harmonics.harmonics_required(ecc))
+        snr_2 = np.zeros(len(active))
+        for lower, upper in [(0, 2)] + HARMONIC_GROUPS:
+            group = circular if upper == 2 else \
+                np.logical_and.reduce((np.logical_not(circular), harmonics_required > lower,
+                                       harmonics_required <= upper))
+            for stat in (True, False):
+                match = np.logical_and(group, stationary == stat)
+                if not match.any():
+                    continue
+                # circular binaries use the strain for e = 0, where the n = 1 term vanishes
+                group_ecc = np.where(circular[match], 0.0, ecc[match])
+                if stat:
+                    snr_2[match] = _stationary_snr_2(m_c_si[active][match], f_orb[match], group_ecc,
+                                                     dist_si[active][match], t_obs_si, upper, psd)
+                else:
+                    snr_2[match] = _evolving_snr_2(binaries, active[match], m_c[active][match],
+                                                   dist[active][match], binaries.y[active][match],
+                                                   t_now[match], t_obs, n_step_evolving, upper, psd,
+                                                   circular=upper == 2)
+        snr = snr_2**0.5
+
+        yield TrajectoryStep(index=active, t=(t_now * u.s).to(u.yr), ecc=ecc, f_orb=f_orb * u.Hz, snr=snr)
+
+        done = np.zeros(len(active), dtype=bool)
+        if snr_threshold is not None:
+            done |= snr >= snr_threshold
+        if f_orb_max is not None:
+            done |= f_orb >= f_orb_max.to(u.Hz).value
+        active = active[np.logical_not(done)]
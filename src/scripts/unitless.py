@@ -0,0 +1,722 @@
+"""Unit-free fast path for merger times, evolution and SNRs of large arrays of binaries.
+
+LEGWORK takes and returns astropy Quantities, which is convenient for a handful of binaries but for grids of
+10^5-10^7 binaries creating them (``np.repeat(10, N) * u.Msun``), checking their units and converting the results
+(``.to(u.yr).value``) copies every array several times. The functions here instead take plain floats or arrays in
+a fixed set of units
+
+    mass: Msun    frequency: Hz    distance: kpc    time: yr
+
+and return plain arrays in the same units, unless ``units=True`` in which case the units are attached to the
+result. Inputs are broadcast against each other, so a scalar mass or distance can be used with an array of
+frequencies and a grid of frequencies and eccentricities can be passed as ``f_orb[np.newaxis, :]`` and
+``ecc[:, np.newaxis]``, e.g.
+
+    t_merge = get_t_merge_ecc(m_1=10, m_2=10, f_orb_i=f_range[np.newaxis, :], ecc_i=e_range[:, np.newaxis])
+    snr = get_snr(m_1=0.6, m_2=0.6, f_orb=f_orb, dist=8, ecc=ecc)
+
+:func:`get_snr` follows :meth:`legwork.source.Source.get_snr` (the same stationarity criterion and harmonic
+groups) but takes g(n, e) from :mod:`g_table` and interpolates the sensitivity curve with :class:`psd_engine.PSDEngine`,
+so results agree with a Source to about 1e-3. Evolving eccentric binaries are passed to
+:func:`adaptive_snr.snr_ecc_evolving_adaptive`, with units attached to just those binaries.
+:func:`get_snr_durations` gives the SNR for a list of observation times in one pass, e.g. for mission length
+trade studies.
+"""
+import functools
+
+import legwork as lw
+import numpy as np
+import astropy.units as u
+import astropy.constants as const
+import g_table
+from adaptive_snr import _suffix_min_noise, snr_ecc_evolving_adaptive
+from multi_detector import HARMONIC_GROUPS
+from psd_engine import PSDEngine
+from t_merge_table import merger_time_factor
+from trajectory import evolve_binaries
+
+__all__ = ["UNITS", "chirp_mass", "get_a_from_f_orb", "get_t_merge_circ", "get_t_merge_ecc", "evol_circ",
+           "determine_stationarity", "snr_circ_stationary", "snr_ecc_stationary", "snr_circ_evolving",
+           "snr_stationary", "get_snr", "get_snr_durations"]
+
+# canonical unit of each kind of input and output
+UNITS = {"mass": u.Msun, "frequency": u.Hz, "distance": u.kpc, "time": u.yr, "length": u.AU}
+
+G = const.G.si.value
+C = const.c.si.value
+MSUN = const.M_sun.si.value
+KPC = (1 * u.kpc).to(u.m).value
+AU = (1 * u.AU).to(u.m).value
+YR = (1 * u.yr).to(u.s).value
+
+# time before the merger at which evolving binaries are cut off, as in `legwork.snr`
+T_BEFORE_CIRC = 1.0 / YR
+T_BEFORE_ECC = 0.1
+
+# largest number of elements (binaries x harmonics) evaluated at once for stationary eccentric binaries
+MAX_ELEMENTS = 10**7
+
+# PSD engine of each sensitivity curve used so far
+_engines = {}
+
+
+def _broadcast(*args):
+    """Broadcast the inputs against each other without copying them"""
+    arrays = [np.asarray(arg, dtype=float) for arg in args]
+    shape = np.broadcast_shapes(*(a.shape for a in arrays))
+    return shape, [np.broadcast_to(a, shape) for a in arrays]
+
+
+def _attach(value, unit, units):
+    return value * unit if units else value
+
+
+def _beta(m_1, m_2):
+    """Peters (1964) beta in m^4 / s for masses in Msun"""
+    return (64 / 5) * G**3 * MSUN**3 * m_1 * m_2 * (m_1 + m_2) / C**5
+
+
+def chirp_mass(m_1, m_2, units=False):
+    """Chirp mass of binaries in Msun
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    units : `boolean`
+        Whether to return a Quantity
+
+    Returns
+    -------
+    m_c : `float/array`
+        Chirp mass
+    """
+    m_1, m_2 = np.asarray(m_1, dtype=float), np.asarray(m_2, dtype=float)
+    return _attach((m_1 * m_2)**(3/5) / (m_1 + m_2)**(1/5), u.Msun, units)
+
+
+def get_a_from_f_orb(f_orb, m_1, m_2, units=False):
+    """Semi-major axis in AU from the orbital frequency (Kepler's third law)
+
+    Parameters
+    ----------
+    f_orb : `float/array`
+        Orbital frequency in Hz
+
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    units : `boolean`
+        Whether to return a Quantity
+
+    Returns
+    -------
+    a : `float/array`
+        Semi-major axis
+    """
+    a = (G * MSUN * (np.asarray(m_1) + np.asarray(m_2)) / (2 * np.pi * np.asarray(f_orb))**2)**(1/3)
+    return _attach(a / AU, u.AU, units)
+
+
+def get_t_merge_circ(m_1, m_2, f_orb_i, units=False):
+    """Merger time of circular binaries in years, equivalent to :func:`legwork.evol.get_t_merge_circ`
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb_i : `float/array`
+        Initial orbital frequency in Hz
+
+    units : `boolean`
+        Whether to return a Quantity
+
+    Returns
+    -------
+    t_merge : `float/array`
+        Merger time
+    """
+    a_i = get_a_from_f_orb(f_orb_i, m_1, m_2) * AU
+    return _attach(a_i**4 / (4 * _beta(np.asarray(m_1), np.asarray(m_2))) / YR, u.yr, units)
+
+
+def get_t_merge_ecc(m_1, m_2, f_orb_i, ecc_i, small_e_tol=0.15, large_e_tol=1 - 1e-4, exact=True, units=False):
+    """Merger time of eccentric binaries in years, equivalent to :func:`t_merge_table.get_t_merge_ecc`
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb_i : `float/array`
+        Initial orbital frequency in Hz
+
+    ecc_i : `float/array`
+        Initial eccentricity
+
+    small_e_tol, large_e_tol, exact
+        See :func:`t_merge_table.get_t_merge_ecc`
+
+    units : `boolean`
+        Whether to return a Quantity
+
+    Returns
+    -------
+    t_merge : `float/array`
+        Merger time
+    """
+    shape, (m_1, m_2, f_orb_i, ecc_i) = _broadcast(m_1, m_2, f_orb_i, ecc_i)
+    factor = merger_time_factor(ecc_i, small_e_tol=small_e_tol, large_e_tol=large_e_tol, exact=exact)
+    return _attach(get_t_merge_circ(m_1, m_2, f_orb_i) * factor, u.yr, units)
+
+
+def evol_circ(m_1, m_2, f_orb_i, t_evol, n_step=100, units=False):
+    """Orbital frequency of circular binaries at evenly spaced times, equivalent to
+    :func:`legwork.evol.evol_circ` (including the frequency of 100 Hz after a binary merges)
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb_i : `float/array`
+        Initial orbital frequency in Hz
+
+    t_evol : `float/array`
+        Length of the evolution in years
+
+    n_step : `int`
+        Number of timesteps between 0 and ``t_evol``
+
+    units : `boolean`
+        Whether to return a Quantity
+
+    Returns
+    -------
+    f_orb_evol : `float/array`
+        Orbital frequency at each timestep, with shape (\\*broadcast shape of the inputs, n_step)
+    """
+    shape, (m_1, m_2, f_orb_i, t_evol) = _broadcast(m_1, m_2, f_orb_i, t_evol)
+    times = t_evol[..., np.newaxis] * np.linspace(0, 1, n_step)
+    return _attach(_evol_circ_times(m_1, m_2, f_orb_i, times), u.Hz, units)
+
+
+def _evol_circ_times(m_1, m_2, f_orb_i, times):
+    """Orbital frequency of circular binaries at arbitrary times in years (last axis of ``times``)"""
+    a_i_4 = (get_a_from_f_orb(f_orb_i, m_1, m_2) * AU)**4
+    a_4 = a_i_4[..., np.newaxis] - 4 * _beta(m_1, m_2)[..., np.newaxis] * times * YR
+    with np.errstate(invalid="ignore"):
+        f_orb = np.sqrt(G * MSUN * (m_1 + m_2)[..., np.newaxis] / a_4**(3/4)) / (2 * np.pi)
+    return np.where(a_4 > 0.0, f_orb, 1e2)
+
+
+def determine_stationarity(m_1, m_2, f_orb_i, t_evol, ecc_i=0.0, stat_tol=1e-2):
+    """Whether binaries are stationary, with the same criterion as :func:`legwork.evol.determine_stationarity`
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb_i : `float/array`
+        Initial orbital frequency in Hz
+
+    t_evol : `float/array`
+        Length of the observation in years
+
+    ecc_i : `float/array`
+        Initial eccentricity
+
+    stat_tol : `float`
+        Fractional change in frequency above which a binary is evolving
+
+    Returns
+    -------
+    stationary : `bool/array`
+        Mask of the stationary binaries
+    """
+    shape, (m_1, m_2, f_orb_i, t_evol, ecc_i) = _broadcast(m_1, m_2, f_orb_i, t_evol, ecc_i)
+    m_c = chirp_mass(m_1, m_2) * MSUN
+    inner = f_orb_i**(-8/3) - 2**(32/3) * np.pi**(8/3) * t_evol * YR / (5 * C**5) * (G * m_c)**(5/3) \
+        * lw.utils.peters_f(ecc_i)
+    with np.errstate(divide="ignore"):
+        f_orb_f = np.where(inner >= 0.0, np.abs(inner)**(-3/8), 1e9)
+    return (f_orb_f - f_orb_i) / f_orb_i <= stat_tol
+
+
+@functools.lru_cache()
+def _harmonics(gw_lum_tol):
+    """Source that only provides ``harmonics_required`` and ``ecc_tol`` for a given tolerance"""
+    return lw.source.Source(m_1=[1] * u.Msun, m_2=[1] * u.Msun, f_orb=[1e-3] * u.Hz, ecc=[0.1], dist=[1] * u.kpc,
+                            gw_lum_tol=gw_lum_tol, interpolate_g=False, interpolate_sc=False)
+
+
+def _noise(sc_params):
+    """PSD engine for a sensitivity curve, with its unit-free interpolated PSD and observation time in years (the
+    engine is kept for the session so that its table is only built once)"""
+    key = repr(sorted(sc_params.items()))
+    if key not in _engines:
+        engine = PSDEngine(sc_params)
+        _engines[key] = (engine, lambda f: engine.interpolate(f * u.Hz, which_configs=0).value,
+                         engine.configs[0]["t_obs"].to(u.yr).value)
+    return _engines[key]
+
+
+def _groups(ecc, mask, harmonics):
+    """Split the binaries in ``mask`` into the circular ones and each harmonic group of the eccentric ones
+
+    Yields (match, harmonics_required) with ``harmonics_required`` None for circular binaries
+    """
+    circular = ecc <= harmonics.ecc_tol
+    match = np.logical_and(mask, circular)
+    if match.any():
+        yield match, None
+
+    eccentric = np.logical_and(mask, np.logical_not(circular))
+    if eccentric.any():
+        harmonics_required = np.zeros(ecc.shape, dtype=int)
+        harmonics_required[eccentric] = harmonics.harmonics_required(ecc[eccentric])
+        for lower, upper in HARMONIC_GROUPS:
+            match = np.logical_and.reduce((eccentric, harmonics_required > lower, harmonics_required <= upper))
+            if match.any():
+                yield match, upper
+
+
+def _h_c_2_prefactor(m_1, m_2, dist):
+    """Square of the characteristic strain h_c_n divided by f_orb^(-1/3) g(n, e) / (n F(e)), from the prefactor
+    of `legwork.strain.h_c_n`"""
+    m_c = chirp_mass(m_1, m_2) * MSUN
+    return (2**(5/3) / (3 * np.pi**(4/3))) * G**(5/3) / C**3 * m_c**(5/3) / (np.asarray(dist) * KPC)**2
+
+
+def _h_0_2(m_1, m_2, f_orb, dist):
+    """Square of the n-independent part of the strain amplitude h_0_n (divided by g(n, e) / n^2)"""
+    m_c = chirp_mass(m_1, m_2) * MSUN
+    return (2**(28/3) / 5) * G**(10/3) / C**8 * m_c**(10/3) * (np.pi * f_orb)**(4/3) / (dist * KPC)**2
+
+
+def snr_circ_stationary(m_1, m_2, f_orb, dist, sc_params={}):
+    """SNR of stationary circular binaries, equivalent to :func:`legwork.snr.snr_circ_stationary`
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb : `float/array`
+        Orbital frequency in Hz
+
+    dist : `float/array`
+        Distance in kpc
+
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR of each binary
+    """
+    _, psd, t_obs = _noise(sc_params)
+    return _snr_circ_stationary(m_1, m_2, f_orb, dist, t_obs, psd)
+
+
+def _snr_circ_stationary(m_1, m_2, f_orb, dist, t_obs, psd):
+    f_orb = np.asarray(f_orb, dtype=float)
+    return np.sqrt(_h_0_2(m_1, m_2, f_orb, dist) / 4 * t_obs * YR / psd(2 * f_orb))
+
+
+def snr_ecc_stationary(m_1, m_2, f_orb, ecc, dist, harmonics_required, sc_params={}):
+    """SNR of stationary eccentric binaries, equivalent to :func:`legwork.snr.snr_ecc_stationary`
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb : `float/array`
+        Orbital frequency in Hz
+
+    ecc : `float/array`
+        Eccentricity
+
+    dist : `float/array`
+        Distance in kpc
+
+    harmonics_required : `int`
+        Number of harmonics to include
+
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR of each binary
+    """
+    _, psd, t_obs = _noise(sc_params)
+    shape, arrays = _broadcast(m_1, m_2, f_orb, ecc, dist)
+    return _snr_ecc_stationary(*(a.ravel() for a in arrays), harmonics_required, t_obs, psd).reshape(shape)
+
+
+def _snr_ecc_stationary(m_1, m_2, f_orb, ecc, dist, harmonics_required, t_obs, psd):
+    """SNR of 1D arrays of stationary eccentric binaries, in chunks of at most ``MAX_ELEMENTS``"""
+    snr = np.zeros(len(f_orb))
+    n_range = np.arange(1, harmonics_required + 1)[np.newaxis, :]
+    chunk = max(MAX_ELEMENTS // harmonics_required, 1)
+    for start in range(0, len(f_orb), chunk):
+        rows = slice(start, start + chunk)
+        h_0_n_2 = _h_0_2(m_1[rows], m_2[rows], f_orb[rows], dist[rows])[:, np.newaxis] \
+            * g_table.peters_g(n_range, ecc[rows, np.newaxis]) / n_range**2
+        snr[rows] = np.sqrt((h_0_n_2 * t_obs * YR / psd(n_range * f_orb[rows, np.newaxis])).sum(axis=1))
+    return snr
+
+
+def snr_circ_evolving(m_1, m_2, f_orb_i, dist, n_step=100, t_merge=None, sc_params={}):
+    """SNR of evolving circular binaries, equivalent to :func:`legwork.snr.snr_circ_evolving`
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb_i : `float/array`
+        Initial orbital frequency in Hz
+
+    dist : `float/array`
+        Distance in kpc
+
+    n_step : `int`
+        Number of timesteps during the observation
+
+    t_merge : `float/array`
+        Merger time in years (calculated if not supplied)
+
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR of each binary
+    """
+    _, psd, t_obs = _noise(sc_params)
+    return _snr_circ_evolving(m_1, m_2, f_orb_i, dist, n_step, t_merge, t_obs, psd)
+
+
+def _snr_circ_evolving(m_1, m_2, f_orb_i, dist, n_step, t_merge, t_obs, psd):
+    if t_merge is None:
+        t_merge = get_t_merge_circ(m_1, m_2, f_orb_i)
+    t_evol = np.minimum(t_merge - T_BEFORE_CIRC, t_obs)
+    f_orb_evol = evol_circ(m_1, m_2, f_orb_i, t_evol, n_step=n_step)
+
+    # h_c_2^2 = h_c_n^2 for n = 2 and e = 0
+    h_c_2 = _h_c_2_prefactor(m_1, m_2, dist)[..., np.newaxis] * f_orb_evol**(-1/3) / 2
+    f_gw = 2 * f_orb_evol
+    return np.sqrt(np.trapz(y=h_c_2 / (f_gw**2 * psd(f_gw)), x=f_gw, axis=-1))
+
+
+def _snr_stationary(m_1, m_2, f_orb, dist, ecc, harmonics_required, t_obs, psd):
+    """SNR of 1D arrays of stationary binaries that are all circular (``harmonics_required`` is None) or all in
+    the same harmonic group"""
+    if harmonics_required is None:
+        return _snr_circ_stationary(m_1, m_2, f_orb, dist, t_obs, psd)
+    return _snr_ecc_stationary(m_1, m_2, f_orb, ecc, dist, harmonics_required, t_obs, psd)
+
+
+def snr_stationary(m_1, m_2, f_orb, dist, ecc=0.0, sc_params={}, gw_lum_tol=0.05):
+    """SNR of binaries assuming that they are all stationary, with the same harmonic groups as
+    :meth:`legwork.source.Source.get_snr`
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb : `float/array`
+        Orbital frequency in Hz
+
+    dist : `float/array`
+        Distance in kpc
+
+    ecc : `float/array`
+        Eccentricity
+
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    gw_lum_tol : `float`
+        Allowed error on the GW luminosity when choosing the number of harmonics
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR of each binary, with the broadcast shape of the inputs
+    """
+    _, psd, t_obs = _noise(sc_params)
+    shape, (m_1, m_2, f_orb, dist, ecc) = _broadcast(m_1, m_2, f_orb, dist, ecc)
+    snr = np.zeros(shape)
+    for match, upper in _groups(ecc, np.ones(shape, dtype=bool), _harmonics(gw_lum_tol)):
+        snr[match] = _snr_stationary(m_1[match], m_2[match], f_orb[match], dist[match], ecc[match], upper,
+                                     t_obs, psd)
+    return snr
+
+
+def get_snr(m_1, m_2, f_orb, dist, ecc=0.0, sc_params={}, gw_lum_tol=0.05, stat_tol=1e-2, n_step=100,
+            t_merge=None, which_sources=None):
+    """SNR of any binaries, the fast path equivalent of :meth:`legwork.source.Source.get_snr`
+
+    Binaries are split into circular/eccentric and stationary/evolving in the same way as a Source, eccentric
+    binaries use the same harmonic groups and evolving eccentric binaries go through
+    :func:`adaptive_snr.snr_ecc_evolving_adaptive`.
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb : `float/array`
+        Orbital frequency in Hz
+
+    dist : `float/array`
+        Distance in kpc
+
+    ecc : `float/array`
+        Eccentricity
+
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source`
+
+    gw_lum_tol : `float`
+        Allowed error on the GW luminosity when choosing the number of harmonics
+
+    stat_tol : `float`
+        Fractional change in frequency during the observation above which a binary is evolving
+
+    n_step : `int`
+        Number of timesteps in the SNR integral of evolving binaries
+
+    t_merge : `float/array`
+        Merger time in years (calculated for evolving binaries if not supplied)
+
+    which_sources : `bool/array`
+        Mask of the binaries for which to calculate the SNR (the rest are 0)
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR of each binary, with the broadcast shape of the inputs
+    """
+    engine, psd, t_obs = _noise(sc_params)
+    harmonics = _harmonics(gw_lum_tol)
+    shape, (m_1, m_2, f_orb, dist, ecc) = _broadcast(m_1, m_2, f_orb, dist, ecc)
+
+    snr = np.zeros(shape)
+    todo = np.ones(shape, dtype=bool) if which_sources is None else np.broadcast_to(which_sources, shape)
+    stationary = determine_stationarity(m_1, m_2, f_orb, t_obs, ecc, stat_tol=stat_tol)
+    for match, upper in _groups(ecc, np.logical_and(todo, stationary), harmonics):
+        snr[match] = _snr_stationary(m_1[match], m_2[match], f_orb[match], dist[match], ecc[match], upper,
+                                     t_obs, psd)
+
+    for match, upper in _groups(ecc, np.logical_and(todo, np.logical_not(stationary)), harmonics):
+        args = m_1[match], m_2[match], f_orb[match], dist[match]
+        t_merge_match = None if t_merge is None else np.broadcast_to(t_merge, shape)[match]
+        if upper is None:
+            snr[match] = _snr_circ_evolving(*args, n_step, t_merge_match, t_obs, psd)
+            continue
+
+        # the few evolving eccentric binaries get units at this boundary only
+        if t_merge_match is None:
+            t_merge_match = get_t_merge_ecc(*args[:3], ecc[match])
+        snr[match] = snr_ecc_evolving_adaptive(m_1=args[0] * u.Msun, m_2=args[1] * u.Msun, f_orb_i=args[2] * u.Hz,
+                                               ecc=ecc[match], dist=args[3] * u.kpc, harmonics_required=upper,
+                                               t_obs=t_obs * u.yr, n_step=n_step, t_merge=t_merge_match * u.yr,
+                                               interpolated_sc=engine.interpolator(0))
+    return snr
+
+
+def _duration_noise(sc_params, t_obs):
+    """Unit-free interpolated PSD of a sensitivity curve for each observation time (in years), which only differ
+    in their confusion noise so they share one engine"""
+    key = repr((sorted(sc_params.items()), tuple(t_obs)))
+    if key not in _engines:
+        engine = PSDEngine([dict(sc_params, t_obs=t * u.yr) for t in t_obs])
+        _engines[key] = [functools.partial(lambda f, k: engine.interpolate(f * u.Hz, which_configs=k).value, k=k)
+                         for k in range(len(t_obs))]
+    return _engines[key]
+
+
+def _n_range(harmonics_required):
+    """Harmonics of a group, only n = 2 for circular binaries (``harmonics_required`` is None)"""
+    return np.array([2]) if harmonics_required is None else np.arange(1, harmonics_required + 1)
+
+
+def _snr_2_stationary_durations(m_1, m_2, f_orb, ecc, dist, harmonics_required, t_obs, psds):
+    """SNR^2 of 1D arrays of stationary binaries for each observation time, the strain of each harmonic is only
+    calculated once"""
+    snr_2 = np.zeros((len(f_orb), len(t_obs)))
+    n_range = _n_range(harmonics_required)[np.newaxis, :]
+    chunk = max(MAX_ELEMENTS // n_range.size, 1)
+    for start in range(0, len(f_orb), chunk):
+        rows = slice(start, start + chunk)
+        g = 1.0 if harmonics_required is None else g_table.peters_g(n_range, ecc[rows, np.newaxis])
+        h_0_n_2 = _h_0_2(m_1[rows], m_2[rows], f_orb[rows], dist[rows])[:, np.newaxis] * g / n_range**2
+        f_n = n_range * f_orb[rows, np.newaxis]
+        for k, (t, psd) in enumerate(zip(t_obs, psds)):
+            snr_2[rows, k] = (h_0_n_2 * t * YR / psd(f_n)).sum(axis=1)
+    return snr_2
+
+
+def _snr_2_evolving_durations(m_1, m_2, f_orb_i, ecc, dist, harmonics_required, t_obs, psds, n_step, rtol=1e-4,
+                              block_size=10):
+    """SNR^2 of 1D arrays of evolving binaries for each observation time, integrating each binary once over the
+    longest observation
+
+    Each binary has ``n_step`` evenly spaced timesteps over the longest observation (cut off ``T_BEFORE_*``
+    before its merger), with the shorter observation times inserted, so for a single observation time the
+    timesteps are the same as in :func:`legwork.snr.snr_ecc_evolving`. Harmonics of eccentric binaries are added
+    in blocks until the bound on the rest (as in :func:`adaptive_snr.snr_ecc_evolving_adaptive`) is below
+    ``rtol`` of the SNR^2 of the shortest observation.
+    """
+    circular = harmonics_required is None
+    if circular:
+        t_stop = get_t_merge_circ(m_1, m_2, f_orb_i) - T_BEFORE_CIRC
+    else:
+        t_stop = get_t_merge_ecc(m_1, m_2, f_orb_i, ecc) - T_BEFORE_ECC
+    t_stop = np.maximum(t_stop, 0.0)[:, np.newaxis]
+
+    # index of each observation time in the timesteps of each binary (the last is always the last timestep)
+    base = np.minimum(t_obs[-1], t_stop) * np.linspace(0, 1, n_step)
+    inserted = np.minimum(t_obs[:-1], t_stop)
+    times = np.sort(np.concatenate((base, inserted), axis=1), axis=1)
+    checkpoints = np.concatenate(((base[:, np.newaxis, :] < inserted[..., np.newaxis]).sum(axis=-1)
+                                  + np.arange(len(t_obs) - 1),
+                                  np.full((len(f_orb_i), 1), times.shape[1] - 1)), axis=1)
+    steps = np.arange(times.shape[1])
+
+    n_range = _n_range(harmonics_required)
+    block_size = len(n_range) if circular else block_size
+    snr_2 = np.zeros((len(f_orb_i), len(t_obs)))
+    chunk = max(MAX_ELEMENTS // (times.shape[1] * block_size), 1)
+    for start in range(0, len(f_orb_i), chunk):
+        rows = np.arange(start, min(start + chunk, len(f_orb_i)))
+        if circular:
+            f_orb = _evol_circ_times(m_1[rows], m_2[rows], f_orb_i[rows], times[rows])
+        else:
+            evolution = evolve_binaries(m_1[rows] * u.Msun, m_2[rows] * u.Msun, f_orb_i[rows] * u.Hz, ecc[rows],
+                                        timesteps=times[rows] * u.yr)
+            f_orb, e = evolution.f_orb, evolution.ecc
+
+        # h_c_n^2 = A f_orb^(-1/3) g(n, e) / (n F(e)), which is A f_orb^(-1/3) / 2 for circular binaries
+        amplitude = _h_c_2_prefactor(m_1[rows], m_2[rows], dist[rows])[:, np.newaxis] * f_orb**(-1/3)
+        f_e = 1.0 if circular else lw.utils.peters_f(e)
+        if not circular:
+            min_noise = _suffix_min_noise(lambda f: np.min([psd(f) for psd in psds], axis=0), f_orb.min(),
+                                          harmonics_required * f_orb.max())
+            g_sum = np.zeros(f_orb.shape)
+
+        active = np.arange(len(rows))
+        for lower_n in range(0, len(n_range), block_size):
+            harms = n_range[lower_n:lower_n + block_size]
+            g = 1.0 if circular else g_table.peters_g(harms, e[active, :, np.newaxis])
+            f_n = harms * f_orb[active, :, np.newaxis]
+            h_c_n_2 = (amplitude[active] / (f_e if circular else f_e[active]))[..., np.newaxis] * g / harms
+
+            # the same trajectory is integrated up to each observation time against the noise of that
+            # observation, which is only evaluated at the timesteps before it
+            h_c_n_2 = h_c_n_2 / f_n**2
+            df_n = np.diff(f_n, axis=1)
+            for k, psd in enumerate(psds):
+                before = steps[np.newaxis, :] <= checkpoints[rows[active], k, np.newaxis]
+                integrand = np.zeros(f_n.shape)
+                integrand[before] = h_c_n_2[before] / psd(f_n[before])
+                area = (integrand[:, 1:] + integrand[:, :-1]) / 2 * df_n
+                snr_2[rows[active], k] += (area * before[:, 1:, np.newaxis]).sum(axis=(1, 2))
+            if circular or harms[-1] == n_range[-1]:
+                break
+
+            # bound the SNR^2 of every harmonic above this block using the GW power that is left
+            g_sum[active] += g.sum(axis=-1)
+            remaining = np.maximum(1 - g_sum[active] / f_e[active], 0.0)
+            bound = np.trapz(y=amplitude[active] * remaining / min_noise((harms[-1] + 1) * f_orb[active]),
+                             x=f_orb[active], axis=1)
+            active = active[bound > rtol * snr_2[rows[active], 0]]
+            if len(active) == 0:
+                break
+    return snr_2
+
+
+def get_snr_durations(m_1, m_2, f_orb, dist, t_obs, ecc=0.0, sc_params={}, gw_lum_tol=0.05, stat_tol=1e-2,
+                      n_step=100):
+    """SNR of any binaries for several observation times at once, e.g. for trade studies of the mission length
+
+    This is the SNR that :func:`get_snr` gives with each observation time (and the confusion noise of that
+    observation time), but the strain of each harmonic of a stationary binary is only calculated once and each
+    evolving binary is evolved and integrated once over the longest observation, with the shorter observation
+    times inserted into its timesteps and the SNR^2 accumulated up to each of them along the way. The cost is
+    therefore close to that of one :func:`get_snr` over the longest observation, only the noise is evaluated for
+    each observation time. Whether a binary is stationary is decided separately for each observation time, as
+    :meth:`legwork.source.Source.get_snr` would.
+
+    With a single observation time the timesteps are the same as in :func:`get_snr`. Eccentric binaries that
+    merge during the observation still differ by up to about 1 / ``n_step``, since
+    :func:`legwork.evol.evol_ecc` replaces the last timestep (``T_BEFORE_ECC`` before the merger) with the one
+    before it, so :func:`get_snr` leaves out the final step of the integral while this includes it.
+
+    Parameters
+    ----------
+    m_1, m_2 : `float/array`
+        Primary and secondary mass in Msun
+
+    f_orb : `float/array`
+        Orbital frequency in Hz (at the start of every observation)
+
+    dist : `float/array`
+        Distance in kpc
+
+    t_obs : `float/array`
+        Increasing observation times in years
+
+    ecc : `float/array`
+        Eccentricity
+
+    sc_params : `dict`
+        Sensitivity curve parameters, as for :class:`legwork.source.Source` (any ``t_obs`` is replaced by each
+        of the observation times)
+
+    gw_lum_tol : `float`
+        Allowed error on the GW luminosity when choosing the number of harmonics
+
+    stat_tol : `float`
+        Fractional change in frequency during the observation above which a binary is evolving
+
+    n_step : `int`
+        Number of timesteps over the longest observation for evolving binaries (the shorter observation times
+        are added to them)
+
+    Returns
+    -------
+    snr : `float/array`
+        SNR of each binary for each observation time, with shape (\\*broadcast shape of the inputs, len(t_obs))
+    """
+    t_obs = np.atleast_1d(np.asarray(t_obs, dtype=float))
+    if np.any(np.diff(t_obs) <= 0) or t_obs[0] <= 0:
+        raise ValueError("t_obs: observation times must be positive and increasing")
+    psds = _duration_noise({key: value for key, value in sc_params.items() if key != "t_obs"}, t_obs)
+    harmonics = _harmonics(gw_lum_tol)
+    shape, (m_1, m_2, f_orb, dist, ecc) = _broadcast(m_1, m_2, f_orb, dist, ecc)
+
+    # binaries that are stationary for the longest observation are stationary for all of them
+    stationary = np.stack([determine_stationarity(m_1, m_2, f_orb, t, ecc, stat_tol=stat_tol) for t in t_obs],
+                          axis=-1)
+    snr_2 = np.zeros((*shape, len(t_obs)))
+    for match, upper in _groups(ecc, stationary[..., 0], harmonics):
+        snr_2[match] = _snr_2_stationary_durations(m_1[match], m_2[match], f_orb[match], ecc[match], dist[match],
+                                                   upper, t_obs, psds)
+    for match, upper in _groups(ecc, np.logical_not(stationary[..., -1]), harmonics):
+        evolving = _snr_2_evolving_durations(m_1[match], m_2[match], f_orb[match], ecc[match], dist[match], upper,
+                                             t_obs, psds, n_step)
+        snr_2[match] = np.where(stationary[match], snr_2[match], evolving)
+    return np.sqrt(snr_2)
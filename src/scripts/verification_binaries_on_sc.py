@@ -3,6 +3,9 @@ import numpy as np
 import astropy.units as u
 import matplotlib.pyplot as plt
 import paths
+import fidelity
+import profiling  # noqa: F401 (times the stages of this script when LEGWORK_PROFILE is set)
+import rendering
 
 from astropy.visualization import quantity_support
 quantity_support()
@@ -27,7 +30,8 @@ plt.rcParams.update(params)
 vbs = lw.source.VerificationBinaries()
 vbs.snr = np.array(vbs.true_snr)
 
-fig, ax = lw.visualisation.plot_sensitivity_curve(frequency_range=np.logspace(-4, 0, 1000) * u.Hz, show=False)
+frequency_range = np.logspace(-4, 0, fidelity.scale(1000)) * u.Hz
+fig, ax = lw.visualisation.plot_sensitivity_curve(frequency_range=frequency_range, show=False)
 fig, ax = vbs.plot_sources_on_sc(scatter_s=100, marker="*", snr_cutoff=7, c=vbs.m_1[vbs.snr > 7].to(u.Msun),
                                  fig=fig, ax=ax, show=False, cmap="Oranges", vmin=0.0, vmax=1.0)
 
@@ -36,6 +40,7 @@ cbar.set_label(r"Primary Mass, $m_1 \, [{\rm M_{\odot}}]$")
 
 ax.legend(handles=[ax.get_children()[1]], labels=["LISA Verification Binaries (Kupfer+18)"], fontsize=0.7*fs, markerscale=2)
 
-ax.set_rasterization_zorder(10000)
+fidelity.mark(fig)
 
-plt.savefig(paths.figures / "verification_binaries_on_sc.pdf", format="pdf", bbox_inches="tight")
\ No newline at end of file
+rendering.save(fig, paths.figures / "verification_binaries_on_sc.pdf", format="pdf", bbox_inches="tight",
+               metadata=fidelity.metadata())
\ No newline at end of file